@@ -0,0 +1,155 @@
+#
+# Part of `python-smartcash`
+#
+# Deterministic synthetic SmartCash chain for benchmarks. Any height
+# can be generated on its own from the seed.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import json
+import random
+import hashlib
+from smartcash.schedule import FIRST_REWARD_HEIGHT, getExpectedPayout, isRewardHeight
+from smartcash.util import COIN, getBlockRewardSatoshis
+
+GENESIS_TIME = 1500000000
+BLOCK_TIME = 55
+
+class SyntheticChain(object):
+
+    def __init__(self, start = FIRST_REWARD_HEIGHT, stop = FIRST_REWARD_HEIGHT + 10000, seed = 1,
+                 missingTxRate = 0.001, unresolvedRate = 0.002, extraTxs = 2):
+
+        self.start = start
+        self.stop = stop
+        self.seed = seed
+        self.missingTxRate = missingTxRate
+        self.unresolvedRate = unresolvedRate
+        self.extraTxs = extraTxs
+
+    def tip(self):
+        return self.stop - 1
+
+    def random(self, height):
+        return random.Random(self.seed * 1000003 + height)
+
+    def hash(self, kind, height, index = 0):
+        data = '{}-{}-{}-{}'.format(self.seed, kind, height, index).encode('utf8')
+        return hashlib.sha256(data).hexdigest()
+
+    # Block and tx hashes start with the hex encoded height/index to
+    # allow the mock daemon to look them up.
+    def blockHash(self, height):
+        return '{:08x}'.format(height) + self.hash('block', height)[8:]
+
+    def txHash(self, height, index):
+        return '{:08x}{:04x}'.format(height, index) + self.hash('tx', height, index)[12:]
+
+    def parseBlockHash(self, blockHash):
+        return int(blockHash[:8], 16)
+
+    def parseTxHash(self, txHash):
+        return int(txHash[:8], 16), int(txHash[8:12], 16)
+
+    def blockTime(self, height):
+        return GENESIS_TIME + height * BLOCK_TIME
+
+    def contains(self, height):
+        return self.start <= height < self.stop
+
+    def hasTransactions(self, height):
+        return self.random(height).random() >= self.missingTxRate
+
+    def isResolvable(self, height):
+        rnd = self.random(height)
+        rnd.random()
+        return rnd.random() >= self.unresolvedRate
+
+    def payees(self, height):
+
+        expectedPayees = getExpectedPayout(height)[0]
+
+        return ['S' + self.hash('payee', height, i)[:33] for i in range(expectedPayees)]
+
+    def block(self, height):
+
+        block = {'hash': self.blockHash(height),
+                 'height': height,
+                 'confirmations': self.tip() - height + 1,
+                 'time': self.blockTime(height),
+                 'previousblockhash': self.blockHash(height - 1)}
+
+        if height < self.tip():
+            block['nextblockhash'] = self.blockHash(height + 1)
+
+        if self.hasTransactions(height):
+            block['tx'] = [self.txHash(height, i) for i in range(1 + self.extraTxs)]
+
+        return block
+
+    def transaction(self, height, index):
+
+        txid = self.txHash(height, index)
+        txtime = self.blockTime(height)
+
+        if index:
+            return {'txid': txid,
+                    'time': txtime,
+                    'vin': [{'txid': self.txHash(height - 1, index), 'vout': 0}],
+                    'vout': [{'value': 1.0 + index, 'n': 0,
+                              'scriptPubKey': {'addresses': ['S' + self.hash('addr', height, index)[:33]]}}]}
+
+        vout = [{'value': getBlockRewardSatoshis(height) // 2 / float(COIN), 'n': 0,
+                 'scriptPubKey': {'addresses': ['S' + self.hash('miner', height)[:33]]}}]
+
+        if isRewardHeight(height):
+
+            payout = getExpectedPayout(height)[1]
+
+            # Unresolvable heights pay way below the expected amount
+            if not self.isResolvable(height):
+                payout //= 2
+
+            for payee in self.payees(height):
+                vout.append({'value': payout / float(COIN), 'n': len(vout),
+                             'scriptPubKey': {'addresses': [payee]}})
+
+        return {'txid': txid,
+                'time': txtime,
+                'vin': [{'coinbase': self.hash('coinbase', height)[:16]}],
+                'vout': vout}
+
+    # The expected rewards row of a height, like SNRewardList.run creates it.
+    def reward(self, height):
+
+        hashes = (self.blockHash(height), self.blockHash(height - 1))
+
+        if not self.hasTransactions(height):
+            return (height, 0, 'error', getBlockRewardSatoshis(height), 0, -1, 1) + hashes
+
+        if not isRewardHeight(height):
+            return (height, 0, 'NoRewardBlock', getBlockRewardSatoshis(height), 0, -3, 1) + hashes
+
+        if not self.isResolvable(height):
+            return (height, 0, 'error', getBlockRewardSatoshis(height), 0, -2, 1) + hashes
+
+        return (height, self.blockTime(height), json.dumps(self.payees(height)),
+                getExpectedPayout(height)[1], 0, 0, 1) + hashes
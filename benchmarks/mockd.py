@@ -0,0 +1,195 @@
+#
+# Part of `python-smartcash`
+#
+# Mock smartcashd JSON-RPC server which serves a SyntheticChain
+# with a configurable latency per request.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+try:
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    import SocketServer as socketserver
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from benchmarks.chain import SyntheticChain
+
+logger = logging.getLogger("benchmarks.mockd")
+
+class MockError(Exception):
+
+    def __init__(self, code, message):
+        super(MockError, self).__init__(message)
+        self.code = code
+        self.message = message
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # Concurrent clients, the default backlog of 5 drops connections.
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+
+        # Clients which went away, e.g. cancelled requests
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+
+        HTTPServer.handle_error(self, request, client_address)
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    # Keep-alive like the daemon, headers and body are separate writes
+    # which would wait for delayed ACKs with Nagle enabled.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+
+        daemon = self.server.mock
+
+        if daemon.latency:
+            time.sleep(daemon.latency)
+
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf8'))
+
+        if isinstance(body, list):
+            response = [daemon.call(x) for x in body]
+        else:
+            response = daemon.call(body)
+
+        data = json.dumps(response).encode('utf8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class MockDaemon(object):
+
+    def __init__(self, chain, port = 0, latency = 0.0, host = '127.0.0.1'):
+
+        self.chain = chain
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer((host, port), MockHandler)
+        self.server.mock = self
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    def start(self):
+
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def call(self, request):
+
+        with self.lock:
+            self.requests += 1
+
+        id = request.get('id')
+
+        try:
+            result = self.handle(request.get('method'), request.get('params') or [])
+        except MockError as e:
+            return {'result': None, 'error': {'code': e.code, 'message': e.message}, 'id': id}
+
+        return {'result': result, 'error': None, 'id': id}
+
+    def checkHeight(self, height):
+
+        if not isinstance(height, int) or not self.chain.contains(height):
+            raise MockError(-8, 'Block height out of range')
+
+        return height
+
+    def handle(self, method, params):
+
+        chain = self.chain
+
+        if method == 'getinfo':
+            return {'blocks': chain.tip(), 'version': 1020800, 'connections': 8}
+
+        if method == 'getblockcount':
+            return chain.tip()
+
+        if method == 'getblockhash':
+            return chain.blockHash(self.checkHeight(params[0]))
+
+        if method == 'getblock':
+            height = chain.parseBlockHash(params[0])
+            self.checkHeight(height)
+            return chain.block(height)
+
+        if method == 'getrawtransaction':
+
+            height, index = chain.parseTxHash(params[0])
+
+            if not chain.contains(height) or index > chain.extraTxs or not chain.hasTransactions(height):
+                raise MockError(-5, 'No information available about transaction')
+
+            return chain.transaction(height, index)
+
+        raise MockError(-32601, 'Method not found')
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Mock smartcashd serving a synthetic chain.')
+    parser.add_argument('--port', type=int, default=9679)
+    parser.add_argument('--start', type=int, default=300000)
+    parser.add_argument('--stop', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds per request')
+
+    args = parser.parse_args(argv)
+
+    chain = SyntheticChain(args.start, args.stop, args.seed)
+    daemon = MockDaemon(chain, args.port, args.latency).start()
+
+    sys.stdout.write("Serving {} - {} on 127.0.0.1:{}\n".format(args.start, args.stop, daemon.port))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        daemon.stop()
+
+if __name__ == '__main__':
+    main()
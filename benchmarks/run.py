@@ -0,0 +1,381 @@
+#
+# Part of `python-smartcash`
+#
+# Benchmark runner, writes the results as JSON for regression tracking.
+#
+#     python -m benchmarks.run --output results.json
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+import resource
+import tracemalloc
+import subprocess
+import sqlite3 as sql
+
+from benchmarks.chain import SyntheticChain
+from benchmarks.mockd import MockDaemon
+from smartcash import rollups, checkpoint
+from smartcash.export import columns
+from smartcash.rpc import SmartCashRPC, RPCConfig
+from smartcash.rewardlist import SNRewardList, SNRewardDatabase, SNReward
+
+logger = logging.getLogger("benchmarks.run")
+
+# Crosses the multinode payments hardfork at 545005
+SYNC_START = 544000
+
+def summarize(samples):
+
+    samples = sorted(samples)
+    count = len(samples)
+
+    def percentile(p):
+        return samples[min(count - 1, int(p * count))] * 1000.0
+
+    return {'iterations': count,
+            'meanMs': sum(samples) / count * 1000.0,
+            'minMs': samples[0] * 1000.0,
+            'p50Ms': percentile(0.5),
+            'p90Ms': percentile(0.9),
+            'p99Ms': percentile(0.99),
+            'maxMs': samples[-1] * 1000.0}
+
+def measure(function, iterations):
+
+    samples = []
+
+    for i in range(iterations):
+        start = time.time()
+        function(i)
+        samples.append(time.time() - start)
+
+    return summarize(samples)
+
+def rpcConfig(daemon):
+    return RPCConfig('bench', 'bench', port=daemon.port)
+
+def maxRss():
+    # Kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# Sync `blocks` heights from SYNC_START with SNRewardList against the mock daemon.
+def sync(workdir, blocks, latency, start = SYNC_START):
+
+    chain = SyntheticChain(start, start + blocks + 3)
+    daemon = MockDaemon(chain, latency=latency).start()
+
+    path = os.path.join(workdir, 'sync-{}.db'.format(blocks))
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    rewardList = SNRewardList(path, rpcConfig(daemon))
+
+    # Let the scanner resume at `start`
+    rewardList.addReward(SNReward(block=start - 1, txtime=0, payee="NoRewardBlock", meta=-3, verified=1))
+
+    began = time.time()
+    rewardList.start()
+
+    while rewardList.currentHeight is None or rewardList.currentHeight < start + blocks:
+        time.sleep(0.01)
+
+    elapsed = time.time() - began
+
+    rewardList.stop()
+    rewardList.join(30)
+    daemon.stop()
+
+    mismatches = 0
+
+    for height in range(start, start + blocks):
+
+        reward = rewardList.getReward(height)
+        row = tuple(getattr(reward, x) for x in columns) if reward else None
+
+        if row != chain.reward(height):
+            mismatches += 1
+
+    return {'blocks': blocks,
+            'latencyMs': latency * 1000.0,
+            'seconds': elapsed,
+            'blocksPerSecond': blocks / elapsed,
+            'rpcRequests': daemon.requests,
+            'mismatches': mismatches,
+            'stages': rewardList.getStats()['stages']}
+
+def benchSync(workdir, blocks, latency):
+    return sync(workdir, blocks, latency)
+
+def benchMemory(workdir, blocks):
+
+    tracemalloc.start()
+
+    try:
+        result = sync(workdir, blocks, 0.0)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'blocks': blocks,
+            'tracedPeakBytes': peak,
+            'tracedPeakBytesPerBlock': peak / float(blocks),
+            'maxRssBytes': maxRss()}
+
+# Create (or reuse) a rewards database with `rows` synthetic rows.
+def populate(workdir, rows, start = 300000):
+
+    path = os.path.join(workdir, 'query-{}.db'.format(rows))
+
+    if os.path.exists(path):
+
+        connection = sql.connect(path)
+        count = connection.execute("SELECT count(*) FROM rewards").fetchone()[0]
+        connection.close()
+
+        if count == rows:
+            return path
+
+        os.remove(path)
+
+    SNRewardDatabase(path)
+
+    chain = SyntheticChain(start, start + rows)
+    connection = sql.connect(path)
+    connection.row_factory = sql.Row
+    chunk = 100000
+
+    for lower in range(start, start + rows, chunk):
+        connection.executemany("INSERT INTO rewards({}) VALUES({})".format(', '.join(columns), ', '.join('?' for _ in columns)),
+                               [chain.reward(h) for h in range(lower, min(lower + chunk, start + rows))])
+        connection.commit()
+
+    rollups.rebuild(connection.cursor())
+    checkpoint.rebuild(connection.cursor())
+    connection.commit()
+    connection.close()
+
+    return path
+
+def queryTimings(rewardList, chain, rows, iterations, start):
+
+    rnd = random.Random(rows)
+
+    heights = [rnd.randrange(start, start + rows) for _ in range(iterations)]
+    times = [chain.blockTime(h) for h in heights]
+    payees = [chain.payees(h)[0] for h in heights]
+
+    scans = max(1, iterations // 200)
+
+    results = {}
+
+    results['getReward'] = measure(lambda i: rewardList.getReward(heights[i]), iterations)
+    results['getLastReward'] = measure(lambda i: rewardList.getLastReward(), iterations)
+    results['getNextReward'] = measure(lambda i: rewardList.getNextReward(times[i]), iterations)
+    results['getRewardCount'] = measure(lambda i: rewardList.getRewardCount(start=times[i]), iterations)
+    results['getRewardStats'] = measure(lambda i: rewardList.getRewardStats(times[i], times[i] + 30 * 86400, meta=0), iterations)
+    results['getRewardsForPayee'] = measure(lambda i: rewardList.getRewardsForPayee(payees[i]), scans)
+    results['getRewardsForPayees'] = measure(lambda i: rewardList.getRewardsForPayees(payees[:100], heights[i]), scans)
+
+    return results
+
+# The cold numbers run without query cache and measure the database. The
+# warm ones repeat the same lookups after a first pass filled the cache,
+# cacheHits/cacheMisses are the lookups of the measured pass.
+def benchQueries(workdir, rows, iterations, start = 300000):
+
+    began = time.time()
+    path = populate(workdir, rows, start)
+    populated = time.time() - began
+
+    chain = SyntheticChain(start, start + rows)
+
+    results = {'rows': rows, 'populateSeconds': populated}
+
+    results['cold'] = queryTimings(SNRewardList(path, RPCConfig('bench', 'bench'), cacheSize=0), chain, rows, iterations, start)
+
+    rewardList = SNRewardList(path, RPCConfig('bench', 'bench'))
+    queryTimings(rewardList, chain, rows, iterations, start)
+    before = rewardList.cache.stats()
+
+    results['warm'] = queryTimings(rewardList, chain, rows, iterations, start)
+
+    after = rewardList.cache.stats()
+
+    results['cacheHits'] = after['hits'] - before['hits']
+    results['cacheMisses'] = after['misses'] - before['misses']
+
+    return results
+
+# Optional dependencies which should not be loaded by a plain import.
+HEAVY_MODULES = ['sqlalchemy', 'numpy', 'pyarrow']
+
+# Runs in a fresh interpreter to measure cold imports and the startup up to
+# the point where SNRewardList.run knows where to resume.
+startupScript = '''
+import sys, time, json
+began = time.time()
+from smartcash.rewardlist import SNRewardList
+from smartcash.rpc import RPCConfig
+imported = time.time()
+result = {{'importMs': (imported - began) * 1000.0,
+           'heavyModules': [x for x in {heavy} if x in sys.modules]}}
+if len(sys.argv) > 1:
+    rewardList = SNRewardList(sys.argv[1], RPCConfig('bench', 'bench'))
+    opened = time.time()
+    rewardList.getCheckpoint()
+    result['openMs'] = (opened - imported) * 1000.0
+    result['resumeMs'] = (time.time() - opened) * 1000.0
+    result['startupMs'] = (time.time() - began) * 1000.0
+sys.stdout.write(json.dumps(result))
+'''.format(heavy=HEAVY_MODULES)
+
+def startup(path = None):
+
+    directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    command = [sys.executable, '-c', startupScript] + ([path] if path else [])
+
+    return json.loads(subprocess.check_output(command, cwd=directory).decode('utf8'))
+
+def benchStartup(workdir, rows, iterations):
+
+    path = populate(workdir, rows)
+
+    results = {'rows': rows, 'heavyModules': startup()['heavyModules']}
+
+    imports = [startup()['importMs'] / 1000.0 for _ in range(iterations)]
+    runs = [startup(path) for _ in range(iterations)]
+
+    results['import'] = summarize(imports)
+    results['open'] = summarize([x['openMs'] / 1000.0 for x in runs])
+    results['resume'] = summarize([x['resumeMs'] / 1000.0 for x in runs])
+    results['startup'] = summarize([x['startupMs'] / 1000.0 for x in runs])
+
+    return results
+
+def benchRpc(calls, batchSize):
+
+    chain = SyntheticChain(300000, 300000 + calls + 3)
+    daemon = MockDaemon(chain).start()
+    rpc = SmartCashRPC(rpcConfig(daemon))
+
+    results = {'calls': calls}
+
+    results['getBlockHash'] = measure(lambda i: rpc.raw('getblockhash', [300000 + i]), calls)
+    results['getBlockByNumber'] = measure(lambda i: rpc.getBlockByNumber(300000 + i), calls)
+    results['getRawTransaction'] = measure(lambda i: rpc.getRawTransaction(chain.txHash(300000 + i, 0)), calls)
+
+    batches = max(1, calls // batchSize)
+    batch = measure(lambda i: rpc.batch([('getblockhash', [300000 + i * batchSize + x]) for x in range(batchSize)]), batches)
+    batch['batchSize'] = batchSize
+    batch['perCallMs'] = batch['meanMs'] / batchSize
+    results['batchGetBlockHash'] = batch
+
+    daemon.stop()
+
+    return results
+
+def gitRevision():
+
+    try:
+        directory = os.path.dirname(os.path.realpath(__file__))
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=directory).decode('utf8').strip()
+    except Exception:
+        return None
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Run the python-smartcash benchmarks.')
+    parser.add_argument('--output', default=None, help='Write the JSON results to this file')
+    parser.add_argument('--only', default='sync,query,rpc,memory,startup', help='Comma separated benchmarks to run')
+    parser.add_argument('--workdir', default=None, help='Directory for the databases, reused between runs')
+    parser.add_argument('--rows', default='1000000,10000000', help='Comma separated row counts of the query benchmark')
+    parser.add_argument('--iterations', type=int, default=1000, help='Iterations per query')
+    parser.add_argument('--sync-blocks', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Mock daemon latency in seconds')
+    parser.add_argument('--rpc-calls', type=int, default=2000)
+    parser.add_argument('--rpc-batch', type=int, default=100)
+    parser.add_argument('--memory-blocks', type=int, default=1000)
+    parser.add_argument('--startup-rows', type=int, default=1000000)
+    parser.add_argument('--startup-iterations', type=int, default=10)
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.WARNING)
+
+    only = set(args.only.split(','))
+    workdir = args.workdir or tempfile.mkdtemp(prefix='smartcash-bench-')
+
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+
+    results = {'created': int(time.time()),
+               'revision': gitRevision(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'benchmarks': {}}
+
+    benchmarks = results['benchmarks']
+
+    try:
+
+        if 'sync' in only:
+            benchmarks['sync'] = benchSync(workdir, args.sync_blocks, args.latency)
+
+        if 'query' in only:
+            benchmarks['query'] = [benchQueries(workdir, int(x), args.iterations) for x in args.rows.split(',')]
+
+        if 'rpc' in only:
+            benchmarks['rpc'] = benchRpc(args.rpc_calls, args.rpc_batch)
+
+        if 'memory' in only:
+            benchmarks['memory'] = benchMemory(workdir, args.memory_blocks)
+
+        if 'startup' in only:
+            benchmarks['startup'] = benchStartup(workdir, args.startup_rows, args.startup_iterations)
+
+    finally:
+
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -45,7 +45,13 @@ setup(
     maintainer_email='<xdustinfacex@gmail.com>',
     url='https://github.com/xdustinface/python-smartcash',
     packages=['smartcash'],
-    install_requires=['sqlalchemy==1.2.5', 'requests==2.18.4'],
+    install_requires=['requests==2.18.4'],
+    extras_require={
+        'numpy': ['numpy'],
+        'sqlalchemy': ['sqlalchemy'],
+        'server': ['msgpack'],
+        'export': ['numpy', 'pyarrow'],
+    },
     zip_safe=False,
     classifiers=[
         'Development Status :: 3 - Alpha',
@@ -0,0 +1,410 @@
+#
+# Part of `python-smartcash`
+#
+# asyncio variant of the SNRewardList sync. Same database, queries and
+# callbacks, but the blocks of a window get fetched concurrently, pause,
+# resume and stop are events instead of sleep polls and the database writes
+# run in an executor. Several indexers can share one event loop.
+#
+#     async def main():
+#         rewardList = AsyncSNRewardList('rewards.db', rpcConfig, rewardCB=onReward)
+#         rewardList.start()
+#         ...
+#         await rewardList.close()
+#
+# Python 3.5 or newer.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from smartcash.rewardlist import (SNRewardList, presetReward, checkTransaction, emptyReward, setBlockHashes,
+                                  hasBlockHash, forkStep)
+from smartcash.stats import SyncStats, STAGE_RPC, STAGE_PAUSED, STAGE_SLEEP
+from smartcash.asyncrpc import AsyncSmartCashRPC
+
+logger = logging.getLogger("smartcash.asyncrewardlist")
+
+# asyncio.get_running_loop is new in Python 3.7
+def runningLoop():
+
+    if hasattr(asyncio, 'get_running_loop'):
+        return asyncio.get_running_loop()
+
+    loop = asyncio.get_event_loop()
+
+    if not loop.is_running():
+        raise RuntimeError("no running event loop")
+
+    return loop
+
+# Async version of rewardlist.scanBlock
+async def scanBlock(rpc, block, stats = None):
+
+    stats = stats if stats else SyncStats()
+    reward = presetReward(block)
+
+    if not reward:
+
+        # Search the new coin transaction of the block
+        for tx in block['tx']:
+
+            with stats.timer(STAGE_RPC):
+                rawTx = await rpc.getRawTransaction(tx)
+
+            reward, error = checkTransaction(rawTx, block['height'], stats)
+
+            if error:
+                return None, error
+
+            if reward:
+                break
+
+        if not reward:
+            reward = emptyReward(block['height'], -2)
+
+    setBlockHashes(reward, block)
+
+    return reward, None
+
+class AsyncSNRewardList(SNRewardList):
+
+    # The callbacks can also be coroutine functions if no dispatcher is used.
+    def __init__(self, dbPath, rpcConfig, rewardCB = None, errorCB = None, dispatcher = None, retractCB = None,
+                 concurrency = 8, window = 100, executor = None, cacheSize = 1024):
+
+        SNRewardList.__init__(self, dbPath, rpcConfig, self.wrapCallback(rewardCB), self.wrapCallback(errorCB),
+                              dispatcher, self.wrapCallback(retractCB), cacheSize=cacheSize)
+
+        self.asyncRpc = AsyncSmartCashRPC(rpcConfig, exactAmounts=True, connections=concurrency)
+
+        # Blocks fetched at the same time
+        self.concurrency = concurrency
+        # Blocks scheduled per round
+        self.window = window
+
+        # One writer thread keeps the writes in order, shared executors are fine too.
+        self.ownExecutor = executor is None
+        self.executor = executor if executor else ThreadPoolExecutor(max_workers=1)
+
+        self.loop = None
+        self.task = None
+        self.semaphore = None
+        self.stopEvent = None
+        self.resumeEvent = None
+        self.callbackTasks = set()
+
+    def wrapCallback(self, callback):
+
+        if not callback:
+            return None
+
+        def call(*args):
+
+            result = callback(*args)
+
+            if asyncio.iscoroutine(result):
+                task = asyncio.ensure_future(result)
+                self.callbackTasks.add(task)
+                task.add_done_callback(self.callbackTasks.discard)
+
+        return call
+
+    # Must be called from inside the running event loop, e.g. a coroutine.
+    def start(self):
+
+        if self.task and not self.task.done():
+            return self.task
+
+        try:
+            loop = runningLoop()
+        except RuntimeError:
+            raise RuntimeError("AsyncSNRewardList.start needs a running event loop, call it from a coroutine")
+
+        logger.info("Starting!")
+
+        if self.dispatcher:
+            self.dispatcher.start()
+
+        self.loop = loop
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.stopEvent = asyncio.Event()
+        self.resumeEvent = asyncio.Event()
+
+        if not self.paused:
+            self.resumeEvent.set()
+
+        self.running = True
+        self.task = self.loop.create_task(self.run())
+
+        return self.task
+
+    # pause, resume and stop can be called from any thread.
+    def callInLoop(self, function):
+
+        if not self.loop or self.loop.is_closed():
+            return
+
+        try:
+            current = runningLoop()
+        except RuntimeError:
+            current = None
+
+        if current is self.loop:
+            function()
+        else:
+            self.loop.call_soon_threadsafe(function)
+
+    def stop(self):
+
+        self.running = False
+
+        if self.dispatcher:
+            self.dispatcher.stop()
+
+        def wakeUp():
+            self.stopEvent.set()
+            self.resumeEvent.set()
+
+        self.callInLoop(wakeUp)
+
+    def pause(self):
+        logger.info("pause")
+        self.paused = True
+        self.callInLoop(lambda: self.resumeEvent.clear())
+
+    def resume(self):
+        logger.info("resume")
+        self.paused = False
+        self.callInLoop(lambda: self.resumeEvent.set())
+
+    # Stop and wait for the sync task to finish.
+    async def close(self):
+
+        self.stop()
+
+        if self.task:
+            await self.task
+
+        if self.ownExecutor:
+            self.executor.shutdown(wait=False)
+
+        self.asyncRpc.close()
+
+    async def execute(self, function, *args):
+        return await self.loop.run_in_executor(self.executor, function, *args)
+
+    async def sleep(self, seconds):
+
+        with self.stats.timer(STAGE_SLEEP):
+
+            try:
+                await asyncio.wait_for(self.stopEvent.wait(), seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+
+        self.currentHeight = 300000
+
+        lastVerified = await self.execute(self.getCheckpoint)
+
+        if lastVerified:
+            self.currentHeight = lastVerified[0] + 1
+            self.tipHash = lastVerified[1]
+
+        logger.info("Start block {}".format(self.currentHeight))
+
+        lastInfoCheck = 0
+
+        try:
+
+            while self.running:
+
+                if self.paused:
+
+                    logger.info("paused!")
+
+                    with self.stats.timer(STAGE_PAUSED):
+                        await self.resumeEvent.wait()
+
+                    continue
+
+                if not lastInfoCheck or (time.time() - lastInfoCheck) > 50:
+
+                    with self.stats.timer(STAGE_RPC):
+                        info = await self.asyncRpc.getInfo()
+
+                    if info.error:
+                        self.chainHeight = None
+                        logger.error("getInfo failed {}".format(str(info.error)))
+                        await self.sleep(30)
+                        continue
+
+                    lastInfoCheck = time.time()
+                    self.chainHeight = info['blocks']
+                    logger.info("Current chain height: {}".format(self.chainHeight))
+
+                last = min(self.currentHeight + self.window, self.chainHeight - self.tracker.confirmations + 2)
+
+                if self.currentHeight >= last:
+                    # Wait for the next block and check the height again
+                    lastInfoCheck = 0
+                    await self.sleep(10)
+                    continue
+
+                await self.syncRange(self.currentHeight, last)
+
+        except Exception as e:
+            logger.error("run", exc_info=e)
+            raise
+
+        finally:
+            self.running = False
+
+    # Fetch the blocks of [start, stop) concurrently and process them in order,
+    # processing starts with the first block while the others are still loading.
+    async def syncRange(self, start, stop):
+
+        tasks = [self.loop.create_task(self.fetchBlock(x)) for x in range(start, stop)]
+
+        try:
+
+            for task in tasks:
+
+                block, reward, error = await task
+
+                if not self.running or self.paused:
+                    break
+
+                if not await self.processBlock(block, reward, error):
+                    break
+
+        finally:
+
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Returns (block, reward, error), reward is None if the block could
+    # not be fetched or has not enough confirmations yet.
+    async def fetchBlock(self, height):
+
+        async with self.semaphore:
+
+            with self.stats.timer(STAGE_RPC):
+                block = await self.asyncRpc.getBlockByNumber(height)
+
+            if block.error or block['confirmations'] < self.tracker.confirmations:
+                return block, None, None
+
+            reward, error = await scanBlock(self.asyncRpc, block.data, self.stats)
+
+        return block, reward, error
+
+    # Returns False if the sync needs to continue at currentHeight.
+    async def processBlock(self, block, reward, error):
+
+        if block.error:
+            logger.error("Could not fetch block {}".format(block.error))
+            await self.sleep(30)
+            return False
+
+        if block['confirmations'] < self.tracker.confirmations:
+            logger.info("[{}] Wait for confirmations ({}): {}".format(self.currentHeight, block['confirmations'], block['hash']))
+            await self.sleep(10)
+            return False
+
+        if self.isReorg(block):
+
+            if not await self.recover(self.currentHeight - 1):
+                await self.sleep(30)
+
+            return False
+
+        if error:
+            self.notifyError(error)
+            await self.sleep(60)
+            logger.debug("Unexpected error occured. Sleep a bit..")
+            return False
+
+        if await self.execute(self.addReward, reward):
+
+            self.rewardAdded(reward)
+
+        elif await self.execute(self.verifyReward, reward):
+
+            self.rewardVerified(reward)
+
+        else:
+
+            self.verifyFailed(reward)
+
+            # The stored row belongs to another chain, rescan from its height.
+            if not await self.rewind(reward.block - 1):
+                await self.sleep(60)
+
+            return False
+
+        return True
+
+    # Async versions of findForkHeight, handleReorg and rollback
+    async def findFork(self, height, maxDepth = 1000):
+
+        lowest = max(300000, height - maxDepth)
+
+        while height >= lowest:
+
+            stored = await self.execute(self.getReward, height)
+            response = None
+
+            if hasBlockHash(stored):
+                with self.stats.timer(STAGE_RPC):
+                    response = await self.asyncRpc.raw('getblockhash', [height])
+
+            finished, forkHeight = forkStep(height, stored, response)
+
+            if finished:
+                return forkHeight
+
+            height -= 1
+
+        logger.error("findFork - no common block down to {}".format(lowest))
+
+        return None
+
+    async def recover(self, height):
+
+        forkHeight = await self.findFork(height)
+
+        if not self.forkFound(height, forkHeight):
+            return False
+
+        await self.rewind(forkHeight)
+
+        return True
+
+    async def rewind(self, height):
+        return self.rolledBack(height, *await self.execute(self.removeAbove, height))
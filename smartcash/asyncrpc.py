@@ -0,0 +1,233 @@
+#
+# Part of `python-smartcash`
+#
+# asyncio JSON-RPC transport for the SmartCash daemon. Keeps a pool of
+# HTTP/1.1 keep-alive connections, returns the same RPCResponse objects as
+# SmartCashRPC. Python 3.5 or newer.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import copy
+import json
+import asyncio
+import logging
+from decimal import Decimal
+from smartcash import trace
+from smartcash.rpc import RPCException, RPCResponse, requestPayload, batchPayload, parseResult, parseBatch
+
+logger = logging.getLogger("smartcash.asyncrpc")
+
+class AsyncSmartCashRPC(object):
+
+    def __init__(self, config, exactAmounts = False, connections = 8):
+
+        self.config = copy.deepcopy(config)
+        self.parseFloat = Decimal if exactAmounts else None
+        # Maximum of idle connections to keep
+        self.connections = connections
+        self.idle = []
+
+    def close(self):
+
+        for _, writer in self.idle:
+            writer.close()
+
+        self.idle = []
+
+    async def connect(self):
+        return await asyncio.open_connection(self.config.url.hostname, self.config.port)
+
+    async def readResponse(self, reader):
+
+        line = await reader.readline()
+
+        if not line:
+            raise ConnectionError("Connection closed")
+
+        parts = line.split(None, 2)
+        version, status = parts[0], int(parts[1])
+        headers = {}
+
+        while True:
+
+            line = await reader.readline()
+
+            if line in (b'\r\n', b'\n', b''):
+                break
+
+            key, value = line.decode('latin1').split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+
+        keepAlive = version == b'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+        if 'content-length' in headers:
+            data = await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+
+            data = b''
+
+            while True:
+
+                size = int((await reader.readline()).split(b';')[0], 16)
+
+                if not size:
+                    await reader.readline()
+                    break
+
+                data += await reader.readexactly(size)
+                await reader.readline()
+
+        else:
+            data = await reader.read()
+            keepAlive = False
+
+        return status, headers, data, keepAlive
+
+    async def send(self, payload):
+
+        if not trace.isEnabled():
+            return await self.post(payload)
+
+        with trace.span('rpc.request', {'method': payload['method'] if isinstance(payload, dict) else 'batch'}):
+            return await self.post(payload)
+
+    async def post(self, payload):
+
+        body = json.dumps(payload).encode('utf8')
+
+        request = b''.join([
+            'POST {} HTTP/1.1\r\n'.format(self.config.url.path or '/').encode('latin1'),
+            'Host: {}\r\n'.format(self.config.url.hostname).encode('latin1'),
+            b'Authorization: ' + self.config.authHeader + b'\r\n',
+            b'Content-Type: application/json\r\n',
+            'Content-Length: {}\r\n\r\n'.format(len(body)).encode('latin1'),
+            body])
+
+        for attempt in range(2):
+
+            reused = len(self.idle) > 0
+            reader, writer = self.idle.pop() if reused else (None, None)
+
+            try:
+
+                if not reused:
+                    reader, writer = await asyncio.wait_for(self.connect(), self.config.timeout)
+
+                writer.write(request)
+                await writer.drain()
+
+                status, headers, data, keepAlive = await asyncio.wait_for(self.readResponse(reader), self.config.timeout)
+
+            except asyncio.TimeoutError:
+
+                if writer:
+                    writer.close()
+
+                raise RPCException(10, 'Request error - timeout')
+            except asyncio.CancelledError:
+
+                # The response state is unknown, don't reuse the connection.
+                if writer:
+                    writer.close()
+
+                raise
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+
+                if writer:
+                    writer.close()
+
+                # The server might have closed the idle connection, try a new one.
+                if reused and not attempt:
+                    continue
+
+                raise RPCException(10, 'Request error - {}'.format(e))
+
+            if keepAlive and len(self.idle) < self.connections:
+                self.idle.append((reader, writer))
+            else:
+                writer.close()
+
+            break
+
+        if headers.get('content-type') != 'application/json':
+            raise RPCException(12, 'Non JSON response: {}'.format(status))
+
+        try:
+            with trace.span('rpc.json'):
+                response = json.loads(data.decode('utf8'), parse_float=self.parseFloat)
+        except:
+            response = None
+
+        if not response:
+            raise RPCException(13, 'JSON response parse error')
+
+        return response
+
+    async def request(self, method, args = None):
+        return parseResult(await self.send(requestPayload(method, args)))
+
+    async def requestBatch(self, calls):
+
+        if not calls:
+            return []
+
+        return parseBatch(calls, await self.send(batchPayload(calls)))
+
+    async def raw(self, method, args = None):
+
+        response = RPCResponse()
+
+        try:
+            response.data = await self.request(method, args)
+        except RPCException as e:
+            response.error = e.error
+            logger.debug(method, exc_info=e)
+
+        return response
+
+    async def batch(self, calls):
+
+        try:
+            responses = await self.requestBatch(calls)
+        except RPCException as e:
+            responses = [RPCResponse(error=e.error) for _ in calls]
+            logger.debug('batch', exc_info=e)
+
+        return responses
+
+    async def getInfo(self):
+        return await self.raw('getinfo')
+
+    async def getBlockByHash(self, blockHash):
+        return await self.raw('getblock', [blockHash])
+
+    async def getBlockByNumber(self, number):
+
+        response = await self.raw('getblockhash', [number])
+
+        if response.data:
+            return await self.getBlockByHash(response.data)
+
+        return response
+
+    async def getRawTransaction(self, txhash):
+        return await self.raw('getrawtransaction', [txhash, 1])
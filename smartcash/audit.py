@@ -0,0 +1,316 @@
+#
+# Part of `python-smartcash`
+#
+# Offline consistency audit of a rewards database. The height range
+# gets split across a process pool, flagged heights can optionally be
+# re-checked against the node with batched RPC calls.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+import json
+import time
+import logging
+import argparse
+import sqlite3 as sql
+from multiprocessing import Pool
+from smartcash import schedule
+from smartcash.rpc import SmartCashRPC, RPCConfig
+from smartcash.rewardlist import findReward
+from smartcash.util import toCoins
+
+logger = logging.getLogger("smartcash.audit")
+
+# Rules checked by the audit
+RULE_GAP = 'gap'
+RULE_AMOUNT = 'amount'
+RULE_PAYEES = 'payees'
+RULE_NO_REWARD = 'noreward'
+RULE_ERROR = 'error'
+RULE_TXTIME = 'txtime'
+RULE_META = 'meta'
+RULE_UNVERIFIED = 'unverified'
+
+def issue(block, rule, message):
+    return {'block': int(block), 'rule': rule, 'message': message}
+
+def openReadOnly(dbPath):
+
+    connection = sql.connect('file:{}?mode=ro'.format(dbPath), uri=True)
+    connection.row_factory = sql.Row
+
+    return connection
+
+# Audit the heights start <= block < stop. Runs in the pool workers.
+def auditRange(args):
+
+    dbPath, start, stop = args
+
+    np = schedule.requireNumpy()
+    issues = []
+
+    connection = openReadOnly(dbPath)
+
+    try:
+        rows = connection.execute("SELECT block, ifnull(txtime,0) AS txtime, payee, ifnull(amount,0) AS amount, \
+                                   ifnull(meta,0) AS meta, ifnull(verified,0) AS verified \
+                                   FROM rewards WHERE block>=? AND block<? ORDER BY block",
+                                   (start, stop)).fetchall()
+    finally:
+        connection.close()
+
+    blocks = np.array([row['block'] for row in rows], dtype=np.int64)
+    txtimes = np.array([row['txtime'] for row in rows], dtype=np.int64)
+    amounts = np.array([row['amount'] for row in rows], dtype=np.int64)
+    metas = np.array([row['meta'] for row in rows], dtype=np.int64)
+    verified = np.array([row['verified'] for row in rows], dtype=np.int64)
+
+    for block in np.setdiff1d(np.arange(start, stop, dtype=np.int64), blocks):
+        issues.append(issue(block, RULE_GAP, "Missing row"))
+
+    if not len(rows):
+        return len(rows), issues
+
+    index = blocks - start
+    payees = schedule.payeesPerBlock(start, stop)[index]
+    lower, upper = schedule.toleranceBands(start, stop)
+    lower = lower[index]
+    upper = upper[index]
+    rewardHeights = schedule.rewardHeights(start, stop)[index]
+
+    paid = metas == 0
+
+    for i in np.nonzero(paid & ((amounts < lower) | (amounts > upper)))[0]:
+        issues.append(issue(blocks[i], RULE_AMOUNT,
+                            "Amount {} not in [{}, {}]".format(toCoins(int(amounts[i])), toCoins(int(lower[i])), toCoins(int(upper[i])))))
+
+    for i in np.nonzero(paid & (txtimes <= 0))[0]:
+        issues.append(issue(blocks[i], RULE_TXTIME, "Paid reward without txtime"))
+
+    for i in np.nonzero(paid & ~rewardHeights)[0]:
+        issues.append(issue(blocks[i], RULE_NO_REWARD, "Paid reward at a no reward height"))
+
+    for i in np.nonzero((metas == -3) & rewardHeights)[0]:
+        issues.append(issue(blocks[i], RULE_NO_REWARD, "No reward marker at a reward height"))
+
+    # Blocks without transactions get -1 at any height, only the search of
+    # the reward (-2) is limited to the reward heights.
+    for i in np.nonzero((metas == -2) & ~rewardHeights)[0]:
+        issues.append(issue(blocks[i], RULE_NO_REWARD, "Error marker at a no reward height"))
+
+    for i in np.nonzero(~np.isin(metas, [0, -1, -2, -3]))[0]:
+        issues.append(issue(blocks[i], RULE_META, "Unknown meta {}".format(metas[i])))
+
+    for i in np.nonzero(verified != 1)[0]:
+        issues.append(issue(blocks[i], RULE_UNVERIFIED, "Row not verified"))
+
+    for i in np.nonzero(np.isin(metas, [-1, -2]))[0]:
+
+        row = rows[i]
+
+        if row['payee'] != 'error' or row['txtime']:
+            issues.append(issue(blocks[i], RULE_ERROR, "Invalid error marker {} {}".format(row['payee'], row['txtime'])))
+
+    for i in np.nonzero(paid)[0]:
+
+        try:
+            count = len(json.loads(rows[i]['payee']))
+        except (TypeError, ValueError):
+            count = None
+
+        if count != payees[i]:
+            issues.append(issue(blocks[i], RULE_PAYEES,
+                                "Expected {} payees, found {}".format(payees[i], count)))
+
+    return len(rows), issues
+
+# Merge the sorted heights into [start, stop) ranges.
+def toRanges(heights):
+
+    ranges = []
+
+    for height in heights:
+        if ranges and ranges[-1][1] == height:
+            ranges[-1][1] = height + 1
+        else:
+            ranges.append([height, height + 1])
+
+    return ranges
+
+def audit(dbPath, start = None, stop = None, processes = None, chunkSize = 50000):
+
+    schedule.requireNumpy()
+
+    connection = openReadOnly(dbPath)
+
+    try:
+        first, last = connection.execute("SELECT min(block), max(block) FROM rewards").fetchone()
+    finally:
+        connection.close()
+
+    start = start if start != None else (first if first != None else schedule.FIRST_REWARD_HEIGHT)
+    stop = stop if stop != None else (last + 1 if last != None else start)
+
+    chunks = [(dbPath, x, min(x + chunkSize, stop)) for x in range(start, stop, chunkSize)]
+
+    began = time.time()
+    rows = 0
+    issues = []
+
+    pool = Pool(processes)
+
+    try:
+        for count, chunkIssues in pool.imap(auditRange, chunks):
+            rows += count
+            issues += chunkIssues
+    finally:
+        pool.close()
+        pool.join()
+
+    summary = {}
+
+    for entry in issues:
+        summary[entry['rule']] = summary.get(entry['rule'], 0) + 1
+
+    return {'database': dbPath,
+            'start': start,
+            'stop': stop,
+            'rows': rows,
+            'duration': round(time.time() - began, 3),
+            'summary': summary,
+            'flagged': toRanges(sorted(set(x['block'] for x in issues))),
+            'issues': issues}
+
+# Compare the stored rows of the flagged heights with the payouts found
+# in the coinbase transactions of the node.
+def recheck(dbPath, report, rpcConfig, batchSize = 100):
+
+    rpc = SmartCashRPC(rpcConfig, exactAmounts=True)
+
+    heights = []
+
+    for lower, upper in report['flagged']:
+        heights += range(lower, upper)
+
+    results = []
+
+    connection = openReadOnly(dbPath)
+
+    try:
+
+        for i in range(0, len(heights), batchSize):
+
+            batch = heights[i:i + batchSize]
+
+            hashes = rpc.batch([('getblockhash', [x]) for x in batch])
+            blocks = rpc.batch([('getblock', [x.data]) for x in hashes if not x.error])
+            blocks = iter(blocks)
+
+            coinbases = {}
+
+            for height, blockHash in zip(batch, hashes):
+
+                if blockHash.error:
+                    results.append({'block': height, 'status': 'error', 'message': str(blockHash.error)})
+                    continue
+
+                block = next(blocks)
+
+                if block.error:
+                    results.append({'block': height, 'status': 'error', 'message': str(block.error)})
+                elif not 'tx' in block or not block['tx']:
+                    coinbases[height] = None
+                else:
+                    coinbases[height] = block['tx'][0]
+
+            checked = [x for x in batch if x in coinbases and coinbases[x]]
+            rawTxs = dict(zip(checked, rpc.batch([('getrawtransaction', [coinbases[x], 1]) for x in checked])))
+
+            for height in batch:
+
+                if not height in coinbases:
+                    continue
+
+                stored = connection.execute("SELECT * FROM rewards WHERE block=?", (height,)).fetchone()
+                stored = dict(stored) if stored else None
+
+                rawTx = rawTxs.get(height)
+
+                if rawTx is not None and rawTx.error:
+                    results.append({'block': height, 'status': 'error', 'message': str(rawTx.error)})
+                    continue
+
+                reward = findReward(rawTx, height) if rawTx is not None else None
+                expected = {'payee': reward.payee, 'amount': reward.amount, 'txtime': reward.txtime} if reward else None
+
+                if not stored:
+                    status = 'missing'
+                elif not reward:
+                    status = 'unresolved'
+                elif stored and stored['meta'] == 0 and stored['payee'] == reward.payee and stored['amount'] == reward.amount:
+                    status = 'match'
+                else:
+                    status = 'mismatch'
+
+                results.append({'block': height, 'status': status, 'stored': stored, 'expected': expected})
+
+    finally:
+        connection.close()
+
+    report['rpc'] = results
+
+    return report
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Audit a SmartNode rewards database.')
+    parser.add_argument('database', help='Path of the rewards database')
+    parser.add_argument('--start', type=int, default=None, help='First height to audit')
+    parser.add_argument('--stop', type=int, default=None, help='Stop before this height')
+    parser.add_argument('--processes', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--chunk', type=int, default=50000, help='Heights per worker task')
+    parser.add_argument('--output', default=None, help='Write the JSON report to this file')
+    parser.add_argument('--rpc-user', default=None, help='Re-check flagged heights against the node')
+    parser.add_argument('--rpc-password', default=None)
+    parser.add_argument('--rpc-url', default='http://127.0.0.1')
+    parser.add_argument('--rpc-port', type=int, default=9679)
+    parser.add_argument('--rpc-batch', type=int, default=100)
+
+    args = parser.parse_args(argv)
+
+    report = audit(args.database, args.start, args.stop, args.processes, args.chunk)
+
+    if args.rpc_user:
+        rpcConfig = RPCConfig(args.rpc_user, args.rpc_password or '', args.rpc_url, args.rpc_port)
+        recheck(args.database, report, rpcConfig, args.rpc_batch)
+
+    output = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+
+    return 1 if report['issues'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,421 @@
+#
+# Part of `python-smartcash`
+#
+# Sharded multi-process backfill of the rewards database. Each shard
+# scans its height range with an own RPC client into a staging database,
+# the complete shards get merged into the main database afterwards.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import sqlite3 as sql
+from multiprocessing import Pool
+from smartcash import rollups, checkpoint
+from smartcash.export import columns
+from smartcash.schedule import FIRST_REWARD_HEIGHT, isRewardHeight
+from smartcash.stats import SyncStats, STAGE_RPC, STAGE_DB
+from smartcash.rpc import SmartCashRPC, RPCConfig, fetchBlocks
+from smartcash.rewardlist import SNRewardDatabase, scanBlock, findReward
+
+logger = logging.getLogger("smartcash.backfill")
+
+# Minimum confirmations of the backfilled blocks, same as SNRewardList.run
+MIN_CONFIRMATIONS = 3
+
+class BackfillError(Exception):
+    pass
+
+def stagingPath(workdir, start, stop):
+    return os.path.join(workdir, 'shard-{}-{}.db'.format(start, stop))
+
+def splitRange(start, stop, shards):
+
+    size = max(1, (stop - start + shards - 1) // shards)
+
+    return [(x, min(x + size, stop)) for x in range(start, stop, size)]
+
+def insertRewards(database, rewards):
+
+    query = "INSERT OR REPLACE INTO rewards({}) values({})".format(', '.join(columns), ', '.join('?' for _ in columns))
+
+    with database.connection as db:
+        db.cursor.executemany(query, [tuple(getattr(x, c) for c in columns) for x in rewards])
+
+def scanBatch(rpc, blocks, stats, retries):
+
+    rewards = []
+
+    # The coinbase is the first transaction, fetch them all in one batch
+    # and fall back to the full scan if it didn't contain the reward.
+    coinbases = [x for x in blocks if 'tx' in x and x['tx'] and isRewardHeight(x['height'])]
+
+    with stats.timer(STAGE_RPC):
+        rawTxs = dict(zip([x['height'] for x in coinbases],
+                          rpc.batch([('getrawtransaction', [x['tx'][0], 1]) for x in coinbases])))
+
+    for block in blocks:
+
+        reward = None
+        rawTx = rawTxs.get(block['height'])
+
+        if rawTx is not None and not rawTx.error:
+            reward = findReward(rawTx, block['height'])
+
+            if reward:
+                reward.hash = block['hash']
+                reward.prevhash = block['previousblockhash'] if 'previousblockhash' in block else None
+
+        attempt = 0
+
+        while not reward and attempt < retries:
+
+            reward, error = scanBlock(rpc, block, stats)
+
+            if error:
+                logger.warning("scanBlock {} - {}".format(block['height'], error))
+                time.sleep(min(30, 2 ** attempt))
+                attempt += 1
+
+        if not reward:
+            return rewards, False
+
+        rewards.append(reward)
+
+    return rewards, True
+
+# Scan the heights start <= height < stop into the staging database.
+# Runs in the pool workers, resumes from the staged rows.
+def backfillShard(args):
+
+    rpcConfig, path, start, stop, batchSize, retries = args
+
+    began = time.time()
+    stats = SyncStats()
+    rpc = SmartCashRPC(rpcConfig, exactAmounts=True)
+    database = SNRewardDatabase(path)
+
+    with database.connection as db:
+        db.cursor.execute("SELECT max(block) FROM rewards")
+        last = db.cursor.fetchone()[0]
+
+    height = last + 1 if last != None and last >= start else start
+    complete = True
+
+    while height < stop:
+
+        heights = list(range(height, min(height + batchSize, stop)))
+
+        with stats.timer(STAGE_RPC):
+            blocks = fetchBlocks(rpc, heights, retries)
+
+        if not blocks:
+            complete = False
+            break
+
+        blocks = [x.data for x in blocks]
+
+        if any(x['confirmations'] < MIN_CONFIRMATIONS for x in blocks):
+            complete = False
+            break
+
+        rewards, complete = scanBatch(rpc, blocks, stats, retries)
+
+        with stats.timer(STAGE_DB):
+            insertRewards(database, rewards)
+
+        for reward in rewards:
+            stats.addBlock(reward.meta)
+
+        if not complete:
+            break
+
+        height += len(heights)
+
+    database.connection.connection.close()
+
+    return {'start': start,
+            'stop': stop,
+            'path': path,
+            'complete': complete,
+            'seconds': time.time() - began,
+            'stats': stats.get()}
+
+# Checks the staging database covers start <= block < stop without gaps
+# and that overlapping rows in the main database are identical.
+def checkShard(database, shard):
+
+    path, start, stop = shard['path'], shard['start'], shard['stop']
+
+    connection = sql.connect(path)
+
+    try:
+
+        first, last, count = connection.execute("SELECT min(block), max(block), count(*) FROM rewards \
+                                                 WHERE block>=? AND block<?", (start, stop)).fetchone()
+
+        if count != stop - start or first != start or last != stop - 1:
+            raise BackfillError("Shard {} - {} has gaps ({} rows)".format(start, stop, count))
+
+        outside = connection.execute("SELECT count(*) FROM rewards WHERE block<? OR block>=?", (start, stop)).fetchone()[0]
+
+        if outside:
+            raise BackfillError("Shard {} - {} overlaps with {} rows outside of its range".format(start, stop, outside))
+
+    finally:
+        connection.close()
+
+    # Rows of older versions have no hashes, compare the reward columns only.
+    selection = ', '.join(x for x in columns if not x in ('hash', 'prevhash'))
+
+    with database.connection as db:
+
+        db.cursor.execute('ATTACH DATABASE ? AS shard', (path,))
+
+        try:
+            db.cursor.execute("SELECT count(*) FROM (SELECT {0} FROM main.rewards WHERE block>=? AND block<? \
+                               EXCEPT SELECT {0} FROM shard.rewards)".format(selection), (start, stop))
+            conflicts = db.cursor.fetchone()[0]
+        finally:
+            db.connection.commit()
+            db.cursor.execute('DETACH DATABASE shard')
+
+    if conflicts:
+        raise BackfillError("Shard {} - {} conflicts with {} existing rows".format(start, stop, conflicts))
+
+# Scan the shard again from scratch
+def refetchShard(args):
+
+    if os.path.exists(args[1]):
+        os.remove(args[1])
+
+    return backfillShard(args)
+
+def stagedValue(shard, block, column):
+
+    connection = sql.connect(shard['path'])
+
+    try:
+        row = connection.execute("SELECT {} FROM rewards WHERE block=?".format(column), (block,)).fetchone()
+    finally:
+        connection.close()
+
+    return row[0] if row else None
+
+# Checks the first row the shard adds at height links to prevHash, the
+# hash of the row below. Rows of older versions have no hashes.
+def isLinked(shard, height, prevHash):
+
+    prevhash = stagedValue(shard, height, 'prevhash')
+
+    return prevHash is None or prevhash is None or prevhash == prevHash
+
+def mergeShard(database, shard):
+
+    selection = ', '.join(columns)
+
+    with database.connection as db:
+
+        db.cursor.execute('ATTACH DATABASE ? AS shard', (shard['path'],))
+
+        try:
+            db.cursor.execute("INSERT OR REPLACE INTO main.rewards({0}) SELECT {0} FROM shard.rewards \
+                               ORDER BY block".format(selection))
+            merged = db.cursor.rowcount
+        finally:
+            db.connection.commit()
+            db.cursor.execute('DETACH DATABASE shard')
+
+    return merged
+
+# Next height to backfill, after the last verified row
+def nextHeight(database):
+
+    with database.connection as db:
+        db.cursor.execute("SELECT max(block) FROM rewards WHERE verified=1")
+        last = db.cursor.fetchone()[0]
+
+    return last + 1 if last != None else FIRST_REWARD_HEIGHT
+
+def verifiedHash(database, block):
+
+    with database.connection as db:
+        db.cursor.execute("SELECT hash FROM rewards WHERE block=? AND verified=1", (block,))
+        row = db.cursor.fetchone()
+
+    return row[0] if row else None
+
+# Merge the contiguous complete prefix of the shards. Incomplete shards
+# and all shards after them stay staged to not leave any gap behind.
+# All shards get checked before the first one is merged. Each shard must
+# continue the hash chain of the rows below it, shards which don't get
+# scanned again with refetch(shard) if given.
+def merge(database, shards, refetch = None):
+
+    height = nextHeight(database)
+    prevHash = verifiedHash(database, height - 1)
+    staged = []
+
+    for shard in sorted(shards, key=lambda x: x['start']):
+
+        if not shard['complete']:
+            logger.warning("Shard {} - {} incomplete, stop merging".format(shard['start'], shard['stop']))
+            break
+
+        if shard['start'] > height:
+            raise BackfillError("Shard {} - {} is not contiguous with height {}".format(shard['start'], shard['stop'], height))
+
+        checkShard(database, shard)
+
+        if shard['stop'] <= height:
+            staged.append(shard)
+            continue
+
+        if not isLinked(shard, height, prevHash):
+
+            if not refetch:
+                raise BackfillError("Shard {} - {} doesn't continue the chain at {}".format(shard['start'], shard['stop'], height))
+
+            logger.warning("Shard {} - {} doesn't continue the chain at {}, re-fetch".format(shard['start'], shard['stop'], height))
+
+            shard.update(refetch(shard))
+
+            if not shard['complete']:
+                logger.warning("Shard {} - {} incomplete, stop merging".format(shard['start'], shard['stop']))
+                break
+
+            checkShard(database, shard)
+
+            if not isLinked(shard, height, prevHash):
+                raise BackfillError("Shard {} - {} doesn't continue the chain at {}".format(shard['start'], shard['stop'], height))
+
+        staged.append(shard)
+        height = shard['stop']
+        prevHash = stagedValue(shard, height - 1, 'hash')
+
+    merged = []
+
+    try:
+
+        for shard in staged:
+
+            shard['merged'] = mergeShard(database, shard)
+            merged.append(shard)
+
+            os.remove(shard['path'])
+
+    finally:
+
+        with database.connection as db:
+            rollups.rebuild(db.cursor)
+            checkpoint.rebuild(db.cursor)
+
+        database.notifyWrite()
+
+    return merged
+
+def getRange(database, rpc, start, stop):
+
+    if start is None:
+        start = nextHeight(database)
+
+    if stop is None:
+
+        info = rpc.getInfo()
+
+        if info.error:
+            raise BackfillError("getInfo failed {}".format(info.error))
+
+        stop = info['blocks'] - MIN_CONFIRMATIONS + 2
+
+    return start, stop
+
+# Backfill start <= height < stop (default: the last verified height up to
+# the confirmed tip) with one process per shard. Afterwards SNRewardList
+# resumes as tip follower from the merged height.
+def backfill(dbPath, rpcConfig, start = None, stop = None, shards = 4, workdir = None,
+             batchSize = 100, retries = 5):
+
+    database = SNRewardDatabase(dbPath)
+    start, stop = getRange(database, SmartCashRPC(rpcConfig), start, stop)
+
+    if start >= stop:
+        return {'start': start, 'stop': stop, 'shards': [], 'merged': 0}
+
+    workdir = workdir or os.path.dirname(os.path.abspath(dbPath))
+
+    tasks = [(rpcConfig, stagingPath(workdir, lower, upper), lower, upper, batchSize, retries)
+             for lower, upper in splitRange(start, stop, shards)]
+
+    logger.info("Backfill {} - {} with {} shards".format(start, stop, len(tasks)))
+
+    pool = Pool(len(tasks))
+
+    try:
+        results = pool.map(backfillShard, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    tasks = {x[2]: x for x in tasks}
+    merged = merge(database, results, lambda shard: refetchShard(tasks[shard['start']]))
+
+    return {'start': start,
+            'stop': stop,
+            'shards': results,
+            'merged': sum(x['merged'] for x in merged)}
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Sharded backfill of a SmartNode rewards database.')
+    parser.add_argument('database', help='Path of the rewards database')
+    parser.add_argument('--rpc-user', required=True)
+    parser.add_argument('--rpc-password', default='')
+    parser.add_argument('--rpc-url', default='http://127.0.0.1')
+    parser.add_argument('--rpc-port', type=int, default=9679)
+    parser.add_argument('--start', type=int, default=None, help='First height, default after the last verified row')
+    parser.add_argument('--stop', type=int, default=None, help='Stop before this height, default the confirmed tip')
+    parser.add_argument('--shards', type=int, default=4, help='Number of worker processes')
+    parser.add_argument('--workdir', default=None, help='Directory of the staging databases')
+    parser.add_argument('--batch', type=int, default=100, help='Heights per RPC batch')
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    rpcConfig = RPCConfig(args.rpc_user, args.rpc_password, args.rpc_url, args.rpc_port)
+
+    try:
+        result = backfill(args.database, rpcConfig, args.start, args.stop, args.shards, args.workdir, args.batch)
+    except BackfillError as e:
+        sys.stderr.write("{}\n".format(e))
+        return 1
+
+    sys.stdout.write(json.dumps(result, indent=2) + '\n')
+
+    return 0 if all(x['complete'] for x in result['shards']) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,584 @@
+#
+# Part of `python-smartcash`
+#
+# Address indexed UTXO set and balances of the SmartCash blockchain.
+# Changes are kept in a write-back UTXO cache and flushed in one transaction
+# at block boundaries.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import time
+import logging
+from threading import Thread, RLock
+from smartcash.util import ThreadedSQLite, toSatoshis
+from smartcash.rpc import SmartCashRPC, fetchBlocks
+
+logger = logging.getLogger("smartcash.blockchain")
+
+schema = [
+    'CREATE TABLE IF NOT EXISTS outputs (\
+        txid VARCHAR(64) NOT NULL,\
+        n INTEGER NOT NULL,\
+        address VARCHAR(64) NOT NULL,\
+        amount BIGINT NOT NULL,\
+        height INTEGER NOT NULL,\
+        PRIMARY KEY (txid, n)\
+    )',
+    'CREATE INDEX outputs_address ON outputs (address)',
+    'CREATE TABLE IF NOT EXISTS balances (\
+        address VARCHAR(64) NOT NULL PRIMARY KEY,\
+        balance BIGINT NOT NULL,\
+        outputs INTEGER NOT NULL\
+    )',
+    'CREATE TABLE IF NOT EXISTS chainstate (\
+        id INTEGER NOT NULL PRIMARY KEY,\
+        height INTEGER NOT NULL,\
+        hash VARCHAR(64) NOT NULL\
+    )',
+]
+
+#####
+#
+# Database backends. Both take the same SQL with named (:name) parameters.
+#
+#####
+
+class SQLiteTransaction(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.db = None
+
+    def __enter__(self):
+        self.db = self.connection.__enter__()
+        return self
+
+    def __exit__(self, type, value, traceback):
+
+        if type is not None:
+            self.db.connection.rollback()
+
+        self.connection.__exit__(type, value, traceback)
+
+    def query(self, sql, params = None):
+        self.db.cursor.execute(sql, params or {})
+        return self.db.cursor.fetchall()
+
+    def execute(self, sql, params = None):
+        self.db.cursor.execute(sql, params or {})
+        return self.db.cursor.rowcount
+
+    def executemany(self, sql, params):
+        if params:
+            self.db.cursor.executemany(sql, params)
+
+class SQLiteBackend(object):
+
+    def __init__(self, path):
+        self.connection = ThreadedSQLite(path)
+
+    def transaction(self):
+        return SQLiteTransaction(self.connection)
+
+    def hasTable(self, name):
+
+        with self.transaction() as db:
+            return len(db.query("SELECT name FROM sqlite_master WHERE type='table' AND name=:name", {'name': name})) > 0
+
+class SQLAlchemyTransaction(object):
+
+    def __init__(self, engine, text):
+        self.engine = engine
+        self.text = text
+        self.connection = None
+        self.transaction = None
+
+    def __enter__(self):
+        self.connection = self.engine.connect()
+        self.transaction = self.connection.begin()
+        return self
+
+    def __exit__(self, type, value, traceback):
+
+        try:
+            if type is None:
+                self.transaction.commit()
+            else:
+                self.transaction.rollback()
+        finally:
+            self.connection.close()
+
+    def query(self, sql, params = None):
+        return self.connection.execute(self.text(sql), params or {}).fetchall()
+
+    def execute(self, sql, params = None):
+        return self.connection.execute(self.text(sql), params or {}).rowcount
+
+    def executemany(self, sql, params):
+        if params:
+            self.connection.execute(self.text(sql), params)
+
+class SQLAlchemyBackend(object):
+
+    def __init__(self, dburi):
+
+        # Only load SQLAlchemy if it's used
+        try:
+            import sqlalchemy
+        except ImportError:
+            raise ImportError("SQLAlchemy is required for {}, install it with `pip install sqlalchemy`".format(dburi.split('://')[0]))
+
+        self.sqlalchemy = sqlalchemy
+        self.engine = sqlalchemy.create_engine(dburi)
+
+    def transaction(self):
+        return SQLAlchemyTransaction(self.engine, self.sqlalchemy.text)
+
+    def hasTable(self, name):
+
+        with self.engine.connect() as connection:
+            return self.engine.dialect.has_table(connection, name)
+
+# SQLite URIs and plain paths use sqlite3 directly, everything else SQLAlchemy.
+def createBackend(dburi):
+
+    if dburi.startswith('sqlite:///'):
+        return SQLiteBackend(dburi[len('sqlite:///'):])
+
+    if not '://' in dburi:
+        return SQLiteBackend(dburi)
+
+    return SQLAlchemyBackend(dburi)
+
+#####
+#
+# Write-back cache of the UTXO set, like bitcoind's dbcache. Outputs created
+# and spent between two flushes never hit the database, the rest is written
+# in sorted batches in one transaction together with the chainstate.
+#
+#####
+
+# Entry states
+CLEAN = 0 # Loaded from the database
+FRESH = 1 # Created since the last flush, not in the database
+SPENT = 2 # In the database, spent since the last flush
+
+# Rough memory usage per entry/balance delta in bytes (key, value tuples
+# and the 64 character txid/address strings).
+ENTRY_SIZE = 320
+DELTA_SIZE = 200
+
+class UTXOCache(object):
+
+    def __init__(self, maxBytes):
+
+        self.maxBytes = maxBytes
+        self.lock = RLock()
+        # (txid, n) -> [address, amount, height, state]
+        self.entries = {}
+        # address -> [amount, outputs]
+        self.deltas = {}
+        # address -> {(txid, n), ...} of the FRESH and SPENT entries
+        self.dirty = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def usage(self):
+        return len(self.entries) * ENTRY_SIZE + len(self.deltas) * DELTA_SIZE
+
+    def isFull(self):
+        return self.usage() > self.maxBytes
+
+    def isDirty(self):
+        return len(self.deltas) > 0
+
+    def updateDelta(self, address, amount, outputs):
+
+        delta = self.deltas.setdefault(address, [0, 0])
+        delta[0] += amount
+        delta[1] += outputs
+
+    # Load the outputs of the given transactions which are not yet cached.
+    # The caller holds the lock, it's always taken before the database lock.
+    def load(self, db, txids):
+
+        txids = sorted(set(txids))
+
+        for i in range(0, len(txids), 500):
+
+            chunk = txids[i:i + 500]
+            params = {'t{}'.format(x): txid for x, txid in enumerate(chunk)}
+
+            rows = db.query("SELECT txid, n, address, amount, height FROM outputs WHERE txid IN ({})".format(
+                            ','.join(':' + x for x in params)), params)
+
+            for txid, n, address, amount, height in rows:
+                self.entries.setdefault((txid, n), [address, amount, height, CLEAN])
+
+    def add(self, outpoint, address, amount, height):
+
+        with self.lock:
+
+            if outpoint in self.entries:
+                return
+
+            self.entries[outpoint] = [address, amount, height, FRESH]
+            self.dirty.setdefault(address, set()).add(outpoint)
+            self.updateDelta(address, amount, 1)
+
+    # Returns the spent entry or None if the output is not indexed.
+    def spend(self, outpoint):
+
+        with self.lock:
+
+            entry = self.entries.get(outpoint)
+
+            if entry is None or entry[3] == SPENT:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+            if entry[3] == FRESH:
+                # Created and spent in memory, the database never sees it
+                del self.entries[outpoint]
+                self.dirty[entry[0]].discard(outpoint)
+            else:
+                entry[3] = SPENT
+                self.dirty.setdefault(entry[0], set()).add(outpoint)
+
+            self.updateDelta(entry[0], -entry[1], -1)
+
+            return entry
+
+    # Write all changes in one transaction and move the chainstate
+    # to the given block. Must only be called at block boundaries and
+    # with the lock held, see load().
+    def flush(self, db, height, hash, update):
+
+        with self.lock:
+
+            spent = sorted(k for k, v in self.entries.items() if v[3] == SPENT)
+            created = sorted((k, v) for k, v in self.entries.items() if v[3] == FRESH)
+
+            db.executemany("DELETE FROM outputs WHERE txid=:txid AND n=:n",
+                           [{'txid': txid, 'n': n} for txid, n in spent])
+
+            db.executemany("INSERT INTO outputs(txid, n, address, amount, height) VALUES(:txid, :n, :address, :amount, :height)",
+                           [{'txid': k[0], 'n': k[1], 'address': v[0], 'amount': v[1], 'height': v[2]}
+                            for k, v in created])
+
+            for address, (amount, outputs) in sorted(self.deltas.items()):
+
+                if not amount and not outputs:
+                    continue
+
+                params = {'address': address, 'amount': amount, 'outputs': outputs}
+
+                if not db.execute("UPDATE balances SET balance=balance+:amount, outputs=outputs+:outputs WHERE address=:address", params):
+                    db.execute("INSERT INTO balances(address, balance, outputs) VALUES(:address, :amount, :outputs)", params)
+
+            if update:
+                db.execute("UPDATE chainstate SET height=:height, hash=:hash WHERE id=1",
+                           {'height': height, 'hash': hash})
+            else:
+                db.execute("INSERT INTO chainstate(id, height, hash) VALUES(1, :height, :hash)",
+                           {'height': height, 'hash': hash})
+
+            return len(created), len(spent)
+
+    # Called after the flush transaction committed.
+    def flushed(self):
+
+        with self.lock:
+
+            self.deltas = {}
+            self.dirty = {}
+
+            # Keep the hot entries unless we are over half the limit
+            if self.usage() * 2 > self.maxBytes:
+                self.entries = {}
+            else:
+                self.entries = {k: v for k, v in self.entries.items() if v[3] != SPENT}
+                for entry in self.entries.values():
+                    entry[3] = CLEAN
+
+    # Unflushed (amount, outputs) change of the address
+    def pending(self, address):
+
+        with self.lock:
+            amount, outputs = self.deltas.get(address, (0, 0))
+
+        return amount, outputs
+
+    # Unflushed created and spent entries of the address, {outpoint: entry}
+    def pendingEntries(self, address):
+
+        with self.lock:
+            return {k: list(self.entries[k]) for k in self.dirty.get(address, ())}
+
+    def stats(self):
+
+        with self.lock:
+            return {'entries': len(self.entries), 'addresses': len(self.deltas),
+                    'bytes': self.usage(), 'limit': self.maxBytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+#####
+#
+# The indexer
+#
+#####
+
+class SmartCashBlockchain(Thread):
+
+    def __init__(self, dburi, rpcConfig = None, batchSize = 100, confirmations = 6, startHeight = 0,
+                 cacheSize = 450, flushInterval = 600):
+
+        Thread.__init__(self)
+
+        self.daemon = True
+        self.running = False
+
+        self.rpc = SmartCashRPC(rpcConfig, exactAmounts=True) if rpcConfig else None
+        self.db = createBackend(dburi)
+
+        # Blocks per RPC batch
+        self.batchSize = batchSize
+        # Only blocks with this many confirmations get indexed, there is
+        # no undo data for reorgs.
+        self.confirmations = confirmations
+        self.startHeight = startHeight
+
+        self.chainHeight = None
+
+        if not self.db.hasTable('chainstate'):
+
+            with self.db.transaction() as db:
+                for statement in schema:
+                    db.execute(statement)
+
+        self.height, self.hash = self.getState()
+
+        # UTXO cache limit in MB, it gets flushed when full, after
+        # flushInterval seconds and whenever we are synced.
+        self.cache = UTXOCache(cacheSize * 1024 * 1024)
+        self.flushInterval = flushInterval
+        self.flushedHeight = self.height
+        self.lastFlush = time.time()
+
+    def getState(self):
+
+        with self.db.transaction() as db:
+            rows = db.query("SELECT height, hash FROM chainstate WHERE id=1")
+
+        return (rows[0][0], rows[0][1]) if rows else (None, None)
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+
+        if not self.rpc:
+            logger.error("run - no RPC configuration")
+            return
+
+        self.running = True
+
+        while self.running:
+
+            count = self.rpc.raw('getblockcount', [])
+
+            if count.error:
+                logger.error("getblockcount - {}".format(count.error))
+                time.sleep(30)
+                continue
+
+            self.chainHeight = count.data
+
+            first = self.height + 1 if self.height != None else self.startHeight
+            last = min(first + self.batchSize, self.chainHeight - self.confirmations + 2)
+
+            if first >= last:
+                self.flush()
+                time.sleep(10)
+                continue
+
+            if not self.indexBlocks(list(range(first, last))):
+                self.flush()
+                time.sleep(30)
+            elif last >= self.chainHeight - self.confirmations + 2 or\
+                 time.time() - self.lastFlush > self.flushInterval:
+                self.flush()
+
+        self.flush()
+
+    # Fetch the blocks and their transactions and apply them.
+    def indexBlocks(self, heights, retries = 3):
+
+        blocks = fetchBlocks(self.rpc, heights, retries)
+
+        if not blocks:
+            logger.error("indexBlocks - could not fetch {} - {}".format(heights[0], heights[-1]))
+            return False
+
+        blocks = [x.data for x in blocks]
+
+        if self.hash and blocks[0].get('previousblockhash') != self.hash:
+            logger.error("indexBlocks - {} doesn't follow the indexed chain, reindex required".format(heights[0]))
+            self.running = False
+            return False
+
+        txids = [txid for block in blocks if block['height'] > 0 for txid in block.get('tx', [])]
+        transactions = {}
+
+        for i in range(0, len(txids), 500):
+
+            chunk = txids[i:i + 500]
+
+            for txid, response in zip(chunk, self.rpc.batch([('getrawtransaction', [x, 1]) for x in chunk])):
+
+                if response.error:
+                    logger.error("indexBlocks - getrawtransaction {} {}".format(txid, response.error))
+                    return False
+
+                transactions[txid] = response.data
+
+        self.applyBlocks([(block, [transactions[x] for x in block.get('tx', []) if x in transactions])
+                          for block in blocks])
+
+        return True
+
+    # Apply [(block, [rawTx, ...]), ...] to the cache.
+    def applyBlocks(self, blocks):
+
+        created = 0
+        spent = 0
+
+        # Load the outputs spent by the batch which are not cached yet
+        # in one go instead of a lookup per input.
+        missing = [vin['txid'] for _, transactions in blocks for tx in transactions for vin in tx['vin']
+                   if not 'coinbase' in vin and not (vin['txid'], vin['vout']) in self.cache.entries]
+
+        if missing:
+            with self.cache.lock, self.db.transaction() as db:
+                self.cache.load(db, missing)
+
+        for block, transactions in blocks:
+
+            for tx in transactions:
+
+                for vin in tx['vin']:
+
+                    if 'coinbase' in vin:
+                        continue
+
+                    if self.cache.spend((vin['txid'], vin['vout'])) != None:
+                        spent += 1
+
+                for vout in tx['vout']:
+
+                    addresses = vout['scriptPubKey'].get('addresses') if 'scriptPubKey' in vout else None
+
+                    # Only outputs with exactly one address are indexed
+                    if not addresses or len(addresses) != 1:
+                        continue
+
+                    self.cache.add((tx['txid'], vout['n']), addresses[0], toSatoshis(vout['value']), block['height'])
+                    created += 1
+
+        self.height = blocks[-1][0]['height']
+        self.hash = blocks[-1][0]['hash']
+
+        logger.info("Indexed {} - {}, {} created, {} spent".format(blocks[0][0]['height'], self.height, created, spent))
+
+        if self.cache.isFull():
+            self.flush()
+
+    # Write the cache to the database, the chainstate moves with it.
+    def flush(self):
+
+        if self.height == None or self.height == self.flushedHeight:
+            return
+
+        start = time.time()
+
+        # Readers take the cache lock before the database, and they must not
+        # see the flushed rows together with the not yet cleared changes.
+        with self.cache.lock:
+
+            with self.db.transaction() as db:
+                created, spent = self.cache.flush(db, self.height, self.hash, self.flushedHeight != None)
+
+            self.cache.flushed()
+
+        self.flushedHeight = self.height
+        self.lastFlush = time.time()
+
+        logger.info("Flushed at {}, {} created, {} spent in {:.2f}s".format(self.height, created, spent, self.lastFlush - start))
+
+    #####
+    #
+    # Queries
+    #
+    #####
+
+    # Balance of the address in satoshis
+    def getBalance(self, address):
+
+        # Hold the cache lock so a flush can't run between both reads.
+        with self.cache.lock:
+
+            with self.db.transaction() as db:
+                rows = db.query("SELECT balance FROM balances WHERE address=:address", {'address': address})
+
+            amount, _ = self.cache.pending(address)
+
+        return (rows[0][0] if rows else 0) + amount
+
+    # Number of unspent outputs of the address
+    def getNumerOfOutputs(self, address):
+
+        with self.cache.lock:
+
+            with self.db.transaction() as db:
+                rows = db.query("SELECT outputs FROM balances WHERE address=:address", {'address': address})
+
+            _, outputs = self.cache.pending(address)
+
+        return (rows[0][0] if rows else 0) + outputs
+
+    # [(txid, n, amount, height), ...] of the unspent outputs of the address
+    def getUnspent(self, address):
+
+        with self.cache.lock:
+
+            with self.db.transaction() as db:
+                rows = db.query("SELECT txid, n, amount, height FROM outputs WHERE address=:address ORDER BY height",
+                                {'address': address})
+
+            entries = self.cache.pendingEntries(address)
+
+        unspent = [tuple(x) for x in rows if not (x[0], x[1]) in entries]
+        unspent += [(k[0], k[1], v[1], v[2]) for k, v in entries.items() if v[3] == FRESH]
+
+        return sorted(unspent, key=lambda x: x[3])
@@ -0,0 +1,148 @@
+#
+# Part of `python-smartcash`
+#
+# In-memory block time index. Maps timestamps to heights by binary search
+# over the monotonic maximum of the block times.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+
+logger = logging.getLogger("smartcash.blocktime")
+
+#####
+#
+# Block times aren't strictly increasing and the marker rows (meta < 0)
+# have no txtime at all. The index stores for each height the maximum
+# txtime of all heights up to it, which is non-decreasing and gives the
+# markers the time of the block before them. All rows with
+# txtime >= t have a height >= height(t).
+#
+#####
+
+class BlockTimeIndex(object):
+
+    def __init__(self):
+
+        self.start = None
+        self.times = array('q')
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    @property
+    def stop(self):
+        return self.start + len(self.times) if self.start != None else None
+
+    def __len__(self):
+        return len(self.times)
+
+    def load(self, database, chunkSize = 100000):
+
+        with self.lock:
+
+            self.start = None
+            self.times = array('q')
+
+            last = -1
+
+            while True:
+
+                with database.connection as db:
+                    db.cursor.execute("SELECT block, ifnull(txtime,0) FROM rewards WHERE block>? ORDER BY block LIMIT ?",
+                                      (last, chunkSize))
+                    rows = db.cursor.fetchall()
+
+                for row in rows:
+                    self.append(row[0], row[1])
+
+                if len(rows) < chunkSize:
+                    break
+
+                last = rows[-1][0]
+
+            self.loaded = True
+
+        logger.info("load - {} heights".format(len(self.times)))
+
+    def append(self, height, txtime):
+
+        if self.start == None:
+            self.start = height
+
+        if height < self.start:
+            return
+
+        # A height below the top replaces the top down to it.
+        if height < self.stop:
+            del self.times[height - self.start:]
+
+        previous = self.times[-1] if self.times else 0
+
+        # Gaps get the time of the block before them
+        while self.stop < height:
+            self.times.append(previous)
+
+        self.times.append(max(previous, txtime or 0))
+
+    # Forget all heights, the next load reads them again.
+    def reset(self):
+
+        with self.lock:
+            self.start = None
+            self.times = array('q')
+            self.loaded = False
+
+    def add(self, height, txtime):
+
+        with self.lock:
+            if self.loaded:
+                self.append(height, txtime)
+
+    # Drop all heights >= height
+    def truncate(self, height):
+
+        with self.lock:
+            if self.start != None and height < self.stop:
+                del self.times[max(0, height - self.start):]
+
+    # First height whose corrected time is >= timestamp. Returns stop if
+    # there is none yet.
+    def height(self, timestamp):
+
+        with self.lock:
+
+            if self.start == None:
+                return 0
+
+            return self.start + bisect_left(self.times, int(timestamp))
+
+    # Corrected time of height
+    def time(self, height):
+
+        with self.lock:
+
+            if self.start == None or not self.start <= height < self.stop:
+                return None
+
+            return self.times[height - self.start]
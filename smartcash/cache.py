@@ -0,0 +1,183 @@
+#
+# Part of `python-smartcash`
+#
+# Read-through LRU cache for the SNRewardList queries. Entries are dropped
+# when a write touches their payees, heights or time range.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import functools
+import threading
+from collections import OrderedDict
+from smartcash.watchlist import getPayees
+
+# Cached results are shared between the callers, don't modify them.
+
+class CacheEntry(object):
+
+    def __init__(self, value, payees = None, heights = None, times = None, tip = False):
+        self.value = value
+        # Payees the result depends on
+        self.payees = set(payees) if payees != None else None
+        # [start, end) of the heights/txtimes the result depends on, end None is open
+        self.heights = heights
+        self.times = times
+        # Depends on the latest rows, invalidated by every write
+        self.tip = tip
+
+    def matches(self, block, txtime, payees):
+
+        if self.tip:
+            return True
+
+        if self.payees != None and not self.payees.isdisjoint(payees):
+            return True
+
+        for bounds, value in ((self.heights, block), (self.times, txtime)):
+
+            if bounds and value != None and value >= bounds[0] and (bounds[1] == None or value < bounds[1]):
+                return True
+
+        return False
+
+class QueryCache(object):
+
+    def __init__(self, maxSize = 1024):
+
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Incremented by each invalidation, results loaded across one don't get cached.
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # Return the cached result of key or load, cache and return it.
+    def get(self, key, loader, payees = None, heights = None, times = None, tip = False):
+
+        if not self.maxSize:
+            return loader()
+
+        with self.lock:
+
+            if key in self.entries:
+                entry = self.entries.pop(key)
+                self.entries[key] = entry
+                self.hits += 1
+                return entry.value
+
+            self.misses += 1
+            generation = self.generation
+
+        value = loader()
+
+        with self.lock:
+
+            if generation == self.generation:
+
+                self.entries[key] = CacheEntry(value, payees, heights, times, tip)
+
+                while len(self.entries) > self.maxSize:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+
+        return value
+
+    # Call after a write of the row (block, txtime, payee) got committed.
+    def invalidate(self, block = None, txtime = None, payee = None):
+
+        payees = set(getPayees(payee))
+
+        if payee:
+            payees.add(payee)
+
+        with self.lock:
+
+            self.generation += 1
+
+            for key in [k for k, v in self.entries.items() if v.matches(block, txtime, payees)]:
+                del self.entries[key]
+                self.invalidations += 1
+
+    # Call when the committed height advanced.
+    def advance(self):
+
+        with self.lock:
+
+            self.generation += 1
+
+            for key in [k for k, v in self.entries.items() if v.tip]:
+                del self.entries[key]
+                self.invalidations += 1
+
+    def clear(self):
+
+        with self.lock:
+            self.generation += 1
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+
+    def stats(self):
+
+        with self.lock:
+
+            lookups = self.hits + self.misses
+
+            return {'size': len(self.entries),
+                    'maxSize': self.maxSize,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'hitRate': float(self.hits) / lookups if lookups else None,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations}
+
+def freeze(value):
+
+    if isinstance(value, (list, set, frozenset)):
+        return tuple(sorted(value))
+
+    return value
+
+# Decorator for query methods of objects with a QueryCache as `cache` and
+# a `checkExternalWrites` method which drops results other writers made
+# stale. dependencies gets called with the arguments of the method and
+# returns the dependency keywords of QueryCache.get.
+def cached(dependencies):
+
+    def decorator(function):
+
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+
+            key = (function.__name__,
+                   tuple(freeze(x) for x in args),
+                   tuple(sorted((k, freeze(v)) for k, v in kwargs.items())))
+
+            self.checkExternalWrites()
+
+            return self.cache.get(key, lambda: function(self, *args, **kwargs), **dependencies(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
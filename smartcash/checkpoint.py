@@ -0,0 +1,63 @@
+#
+# Part of `python-smartcash`
+#
+# Sync checkpoint, the highest verified reward row and its hash. Kept
+# up to date in the same transactions as the rewards so starting up doesn't
+# need to search the rewards table.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+schema = '\
+CREATE TABLE IF NOT EXISTS "checkpoint" (\
+    `id` INTEGER NOT NULL PRIMARY KEY,\
+    `block` INTEGER NOT NULL,\
+    `hash` TEXT\
+);'
+
+# Move the checkpoint to the verified row if it's above the current one.
+def update(cursor, block, hash):
+
+    cursor.execute("INSERT OR IGNORE INTO checkpoint(id, block, hash) VALUES(1, ?, ?)", (block, hash))
+    cursor.execute("UPDATE checkpoint SET block=?, hash=? WHERE id=1 AND block<=?", (block, hash, block))
+
+# Reset the checkpoint to the highest verified row below fromHeight after
+# the rows from fromHeight on got removed.
+def rollback(cursor, fromHeight):
+
+    row = cursor.connection.execute("SELECT block FROM checkpoint WHERE id=1").fetchone()
+
+    if row and row[0] >= fromHeight:
+        rebuild(cursor)
+
+def rebuild(cursor):
+
+    cursor.execute("DELETE FROM checkpoint")
+    cursor.execute("INSERT INTO checkpoint(id, block, hash) \
+                    SELECT 1, block, hash FROM rewards WHERE verified=1 ORDER BY block DESC LIMIT 1")
+
+# Returns (block, hash) or None if there is no verified row.
+def get(cursor):
+
+    # Own cursor, the given one might have a reward_factory set.
+    row = cursor.connection.execute("SELECT block, hash FROM checkpoint WHERE id=1").fetchone()
+
+    return (row[0], row[1]) if row else None
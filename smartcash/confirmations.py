@@ -0,0 +1,91 @@
+#
+# Part of `python-smartcash`
+#
+# Promotes provisional (verified=0) rewards once their blocks are deep
+# enough or retracts them if they got reorganized out of the chain.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import logging
+from smartcash.stats import STAGE_RPC
+
+logger = logging.getLogger("smartcash.confirmations")
+
+class ConfirmationTracker(object):
+
+    def __init__(self, rewardList, confirmations = 3, batchSize = 100):
+
+        self.rewardList = rewardList
+        self.confirmations = confirmations
+        self.batchSize = batchSize
+
+        self.promoted = 0
+
+    # Check all provisional rows which have the required confirmations with
+    # the chain tip at tipHeight. Returns the number of promoted rows.
+    def update(self, tipHeight):
+
+        rewards = self.rewardList.getUnverifiedRewards(tipHeight - self.confirmations + 1)
+
+        if not rewards:
+            return 0
+
+        confirmed = []
+        forkHeight = None
+
+        for i in range(0, len(rewards), self.batchSize):
+
+            chunk = rewards[i:i + self.batchSize]
+
+            with self.rewardList.stats.timer(STAGE_RPC):
+                hashes = self.rewardList.rpc.batch([('getblockhash', [x.block]) for x in chunk])
+
+            for reward, response in zip(chunk, hashes):
+
+                if response.error:
+                    logger.warning("update getblockhash {} - {}".format(reward.block, response.error))
+                    break
+
+                if reward.hash and reward.hash != response.data:
+                    forkHeight = reward.block
+                    break
+
+                confirmed.append(reward)
+
+            else:
+                continue
+
+            break
+
+        promoted = self.rewardList.promoteRewards(confirmed)
+        self.promoted += len(promoted)
+
+        for reward in promoted:
+            if reward.meta == 0:
+                self.rewardList.notifyReward(reward)
+
+        if forkHeight is not None:
+
+            logger.warning("Provisional reward {} got reorganized".format(forkHeight))
+
+            self.rewardList.handleReorg(forkHeight)
+
+        return len(promoted)
@@ -0,0 +1,317 @@
+#
+# Part of `python-smartcash`
+#
+# Asynchronous delivery of reward and error events through bounded
+# queues and a pool of worker threads.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import copy
+import json
+import zlib
+import logging
+import threading
+from collections import deque
+from smartcash.watchlist import getPayees
+
+logger = logging.getLogger("smartcash.dispatch")
+
+# Backpressure policies if a queue is full
+BLOCK = 'block' # Wait until the workers made room
+DROP_OLDEST = 'drop-oldest' # Drop the oldest queued event
+COALESCE = 'coalesce' # Replace the queued event with the same key or drop the oldest
+
+POLICIES = (BLOCK, DROP_OLDEST, COALESCE)
+
+class SNRewardEvent(object):
+
+    REWARD = 'reward'
+    ERROR = 'error'
+    RETRACT = 'retract'
+    PROVISIONAL = 'provisional'
+    # Match of a watchlist subscription, always goes to its callback
+    WATCH = 'watch'
+
+    def __init__(self, kind, reward = None, distance = None, error = None, subscription = None, payees = None):
+        self.kind = kind
+        self.reward = reward
+        self.distance = distance
+        self.error = error
+        self.subscription = subscription
+        self.payees = payees
+
+    # The sorted payees of the reward, the marker of rows without payee.
+    # Watchlist matches stay in order per subscription.
+    def key(self):
+
+        if self.kind == self.WATCH:
+            return 'watch-{}'.format(self.subscription.id)
+
+        payees = getPayees(self.reward.payee) if self.reward else []
+
+        return ','.join(sorted(payees)) if payees else self.ERROR
+
+    # Rows of multi payee blocks (545005 - 910000) list all payees. Split
+    # into one event per payee with a copy of the reward for it, used by
+    # the fanOut mode of EventDispatcher.
+    def split(self):
+
+        payees = getPayees(self.reward.payee) if self.reward and self.kind != self.WATCH else []
+
+        if len(payees) < 2:
+            return [self]
+
+        events = []
+
+        for payee in payees:
+
+            reward = copy.copy(self.reward)
+            reward.payee = json.dumps([payee])
+
+            events.append(SNRewardEvent(self.kind, reward=reward, distance=self.distance, error=self.error))
+
+        return events
+
+    def __str__(self):
+        return '{} - {}'.format(self.kind, self.reward if self.reward else self.error)
+
+class DispatchQueue(object):
+
+    def __init__(self, maxSize, policy):
+
+        self.maxSize = maxSize
+        self.policy = policy
+        self.events = deque()
+        self.condition = threading.Condition()
+
+        self.dropped = 0
+        self.coalesced = 0
+
+    def put(self, event, running):
+
+        with self.condition:
+
+            if len(self.events) >= self.maxSize:
+
+                if self.policy == BLOCK:
+
+                    while len(self.events) >= self.maxSize and running():
+                        self.condition.wait(1)
+
+                elif self.policy == COALESCE and self.coalesce(event):
+                    return
+
+                else:
+                    self.events.popleft()
+                    self.dropped += 1
+
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def coalesce(self, event):
+
+        key = event.key()
+
+        for i in range(len(self.events) - 1, -1, -1):
+
+            if self.events[i].kind == event.kind and self.events[i].key() == key:
+                self.events[i] = event
+                self.coalesced += 1
+                return True
+
+        return False
+
+    def take(self, maxCount, running):
+
+        with self.condition:
+
+            while not self.events and running():
+                self.condition.wait(1)
+
+            events = []
+
+            while self.events and len(events) < maxCount:
+                events.append(self.events.popleft())
+
+            self.condition.notify_all()
+
+            return events
+
+    def __len__(self):
+        return len(self.events)
+
+class EventDispatcher(object):
+
+    def __init__(self, rewardCB = None, errorCB = None, batchCB = None,
+                 workers = 1, maxSize = 1000, policy = BLOCK, batchSize = 100, retractCB = None,
+                 provisionalCB = None, fanOut = False):
+
+        if not policy in POLICIES:
+            raise ValueError("Invalid backpressure policy {}".format(policy))
+
+        self.rewardCB = rewardCB
+        self.errorCB = errorCB
+        self.retractCB = retractCB
+        self.provisionalCB = provisionalCB
+        self.batchCB = batchCB
+        self.batchSize = batchSize if batchCB else 1
+        # Deliver multi payee rewards once per payee, see put
+        self.fanOut = fanOut
+
+        self.running = False
+        self.queues = [DispatchQueue(maxSize, policy) for _ in range(max(1, workers))]
+        self.threads = []
+
+        self.lock = threading.Lock()
+        self.delivered = 0
+        self.failed = 0
+
+    def start(self):
+
+        if self.running:
+            return
+
+        self.running = True
+
+        for queue in self.queues:
+            thread = threading.Thread(target=self.work, args=(queue,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    # Stop the workers after they delivered all queued events.
+    def stop(self, timeout = None):
+
+        self.running = False
+
+        for queue in self.queues:
+            with queue.condition:
+                queue.condition.notify_all()
+
+        for thread in self.threads:
+            thread.join(timeout)
+
+        self.threads = []
+
+    def isRunning(self):
+        return self.running
+
+    # Events with the same key always end up in the same queue. That keeps
+    # the order of the events of one payee for single payee blocks and of
+    # one payee set for multi payee blocks. With fanOut the multi payee
+    # rewards get delivered once per payee, as a copy with only that payee,
+    # which keeps the order per payee across all blocks. With one worker
+    # the events are always in order.
+    def put(self, event):
+
+        for single in (event.split() if self.fanOut else [event]):
+
+            key = single.key().encode('utf8')
+            queue = self.queues[zlib.crc32(key) % len(self.queues)]
+
+            queue.put(single, self.isRunning)
+
+    def reward(self, reward, distance):
+        self.put(SNRewardEvent(SNRewardEvent.REWARD, reward=reward, distance=distance))
+
+    def error(self, error):
+        self.put(SNRewardEvent(SNRewardEvent.ERROR, error=error))
+
+    def retract(self, reward):
+        self.put(SNRewardEvent(SNRewardEvent.RETRACT, reward=reward))
+
+    def provisional(self, reward, distance):
+        self.put(SNRewardEvent(SNRewardEvent.PROVISIONAL, reward=reward, distance=distance))
+
+    def watch(self, subscription, reward, payees, distance):
+        self.put(SNRewardEvent(SNRewardEvent.WATCH, reward=reward, distance=distance,
+                               subscription=subscription, payees=payees))
+
+    def work(self, queue):
+
+        while self.running or len(queue):
+
+            events = queue.take(self.batchSize, self.isRunning)
+
+            if events:
+                self.deliver(events)
+
+    def deliver(self, events):
+
+        watched = [x for x in events if x.kind == SNRewardEvent.WATCH]
+
+        if watched:
+
+            events = [x for x in events if x.kind != SNRewardEvent.WATCH]
+
+            for event in watched:
+                self.deliverWatch(event)
+
+            if not events:
+                return
+
+        try:
+
+            if self.batchCB:
+                self.batchCB(events)
+            else:
+                for event in events:
+                    if event.kind == SNRewardEvent.REWARD and self.rewardCB:
+                        self.rewardCB(event.reward, event.distance)
+                    elif event.kind == SNRewardEvent.ERROR and self.errorCB:
+                        self.errorCB(event.error)
+                    elif event.kind == SNRewardEvent.RETRACT and self.retractCB:
+                        self.retractCB(event.reward)
+                    elif event.kind == SNRewardEvent.PROVISIONAL and self.provisionalCB:
+                        self.provisionalCB(event.reward, event.distance)
+
+            with self.lock:
+                self.delivered += len(events)
+
+        except Exception as e:
+
+            with self.lock:
+                self.failed += len(events)
+
+            logger.error("deliver", exc_info=e)
+
+    def deliverWatch(self, event):
+
+        try:
+
+            event.subscription.callback(event.reward, event.payees, event.distance)
+
+            with self.lock:
+                self.delivered += 1
+
+        except Exception as e:
+
+            with self.lock:
+                self.failed += 1
+
+            logger.error("deliver {}".format(event.subscription), exc_info=e)
+
+    def stats(self):
+        return {'queued': sum(len(x) for x in self.queues),
+                'delivered': self.delivered,
+                'failed': self.failed,
+                'dropped': sum(x.dropped for x in self.queues),
+                'coalesced': sum(x.coalesced for x in self.queues)}
@@ -0,0 +1,375 @@
+#
+# Part of `python-smartcash`
+#
+# Chunked columnar export/import of the rewards table to NumPy
+# arrays, Arrow record batches and Parquet files.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import re
+import json
+import hashlib
+import logging
+from smartcash import rollups, checkpoint
+from smartcash.util import COIN, toSatoshis
+
+# NumPy and PyArrow are loaded on the first use, see requireNumpy()
+# and requireArrow().
+np = None
+pa = None
+pq = None
+
+logger = logging.getLogger("smartcash.export")
+
+columns = ['block', 'txtime', 'payee', 'amount', 'source', 'meta', 'verified', 'hash', 'prevhash']
+
+numpyTypes = [('block', 'int32'),
+              ('txtime', 'int64'),
+              ('payee', 'object'),
+              ('amount', 'int64'),
+              ('source', 'int32'),
+              ('meta', 'int8'),
+              ('verified', 'int8'),
+              ('hash', 'object'),
+              ('prevhash', 'object')]
+
+# Parts of a parquet export directory are named after the block range they cover.
+partPattern = re.compile(r'^part-(\d+)-(\d+)\.parquet$')
+
+def requireNumpy():
+
+    global np
+
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError("NumPy is required for this export, install it with `pip install numpy`")
+
+def requireArrow():
+
+    global pa, pq
+
+    if pa is None:
+        try:
+            import pyarrow.parquet as pq
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("PyArrow is required for this export, install it with `pip install pyarrow`")
+
+def arrowSchema():
+
+    requireArrow()
+
+    return pa.schema([('block', pa.int32()),
+                      ('txtime', pa.int64()),
+                      ('payee', pa.string()),
+                      ('amount', pa.int64()),
+                      ('source', pa.int32()),
+                      ('meta', pa.int8()),
+                      ('verified', pa.int8()),
+                      ('hash', pa.string()),
+                      ('prevhash', pa.string())])
+
+# Yield the rows of the rewards table with fromBlock <= block < toBlock
+# in block order as lists of tuples. The database lock is only held
+# while a single chunk gets fetched.
+def iterChunks(database, fromBlock = None, toBlock = None, chunkSize = 100000):
+
+    last = (fromBlock - 1) if fromBlock != None else -1
+
+    query = "SELECT block, ifnull(txtime,0), payee, ifnull(amount,0), ifnull(source,0), \
+             ifnull(meta,0), ifnull(verified,0), hash, prevhash FROM rewards WHERE block>? "
+
+    if toBlock != None:
+        query += "AND block<{} ".format(int(toBlock))
+
+    query += "ORDER BY block LIMIT ?"
+
+    while True:
+
+        with database.connection as db:
+            db.cursor.execute(query, (last, chunkSize))
+            rows = [tuple(row) for row in db.cursor.fetchall()]
+
+        if not rows:
+            break
+
+        yield rows
+
+        if len(rows) < chunkSize:
+            break
+
+        last = rows[-1][0]
+
+def countRows(database, fromBlock = None, toBlock = None):
+
+    query = "SELECT count(*) FROM rewards WHERE block>=? "
+    args = (fromBlock if fromBlock != None else 0,)
+
+    if toBlock != None:
+        query += "AND block<?"
+        args += (toBlock,)
+
+    with database.connection as db:
+        db.cursor.execute(query, args)
+        return db.cursor.fetchone()[0]
+
+# Export into a dict of typed NumPy arrays, one per column. The string
+# columns (payee and the hashes) are object arrays and only included if requested.
+def toNumpy(database, fromBlock = None, toBlock = None, chunkSize = 100000, strings = False):
+
+    requireNumpy()
+
+    dtype = np.dtype(numpyTypes)
+    result = np.empty(countRows(database, fromBlock, toBlock), dtype=dtype)
+    position = 0
+
+    for rows in iterChunks(database, fromBlock, toBlock, chunkSize):
+
+        # Rows added while exporting don't fit into the preallocated array.
+        rows = rows[:len(result) - position]
+
+        result[position:position + len(rows)] = np.array(rows, dtype=dtype)
+        position += len(rows)
+
+        if position == len(result):
+            break
+
+    result = result[:position]
+
+    return {name: result[name] for name, kind in numpyTypes if strings or kind != 'object'}
+
+def toRecordBatches(database, fromBlock = None, toBlock = None, chunkSize = 100000):
+
+    schema = arrowSchema()
+
+    for rows in iterChunks(database, fromBlock, toBlock, chunkSize):
+
+        data = list(zip(*rows))
+
+        yield pa.RecordBatch.from_arrays([pa.array(data[i], type=schema.field(i).type)
+                                            for i in range(len(columns))], schema=schema)
+
+def writeParquet(database, path, fromBlock = None, toBlock = None, chunkSize = 100000):
+
+    rows = 0
+    writer = None
+
+    try:
+
+        for batch in toRecordBatches(database, fromBlock, toBlock, chunkSize):
+
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema)
+
+            writer.write_table(pa.Table.from_batches([batch]))
+            rows += batch.num_rows
+
+    finally:
+
+        if writer is not None:
+            writer.close()
+
+    return rows
+
+def lastExportedBlock(directory):
+
+    last = None
+
+    if os.path.isdir(directory):
+
+        for name in os.listdir(directory):
+
+            match = partPattern.match(name)
+
+            if match and (last is None or int(match.group(2)) > last):
+                last = int(match.group(2))
+
+    return last
+
+# Digests of the exported rows of each part, name -> digest.
+MANIFEST = 'manifest.json'
+
+def readManifest(directory):
+
+    path = os.path.join(directory, MANIFEST)
+
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+def writeManifest(directory, manifest):
+
+    path = os.path.join(directory, MANIFEST)
+
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    os.rename(path + '.tmp', path)
+
+def rowsDigest(database, fromBlock, toBlock, chunkSize = 100000):
+
+    digest = hashlib.sha256()
+
+    for rows in iterChunks(database, fromBlock, toBlock, chunkSize):
+        for row in rows:
+            digest.update(repr(row).encode('utf8'))
+
+    return digest.hexdigest()
+
+# Export the rows first <= block <= last into the part of that range. The
+# digest gets taken before the rows are written, rows which change in
+# between only lead to one more export of the part.
+def writePart(database, directory, first, last, manifest, chunkSize = 100000):
+
+    name = 'part-{}-{}.parquet'.format(first, last)
+    path = os.path.join(directory, name)
+
+    # Export to a temporary file first to never leave a partial part behind.
+    digest = rowsDigest(database, first, last + 1, chunkSize)
+    rows = writeParquet(database, path + '.tmp', first, last + 1, chunkSize)
+
+    os.rename(path + '.tmp', path)
+    manifest[name] = digest
+
+    logger.info("exportParquet - {} rows to {}".format(rows, path))
+
+    return path
+
+# Export the rows to the parquet dataset in `directory`. Parts whose rows
+# changed since they got exported (repairs, reorgs, promoted rows) are
+# rewritten, all rows added since the last export get appended as a new
+# part. Returns the paths of the written parts.
+def exportParquet(database, directory, chunkSize = 100000):
+
+    requireArrow()
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    manifest = readManifest(directory)
+    written = []
+
+    # Parts of exports without manifest are rewritten once.
+    for name in sorted(x for x in os.listdir(directory) if partPattern.match(x)):
+
+        first, last = [int(x) for x in partPattern.match(name).groups()]
+
+        if manifest.get(name) != rowsDigest(database, first, last + 1, chunkSize):
+            written.append(writePart(database, directory, first, last, manifest, chunkSize))
+
+    last = lastExportedBlock(directory)
+    fromBlock = last + 1 if last != None else 0
+
+    with database.connection as db:
+        db.cursor.execute("SELECT max(block) FROM rewards")
+        toBlock = db.cursor.fetchone()[0]
+
+    if toBlock != None and toBlock >= fromBlock:
+        written.append(writePart(database, directory, fromBlock, toBlock, manifest, chunkSize))
+    elif not written:
+        logger.info("exportParquet - nothing to export since {}".format(last))
+
+    writeManifest(directory, manifest)
+
+    return written
+
+def insertRows(database, names, rows, chunkSize = 100000):
+
+    query = "INSERT OR IGNORE INTO rewards({}) values({})".format(', '.join(names), ', '.join('?' for _ in names))
+
+    inserted = 0
+
+    for i in range(0, len(rows), chunkSize):
+
+        with database.connection as db:
+            db.cursor.executemany(query, rows[i:i + chunkSize])
+            inserted += db.cursor.rowcount
+
+    return inserted
+
+# Import a parquet file or an export directory. Existing rows are kept.
+def importParquet(database, path, chunkSize = 100000):
+
+    requireArrow()
+
+    if os.path.isdir(path):
+        files = sorted((os.path.join(path, name) for name in os.listdir(path) if partPattern.match(name)),
+                       key=lambda x: int(partPattern.match(os.path.basename(x)).group(1)))
+    else:
+        files = [path]
+
+    inserted = 0
+
+    for fileName in files:
+
+        parquet = pq.ParquetFile(fileName)
+
+        # Exports of older versions don't have all columns
+        names = [x for x in columns if x in parquet.schema_arrow.names]
+
+        # and have the amounts in SMART as float
+        coins = pa.types.is_floating(parquet.schema_arrow.field('amount').type) if 'amount' in names else False
+
+        for batch in parquet.iter_batches(batch_size=chunkSize, columns=names):
+            data = [batch.column(i).to_pylist() for i in range(len(names))]
+
+            if coins:
+                data[names.index('amount')] = [toSatoshis(x) if x is not None else None for x in data[names.index('amount')]]
+
+            inserted += insertRows(database, names, list(zip(*data)), chunkSize)
+
+    rebuildRollups(database)
+
+    return inserted
+
+def importNumpy(database, arrays, chunkSize = 100000):
+
+    requireNumpy()
+
+    if not 'payee' in arrays:
+        raise ValueError("importNumpy - payee column required")
+
+    names = [x for x in columns if x in arrays]
+    data = [arrays[name].tolist() for name in names]
+
+    # Float amounts are in SMART
+    if 'amount' in arrays and arrays['amount'].dtype.kind == 'f':
+        data[names.index('amount')] = np.rint(arrays['amount'] * COIN).astype(np.int64).tolist()
+
+    inserted = insertRows(database, names, list(zip(*data)), chunkSize)
+
+    rebuildRollups(database)
+
+    return inserted
+
+# Rebuild the aggregates after rows got imported
+def rebuildRollups(database):
+
+    with database.connection as db:
+        rollups.rebuild(db.cursor)
+        checkpoint.rebuild(db.cursor)
+
+    database.notifyWrite()
@@ -0,0 +1,514 @@
+#
+# Part of `python-smartcash`
+#
+# Fixed width, memory mapped reward store indexed by the block height.
+# Each height has one record at index height - start, payee strings are
+# kept in an append-only side table and referenced by their id.
+#
+# It's a read replica for lookups and range analytics, not a backend of
+# SNRewardList and it doesn't implement its interface. SNRewardList keeps
+# writing the SQLite database, sync() appends its new rows and follows
+# reorgs by their block hashes. The read methods with the same names
+# return the same as the ones of SNRewardList.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import json
+import logging
+import binascii
+from threading import Lock
+from smartcash import export
+from smartcash.schedule import FIRST_REWARD_HEIGHT
+from smartcash.rewardlist import SNReward
+from smartcash.watchlist import getPayees
+
+np = None
+
+logger = logging.getLogger("smartcash.mmapstore")
+
+# Version 2 has the amounts in satoshis, version 3 the block hashes
+VERSION = 3
+
+DATA_FILE = 'rewards.bin'
+PAYEES_FILE = 'payees.txt'
+HEADER_FILE = 'header.json'
+
+# One record per height, 88 bytes. Missing hashes are all zero.
+recordType = [('txtime', '<i8'),
+              ('amount', '<i8'),
+              ('payee', '<i4'),
+              ('meta', 'i1'),
+              ('source', 'i1'),
+              ('verified', 'i1'),
+              ('reserved', 'u1'),
+              ('hash', 'V32'),
+              ('prevhash', 'V32')]
+
+EMPTY_HASH = b'\0' * 32
+
+def requireNumpy():
+
+    global np
+
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError("NumPy is required for the mapped reward store, install it with `pip install numpy`")
+
+def packHash(value):
+
+    if not value:
+        return EMPTY_HASH
+
+    try:
+        raw = binascii.unhexlify(value)
+    except (TypeError, ValueError):
+        raw = b''
+
+    if len(raw) != 32:
+        raise StoreError("Invalid block hash {}".format(value))
+
+    return raw
+
+def unpackHash(value):
+
+    raw = bytes(value)
+
+    return binascii.hexlify(raw).decode('ascii') if raw != EMPTY_HASH else None
+
+class StoreError(Exception):
+    pass
+
+def fsyncDirectory(directory):
+
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+# A row of export.iterChunks like the store returns it
+def storedRow(row):
+    return (row[0], row[1] or 0, row[2] or '', row[3] or 0, row[4] or 0, row[5] or 0, row[6] or 0,
+            row[7] or None, row[8] or None)
+
+#####
+#
+# The header holds the committed number of records and payees. Appends
+# write the records and payees behind the committed ones first, sync
+# them and then replace the header atomically. Everything behind the
+# committed counts is left over from an interrupted append and gets
+# overwritten.
+#
+#####
+
+class MappedRewardStore(object):
+
+    def __init__(self, directory, start = FIRST_REWARD_HEIGHT, growBy = 65536):
+
+        requireNumpy()
+
+        self.directory = directory
+        self.growBy = growBy
+        self.lock = Lock()
+        self.dtype = np.dtype(recordType)
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        header = self.readHeader()
+
+        if header:
+
+            if header['version'] != VERSION:
+                raise StoreError("Unsupported store version {}".format(header['version']))
+
+            self.start = header['start']
+            self.count = header['records']
+            payeeCount = header['payees']
+
+        else:
+            self.start = start
+            self.count = 0
+            payeeCount = 0
+
+        self.payees = []
+        self.payeeIds = {}
+        # Single payee -> ids of the payee entries which contain it
+        self.payeeIndex = {}
+
+        self.loadPayees(payeeCount)
+        self.payeesFile = open(self.path(PAYEES_FILE), 'ab')
+
+        if not os.path.exists(self.path(DATA_FILE)):
+            open(self.path(DATA_FILE), 'wb').close()
+
+        self.records = None
+        self.capacity = 0
+        self.reserve(max(self.count, 1))
+
+        if not header:
+            self.writeHeader(self.start, 0, 0)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def readHeader(self):
+
+        try:
+            with open(self.path(HEADER_FILE), 'r') as f:
+                return json.load(f)
+        except IOError:
+            return None
+
+    def writeHeader(self, start, records, payees):
+
+        tmpPath = self.path(HEADER_FILE + '.tmp')
+
+        with open(tmpPath, 'w') as f:
+            json.dump({'version': VERSION, 'start': start, 'records': records, 'payees': payees}, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.rename(tmpPath, self.path(HEADER_FILE))
+        fsyncDirectory(self.directory)
+
+    # Read the committed payees and cut off the rest of the file
+    def loadPayees(self, payeeCount):
+
+        path = self.path(PAYEES_FILE)
+
+        if not os.path.exists(path):
+            open(path, 'wb').close()
+
+        size = 0
+
+        with open(path, 'r+b') as f:
+
+            for line in f:
+
+                if len(self.payees) == payeeCount or not line.endswith(b'\n'):
+                    break
+
+                self.addPayee(line[:-1].decode('utf8'))
+                size += len(line)
+
+            if len(self.payees) != payeeCount:
+                raise StoreError("Payee table has {} of {} entries".format(len(self.payees), payeeCount))
+
+            f.truncate(size)
+
+    def addPayee(self, payee):
+
+        id = len(self.payees)
+
+        self.payeeIds[payee] = id
+        self.payees.append(payee)
+
+        for single in getPayees(payee):
+            self.payeeIndex.setdefault(single, []).append(id)
+
+    # Make sure the data file has room for count records
+    def reserve(self, count):
+
+        if count <= self.capacity:
+            return
+
+        capacity = max(count, self.capacity + self.growBy)
+
+        if self.records is not None:
+            self.records.flush()
+
+        with open(self.path(DATA_FILE), 'r+b') as f:
+            f.seek(0, os.SEEK_END)
+
+            if f.tell() < capacity * self.dtype.itemsize:
+                f.truncate(capacity * self.dtype.itemsize)
+
+        # Views of the old mapping stay valid, the file only grows.
+        self.records = np.memmap(self.path(DATA_FILE), dtype=self.dtype, mode='r+', shape=(capacity,))
+        self.capacity = capacity
+
+    def close(self):
+
+        with self.lock:
+
+            if self.records is not None:
+                self.records.flush()
+                self.records = None
+
+            self.payeesFile.close()
+
+    @property
+    def stop(self):
+        return self.start + self.count
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, height):
+        return self.start <= height < self.stop
+
+    #####
+    #
+    # Writing
+    #
+    #####
+
+    # Append rows in export.columns order, they need to continue at stop
+    # without gaps.
+    def appendRows(self, rows):
+
+        if not rows:
+            return 0
+
+        with self.lock:
+
+            blocks = np.fromiter((x[0] for x in rows), dtype=np.int64, count=len(rows))
+
+            if not self.count and self.start != blocks[0]:
+                # The first append decides where an empty store starts.
+                self.start = int(blocks[0])
+
+            if blocks[0] != self.stop or np.any(np.diff(blocks) != 1):
+                raise StoreError("Rows {} - {} don't continue the store at {}".format(blocks[0], blocks[-1], self.stop))
+
+            newPayees = []
+            ids = {}
+
+            def payeeId(payee):
+
+                payee = payee or ''
+
+                if payee in self.payeeIds:
+                    return self.payeeIds[payee]
+
+                if not payee in ids:
+                    ids[payee] = len(self.payees) + len(newPayees)
+                    newPayees.append(payee)
+
+                return ids[payee]
+
+            first = self.count
+            last = first + len(rows)
+
+            self.reserve(last)
+
+            chunk = self.records[first:last]
+            chunk['txtime'] = [x[1] or 0 for x in rows]
+            chunk['payee'] = [payeeId(x[2]) for x in rows]
+            chunk['amount'] = [x[3] or 0 for x in rows]
+            chunk['source'] = [x[4] or 0 for x in rows]
+            chunk['meta'] = [x[5] or 0 for x in rows]
+            chunk['verified'] = [x[6] or 0 for x in rows]
+            chunk['reserved'] = 0
+            chunk['hash'] = [packHash(x[7]) for x in rows]
+            chunk['prevhash'] = [packHash(x[8]) for x in rows]
+
+            if newPayees:
+                self.payeesFile.write(''.join(x.replace('\n', ' ') + '\n' for x in newPayees).encode('utf8'))
+                self.payeesFile.flush()
+                os.fsync(self.payeesFile.fileno())
+
+            self.records.flush()
+
+            self.writeHeader(self.start, last, len(self.payees) + len(newPayees))
+
+            self.count = last
+
+            for payee in newPayees:
+                self.addPayee(payee)
+
+        return len(rows)
+
+    def addReward(self, reward):
+
+        try:
+            return self.appendRows([tuple(getattr(reward, x) for x in export.columns)]) == 1
+        except StoreError as e:
+            logger.warning("addReward - {}".format(e))
+
+        return False
+
+    # Drop all records with block >= fromHeight, returns the dropped rewards.
+    def removeRewards(self, fromHeight):
+
+        with self.lock:
+
+            count = max(0, min(self.count, fromHeight - self.start))
+
+            rewards = [self.reward(self.start + i) for i in range(count, self.count)]
+
+            if count != self.count:
+                self.writeHeader(self.start, count, len(self.payees))
+                self.count = count
+
+        return rewards
+
+    # First height of the last `depth` records which differs from the
+    # database, stop if they all match.
+    def findFork(self, database, depth = 1000):
+
+        height = max(self.start, self.stop - depth)
+
+        for rows in export.iterChunks(database, height, self.stop):
+
+            for row in rows:
+
+                if row[0] != height or self.row(height) != storedRow(row):
+                    return height
+
+                height += 1
+
+        return height
+
+    # Append the rows of the SQLite database behind the stored ones. Stops
+    # at the first gap. The last `depth` records get compared first and
+    # dropped from the first difference on, rows rewritten below them (the
+    # repair tool) need a sync with fromHeight. Returns the number of
+    # appended rows.
+    def sync(self, database, chunkSize = 100000, depth = 1000, fromHeight = None):
+
+        if self.count:
+
+            fork = self.findFork(database, depth)
+
+            if fromHeight != None:
+                fork = min(fork, fromHeight)
+
+            if fork < self.stop:
+                logger.info("sync - drop {} records from {}".format(self.stop - fork, fork))
+                self.removeRewards(fork)
+
+        appended = 0
+        fromBlock = self.stop if self.count else None
+
+        for rows in export.iterChunks(database, fromBlock, chunkSize=chunkSize):
+
+            expected = self.stop if self.count else rows[0][0]
+            gap = False
+
+            for i, row in enumerate(rows):
+                if row[0] != expected + i:
+                    rows = rows[:i]
+                    gap = True
+                    break
+
+            appended += self.appendRows(rows)
+
+            if gap:
+                logger.warning("sync - gap after {}".format(self.stop - 1))
+                break
+
+        return appended
+
+    #####
+    #
+    # Reading
+    #
+    #####
+
+    # Zero-copy NumPy view of the records start <= height < stop
+    def view(self, start = None, stop = None):
+
+        first = 0 if start is None else min(max(start - self.start, 0), self.count)
+        last = self.count if stop is None else min(max(stop - self.start, first), self.count)
+
+        return self.records[first:last]
+
+    def heights(self, start = None, stop = None):
+
+        first = self.start if start is None else max(start, self.start)
+
+        return np.arange(first, first + len(self.view(start, stop)), dtype=np.int64)
+
+    def payee(self, id):
+        return self.payees[id]
+
+    # Record of height in export.columns order
+    def row(self, height):
+
+        record = self.records[height - self.start]
+
+        return (height,
+                int(record['txtime']),
+                self.payees[record['payee']],
+                int(record['amount']),
+                int(record['source']),
+                int(record['meta']),
+                int(record['verified']),
+                unpackHash(record['hash']),
+                unpackHash(record['prevhash']))
+
+    def reward(self, height):
+        return SNReward(**dict(zip(export.columns, self.row(height))))
+
+    def getReward(self, block):
+
+        if not block in self:
+            return None
+
+        return self.reward(block)
+
+    def getLastReward(self):
+
+        verified = np.flatnonzero(self.view()['verified'] == 1)
+
+        return self.reward(self.start + int(verified[-1])) if len(verified) else None
+
+    # (block, hash) of the last verified record or None.
+    def getCheckpoint(self):
+
+        reward = self.getLastReward()
+
+        return (reward.block, reward.hash) if reward else None
+
+    # Rewards of blocks which paid the payee, alone or with others, like
+    # SNRewardList.getRewardsForPayee. Its block >= getHeightAt(start)
+    # condition holds for all rows with txtime >= start.
+    def getRewards(self, payee, start = None):
+
+        if not payee in self.payeeIndex:
+            return []
+
+        records = self.view()
+        mask = np.isin(records['payee'], self.payeeIndex[payee])
+
+        if start:
+            mask &= records['txtime'] >= int(start)
+
+        return [self.reward(self.start + int(x)) for x in np.flatnonzero(mask)]
+
+    # Count and amount sum of the rows start <= height < stop
+    def getHeightStats(self, start = None, stop = None, meta = 0):
+
+        records = self.view(start, stop)
+        mask = records['meta'] == meta
+
+        return {'count': int(np.count_nonzero(mask)), 'amount': int(records['amount'][mask].sum())}
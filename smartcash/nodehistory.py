@@ -0,0 +1,294 @@
+#
+# Part of `python-smartcash`
+#
+# History of the smartnode list. Stores one baseline and the per poll
+# deltas keyed by height, with periodic checkpoints to rebuild old lists.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import time
+import json
+import zlib
+import logging
+from smartcash.util import ThreadedSQLite
+
+logger = logging.getLogger("smartcash.nodehistory")
+
+# Fields of the `smartnode list full` entries
+FULL_FIELDS = ['status', 'protocol', 'payee', 'lastseen', 'activeseconds', 'lastpaidtime', 'lastpaidblock', 'ip']
+
+# Fields which change with every poll. Changes of only them don't get
+# stored as delta, they are exact at the checkpoints and other changes.
+VOLATILE_FIELDS = ('lastseen', 'activeseconds')
+
+# Kinds of the deltas
+ADDED = 1
+REMOVED = 2
+CHANGED = 3
+
+# Turn a list entry into a dict of fields
+def parseEntry(value, mode = 'full'):
+
+    if isinstance(value, dict):
+        return dict(value)
+
+    if mode == 'full' and isinstance(value, str):
+
+        parts = value.split()
+
+        if len(parts) == len(FULL_FIELDS):
+
+            fields = dict(zip(FULL_FIELDS, parts))
+
+            for field in ('protocol', 'lastseen', 'activeseconds', 'lastpaidtime', 'lastpaidblock'):
+                try:
+                    fields[field] = int(fields[field])
+                except ValueError:
+                    pass
+
+            return fields
+
+    return {'value': value}
+
+# Delta from the fields old to new, removed fields are None.
+def diffFields(old, new):
+
+    changed = {k: v for k, v in new.items() if old.get(k) != v}
+
+    for k in old:
+        if not k in new:
+            changed[k] = None
+
+    return changed
+
+def applyFields(fields, changed):
+
+    fields = dict(fields)
+
+    for k, v in changed.items():
+        if v is None:
+            fields.pop(k, None)
+        else:
+            fields[k] = v
+
+    return fields
+
+class SmartNodeHistory(object):
+
+    def __init__(self, dbPath, checkpointInterval = 100, volatile = VOLATILE_FIELDS):
+
+        self.checkpointInterval = checkpointInterval
+        self.volatile = set(volatile)
+        self.connection = ThreadedSQLite(dbPath)
+
+        with self.connection as db:
+            db.cursor.executescript('\
+            CREATE TABLE IF NOT EXISTS "polls" (\
+                `id` INTEGER NOT NULL PRIMARY KEY,\
+                `height` INTEGER NOT NULL,\
+                `time` INTEGER NOT NULL,\
+                `changes` INTEGER NOT NULL\
+            );\
+            CREATE INDEX IF NOT EXISTS "polls_height" ON "polls" (`height`);\
+            CREATE TABLE IF NOT EXISTS "deltas" (\
+                `poll` INTEGER NOT NULL,\
+                `node` TEXT NOT NULL,\
+                `kind` INTEGER NOT NULL,\
+                `fields` TEXT\
+            );\
+            CREATE INDEX IF NOT EXISTS "deltas_node" ON "deltas" (`node`, `poll`);\
+            CREATE INDEX IF NOT EXISTS "deltas_poll" ON "deltas" (`poll`);\
+            CREATE TABLE IF NOT EXISTS "checkpoints" (\
+                `poll` INTEGER NOT NULL PRIMARY KEY,\
+                `data` BLOB NOT NULL\
+            );')
+
+        # Latest list as {node: fields}
+        self.current = {}
+        self.lastPoll = None
+
+        latest = self.getLastPoll()
+
+        if latest:
+            self.lastPoll = latest['id']
+            self.current = self.rebuild(latest['id'])
+
+    def getLastPoll(self):
+
+        with self.connection as db:
+            db.cursor.execute("SELECT * FROM polls ORDER BY id DESC LIMIT 1")
+            row = db.cursor.fetchone()
+
+        return dict(row) if row else None
+
+    # Store the list nodes ({node: entry}) polled at height. Returns the number of changes.
+    def add(self, height, nodes, mode = 'full', timestamp = None):
+
+        nodes = {k: parseEntry(v, mode) for k, v in nodes.items()}
+
+        deltas = []
+        # The list as it can be rebuilt from the stored deltas
+        stored = {}
+
+        for node, fields in nodes.items():
+
+            stored[node] = fields
+
+            if not node in self.current:
+                deltas.append((node, ADDED, json.dumps(fields, sort_keys=True)))
+            else:
+
+                changed = diffFields(self.current[node], fields)
+
+                if changed and not set(changed) <= self.volatile:
+                    deltas.append((node, CHANGED, json.dumps(changed, sort_keys=True)))
+                elif changed:
+                    stored[node] = self.current[node]
+
+        for node in self.current:
+            if not node in nodes:
+                deltas.append((node, REMOVED, None))
+
+        with self.connection as db:
+
+            db.cursor.execute("INSERT INTO polls(height, time, changes) VALUES(?, ?, ?)",
+                              (height, int(timestamp if timestamp != None else time.time()), len(deltas)))
+            poll = db.cursor.lastrowid
+
+            db.cursor.executemany("INSERT INTO deltas(poll, node, kind, fields) VALUES(?, ?, ?, ?)",
+                                  [(poll,) + x for x in deltas])
+
+            # The first poll is the baseline
+            if self.lastPoll is None or poll % self.checkpointInterval == 0:
+
+                db.cursor.execute("INSERT INTO checkpoints(poll, data) VALUES(?, ?)",
+                                  (poll, zlib.compress(json.dumps(nodes, sort_keys=True).encode('utf8'))))
+                stored = nodes
+
+        self.current = stored
+        self.lastPoll = poll
+
+        return len(deltas)
+
+    # Poll the list from the node and store it.
+    def poll(self, rpc, mode = 'full'):
+
+        count = rpc.raw('getblockcount', [])
+
+        if count.error:
+            logger.error("poll getblockcount - {}".format(count.error))
+            return None
+
+        nodes = rpc.getSmartNodeList(mode)
+
+        if nodes.error:
+            logger.error("poll getSmartNodeList - {}".format(nodes.error))
+            return None
+
+        return self.add(count.data, nodes.data, mode)
+
+    # List after the poll from the closest checkpoint before it.
+    def rebuild(self, poll):
+
+        with self.connection as db:
+
+            db.cursor.execute("SELECT * FROM checkpoints WHERE poll<=? ORDER BY poll DESC LIMIT 1", (poll,))
+            checkpoint = db.cursor.fetchone()
+
+            if not checkpoint:
+                return {}
+
+            nodes = json.loads(zlib.decompress(checkpoint['data']).decode('utf8'))
+
+            db.cursor.execute("SELECT node, kind, fields FROM deltas WHERE poll>? AND poll<=? ORDER BY poll",
+                              (checkpoint['poll'], poll))
+            deltas = db.cursor.fetchall()
+
+        for node, kind, fields in deltas:
+
+            if kind == ADDED:
+                nodes[node] = json.loads(fields)
+            elif kind == REMOVED:
+                nodes.pop(node, None)
+            else:
+                nodes[node] = applyFields(nodes.get(node, {}), json.loads(fields))
+
+        return nodes
+
+    # Returns (poll height, {node: fields}) of the last poll at or before
+    # height or (None, None) if there is none.
+    def getSnapshot(self, height):
+
+        with self.connection as db:
+            db.cursor.execute("SELECT id, height FROM polls WHERE height<=? ORDER BY height DESC, id DESC LIMIT 1", (height,))
+            row = db.cursor.fetchone()
+
+        if not row:
+            return None, None
+
+        return row['height'], self.rebuild(row['id'])
+
+    # Fields of the node after each of its changes as a list of
+    # (height, time, fields) where fields is None after a removal.
+    def getNodeHistory(self, node, fromHeight = None, toHeight = None):
+
+        with self.connection as db:
+            db.cursor.execute("SELECT p.height, p.time, d.kind, d.fields FROM deltas d JOIN polls p ON p.id=d.poll \
+                               WHERE d.node=? ORDER BY d.poll", (node,))
+            rows = db.cursor.fetchall()
+
+        history = []
+        fields = None
+
+        for height, timestamp, kind, changed in rows:
+
+            if kind == ADDED:
+                fields = json.loads(changed)
+            elif kind == REMOVED:
+                fields = None
+            else:
+                fields = applyFields(fields or {}, json.loads(changed))
+
+            if toHeight != None and height > toHeight:
+                break
+
+            if fromHeight != None and height < fromHeight:
+                # Keep the state at fromHeight
+                history = [(height, timestamp, fields)]
+            else:
+                history.append((height, timestamp, fields))
+
+        return history
+
+    # [(height, time, value)] for each change of a field of the node, value
+    # is None while the node is not in the list.
+    def getFieldHistory(self, node, field = 'status', fromHeight = None, toHeight = None):
+
+        history = []
+
+        for height, timestamp, fields in self.getNodeHistory(node, fromHeight, toHeight):
+
+            value = fields.get(field) if fields else None
+
+            if not history or history[-1][2] != value:
+                history.append((height, timestamp, value))
+
+        return history
@@ -0,0 +1,216 @@
+#
+# Part of `python-smartcash`
+#
+# Predicts the payment order of the smartnodes. Keeps the enabled nodes
+# sorted by their last payment and updates it with each new reward.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import logging
+import threading
+from bisect import bisect_left, insort
+from smartcash.util import getPayoutSchedule
+from smartcash.schedule import isRewardHeight
+from smartcash.watchlist import getPayees
+from smartcash.nodehistory import parseEntry
+
+logger = logging.getLogger("smartcash.predictor")
+
+# Average seconds per block
+BLOCK_TIME = 55
+
+# Nodes in the queue
+ELIGIBLE_STATUS = ('ENABLED',)
+
+class PaymentQueue(object):
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.height = None
+
+        # Sorted list of (last paid height, node), the first gets paid next.
+        # Lookups are a bisect, inserts and removals shift the list behind
+        # the position (O(n), a memmove for the few thousand nodes).
+        self.queue = []
+        self.keys = {}
+        # payee address -> set of nodes
+        self.payees = {}
+        self.nodes = {}
+
+    def __len__(self):
+        return len(self.queue)
+
+    # Height used to rank a node, never paid ones by the time they are active.
+    def rankHeight(self, fields, height):
+
+        lastPaid = fields.get('lastpaidblock') or 0
+
+        if lastPaid > 0:
+            return lastPaid
+
+        activeBlocks = (fields.get('activeseconds') or 0) // BLOCK_TIME
+
+        return max(0, height - activeBlocks)
+
+    def remove(self, node):
+
+        key = self.keys.pop(node, None)
+
+        if key != None:
+
+            i = bisect_left(self.queue, (key, node))
+
+            if i < len(self.queue) and self.queue[i] == (key, node):
+                del self.queue[i]
+
+    def insert(self, node, key):
+        self.keys[node] = key
+        insort(self.queue, (key, node))
+
+    # Update with the `smartnode list full` result at the chain height.
+    # Only the changed nodes get moved.
+    def update(self, nodes, height):
+
+        entries = {k: parseEntry(v) for k, v in nodes.items()}
+
+        with self.lock:
+
+            self.height = height
+
+            for node in [x for x in self.nodes if not x in entries]:
+                self.forget(node)
+
+            for node, fields in entries.items():
+
+                previous = self.nodes.get(node)
+
+                if previous and previous.get('payee') != fields.get('payee'):
+                    self.forget(node)
+                    previous = None
+
+                self.nodes[node] = fields
+                self.payees.setdefault(fields.get('payee'), set()).add(node)
+
+                eligible = fields.get('status') in ELIGIBLE_STATUS
+
+                if not eligible:
+                    self.remove(node)
+                elif not node in self.keys:
+                    self.insert(node, self.rankHeight(fields, height))
+                elif previous.get('lastpaidblock') != fields.get('lastpaidblock') and fields.get('lastpaidblock'):
+                    # Only move forward, a reward might already be in.
+                    if fields['lastpaidblock'] > self.keys[node]:
+                        self.remove(node)
+                        self.insert(node, fields['lastpaidblock'])
+
+    def forget(self, node):
+
+        self.remove(node)
+
+        fields = self.nodes.pop(node, None)
+
+        if fields:
+
+            nodes = self.payees.get(fields.get('payee'))
+
+            if nodes:
+                nodes.discard(node)
+
+                if not nodes:
+                    del self.payees[fields.get('payee')]
+
+    # Move the paid nodes of a new reward to the end of the queue.
+    def addReward(self, reward):
+
+        if reward.meta != 0:
+            return
+
+        with self.lock:
+
+            self.height = max(self.height or 0, reward.block)
+
+            for payee in getPayees(reward.payee):
+
+                for node in self.payees.get(payee, ()):
+
+                    if node in self.keys and self.keys[node] < reward.block:
+                        self.remove(node)
+                        self.insert(node, reward.block)
+
+    # Fetch the list from the node and update the queue.
+    def sync(self, rpc):
+
+        count = rpc.raw('getblockcount', [])
+        nodes = rpc.getSmartNodeList('full')
+
+        if count.error or nodes.error:
+            logger.error("sync - {}".format(count.error or nodes.error))
+            return False
+
+        self.update(nodes.data, count.data)
+
+        return True
+
+    # Node ids of a node id or payee address
+    def find(self, nodeOrPayee):
+
+        if nodeOrPayee in self.nodes:
+            return [nodeOrPayee]
+
+        return sorted(self.payees.get(nodeOrPayee, ()))
+
+    # 0 based queue position of the node or None if it's not eligible.
+    def position(self, node):
+
+        with self.lock:
+
+            key = self.keys.get(node)
+
+            if key is None:
+                return None
+
+            return bisect_left(self.queue, (key, node))
+
+    # Returns (position, height) with the estimated height of the next
+    # payment of the node or None if it's not in the queue.
+    def estimate(self, node):
+
+        position = self.position(node)
+
+        if position is None or self.height is None:
+            return None
+
+        # First reward height after the current height
+        height = self.height + 1
+
+        while not isRewardHeight(height):
+            height += 1
+
+        _, payees, interval = getPayoutSchedule(height)
+
+        return position, height + (position // payees) * interval
+
+    # The next count nodes to be paid
+    def getNext(self, count = 10):
+
+        with self.lock:
+            return [node for _, node in self.queue[:count]]
@@ -0,0 +1,203 @@
+#
+# Part of `python-smartcash`
+#
+# Repair job for the heights where the scanner could not resolve the
+# payout (meta -1/-2). Re-fetches them concurrently with batched RPC calls.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+import json
+import time
+import logging
+import argparse
+from multiprocessing.pool import ThreadPool
+from smartcash import rollups, checkpoint
+from smartcash.stats import SyncStats
+from smartcash.rpc import SmartCashRPC, RPCConfig, fetchBlocks
+from smartcash.backfill import scanBatch
+from smartcash.rewardlist import SNRewardDatabase, reward_factory
+
+logger = logging.getLogger("smartcash.repair")
+
+# Meta values of the rows to repair
+ERROR_METAS = (-1, -2)
+
+def getErrorHeights(database, metas = ERROR_METAS, start = None, stop = None):
+
+    query = "SELECT block FROM rewards WHERE meta IN ({}) ".format(', '.join('?' for _ in metas))
+    args = tuple(metas)
+
+    if start != None:
+        query += "AND block>=? "
+        args += (start,)
+
+    if stop != None:
+        query += "AND block<? "
+        args += (stop,)
+
+    with database.connection as db:
+        db.cursor.execute(query + "ORDER BY block", args)
+        return [row[0] for row in db.cursor.fetchall()]
+
+# Replace the error row of the reward's height in one transaction. Only
+# replaces rows which are still error rows of the same block. Pass
+# notify=False to call database.notifyWrite() once after many rows.
+def replaceReward(database, reward, metas = ERROR_METAS, notify = True):
+
+    with database.connection as db:
+
+        db.cursor.row_factory = reward_factory
+        db.cursor.execute("SELECT * FROM rewards WHERE block=?", (reward.block,))
+        current = db.cursor.fetchone()
+
+        if not current or not current.meta in metas:
+            return False
+
+        if current.hash and reward.hash and current.hash != reward.hash:
+            return False
+
+        db.cursor.execute("UPDATE rewards SET txtime=?, payee=?, amount=?, source=?, meta=?, verified=?, \
+                           hash=?, prevhash=? WHERE block=?",
+                           (reward.txtime, reward.payee, reward.amount, reward.source, reward.meta,
+                            reward.verified, reward.hash, reward.prevhash, reward.block))
+
+        rollups.update(db.cursor, current.txtime, current.meta, current.source, current.amount, -1)
+        rollups.update(db.cursor, reward.txtime, reward.meta, reward.source, reward.amount)
+
+        if reward.verified:
+            checkpoint.update(db.cursor, reward.block, reward.hash)
+
+    if notify:
+        database.notifyWrite()
+
+    return True
+
+def repairBatch(args):
+
+    rpcConfig, heights, retries = args
+
+    rpc = SmartCashRPC(rpcConfig, exactAmounts=True)
+    stats = SyncStats()
+
+    blocks = fetchBlocks(rpc, heights, retries)
+
+    if not blocks:
+        return [], heights
+
+    blocks = [x.data for x in blocks]
+    rewards = []
+    failed = []
+
+    # scanBatch stops at the first block it can't scan, skip it
+    # and continue with the rest of the batch.
+    while blocks:
+
+        scanned, complete = scanBatch(rpc, blocks, stats, retries)
+        rewards += scanned
+
+        if complete:
+            break
+
+        failed.append(blocks[len(scanned)]['height'])
+        blocks = blocks[len(scanned) + 1:]
+
+    return rewards, failed
+
+# Re-scan all error heights and replace the rows which can be resolved now.
+def repair(database, rpcConfig, workers = 4, batchSize = 50, retries = 3, start = None, stop = None, resolvedCB = None):
+
+    began = time.time()
+    heights = getErrorHeights(database, start=start, stop=stop)
+
+    tasks = [(rpcConfig, heights[i:i + batchSize], retries) for i in range(0, len(heights), batchSize)]
+
+    resolved = []
+    unresolved = []
+    failed = []
+
+    pool = ThreadPool(max(1, workers))
+
+    try:
+
+        for rewards, errors in pool.imap_unordered(repairBatch, tasks):
+
+            failed += errors
+            replaced = []
+
+            for reward in rewards:
+
+                if not reward.meta in ERROR_METAS and replaceReward(database, reward, notify=False):
+                    replaced.append(reward)
+                else:
+                    unresolved.append(reward.block)
+
+            if not replaced:
+                continue
+
+            # Once per batch, the readers reload everything anyway.
+            database.notifyWrite()
+
+            for reward in replaced:
+
+                resolved.append(reward.block)
+
+                if resolvedCB:
+                    resolvedCB(reward)
+
+    finally:
+        pool.close()
+        pool.join()
+
+    logger.info("repair - {} resolved, {} unresolved, {} failed".format(len(resolved), len(unresolved), len(failed)))
+
+    return {'checked': len(heights),
+            'seconds': time.time() - began,
+            'resolved': sorted(resolved),
+            'unresolved': sorted(unresolved),
+            'failed': sorted(failed)}
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Repair the error rows of a SmartNode rewards database.')
+    parser.add_argument('database', help='Path of the rewards database')
+    parser.add_argument('--rpc-user', required=True)
+    parser.add_argument('--rpc-password', default='')
+    parser.add_argument('--rpc-url', default='http://127.0.0.1')
+    parser.add_argument('--rpc-port', type=int, default=9679)
+    parser.add_argument('--start', type=int, default=None)
+    parser.add_argument('--stop', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent RPC clients')
+    parser.add_argument('--batch', type=int, default=50, help='Heights per RPC batch')
+
+    args = parser.parse_args(argv)
+
+    rpcConfig = RPCConfig(args.rpc_user, args.rpc_password, args.rpc_url, args.rpc_port)
+
+    report = repair(SNRewardDatabase(args.database), rpcConfig, args.workers, args.batch,
+                    start=args.start, stop=args.stop)
+
+    sys.stdout.write(json.dumps(report, indent=2) + '\n')
+
+    return 0 if not report['unresolved'] and not report['failed'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
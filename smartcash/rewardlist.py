@@ -29,9 +29,14 @@ from threading import Thread, Lock
 import time
 import json
 import logging
-from smartcash.util import ThreadedSQLite, getBlockReward, getPayeesPerBlock, getPayoutInterval
+from smartcash.util import ThreadedSQLite, COIN, getBlockRewardSatoshis, toSatoshis, toCoins
+from smartcash.schedule import isRewardHeight, getExpectedPayout
+from smartcash import rollups, checkpoint, export, trace, cache
+from smartcash.watchlist import PayeeWatchlist, getPayees
+from smartcash.confirmations import ConfirmationTracker
+from smartcash.blocktime import BlockTimeIndex
+from smartcash.stats import SyncStats, STAGE_RPC, STAGE_SEARCH, STAGE_DB, STAGE_CALLBACKS, STAGE_PAUSED, STAGE_SLEEP
 from smartcash.rpc import SmartCashRPC, RPCConfig
-from sqlalchemy import *
 
 logger = logging.getLogger("smartcash.rewardlist")
 
@@ -42,6 +47,129 @@ def reward_factory(cursor, row):
 
     return SNReward(**d)
 
+# Search the SmartNode payout of the height nHeight in the transaction rawTx.
+# Returns a SNReward if it's the coinbase transaction with all expected payees.
+def findReward(rawTx, nHeight):
+
+    if not (len(rawTx['vin']) == 1 and 'coinbase' in rawTx['vin'][0]):
+        return None
+
+    expectedPayees, expectedPayout, expectedLower, expectedUpper = getExpectedPayout(nHeight)
+    payees = []
+
+    for out in rawTx['vout']:
+
+        amount = toSatoshis(out['value'])
+
+        if amount <= expectedUpper and amount >= expectedLower and 'addresses' in out['scriptPubKey']:
+
+            #We found the node payout for this block!
+            payees.append(out['scriptPubKey']['addresses'][0])
+
+            if len(payees) == expectedPayees:
+
+                return SNReward(block=nHeight,
+                                txtime=rawTx['time'],
+                                payee=json.dumps(payees),
+                                amount=amount,
+                                source=0,
+                                meta=0,
+                                verified=1)
+
+    return None
+
+# Determine the rewards row of a block. Returns (reward, error) where
+# error is a SNRewardError if the transactions could not be fetched.
+def scanBlock(rpc, block, stats = None):
+
+    reward, error = searchBlock(rpc, block, stats if stats else SyncStats())
+
+    if reward:
+        setBlockHashes(reward, block)
+
+    return reward, error
+
+def setBlockHashes(reward, block):
+    reward.hash = block['hash']
+    reward.prevhash = block['previousblockhash'] if 'previousblockhash' in block else None
+
+# Row of a block without reward. Meta -1 no transactions, -2 reward
+# not found and -3 no reward height.
+def emptyReward(nHeight, meta):
+
+    return SNReward(block=nHeight,
+                    txtime=0,
+                    payee="NoRewardBlock" if meta == -3 else "error",
+                    source=0,
+                    meta=meta,
+                    verified=1)
+
+# The rewards row of a block without searching its transactions, None if
+# they need to be searched.
+def presetReward(block):
+
+    nHeight = block['height']
+
+    if not 'tx' in block:
+        return emptyReward(nHeight, -1)
+
+    # If the height is no node reward height.
+    if not isRewardHeight(nHeight):
+        return emptyReward(nHeight, -3)
+
+    return None
+
+# Check if the fetched transaction rawTx is the new coin transaction of the
+# block. Returns (reward, error), both None to continue with the next one.
+def checkTransaction(rawTx, nHeight, stats):
+
+    if rawTx.error:
+        return None, SNRewardError(2, "getRawTransaction" + str(rawTx.error))
+
+    with stats.timer(STAGE_SEARCH):
+        return findReward(rawTx, nHeight), None
+
+def searchBlock(rpc, block, stats):
+
+    reward = presetReward(block)
+
+    if reward:
+        return reward, None
+
+    # Search the new coin transaction of the block
+    for tx in block['tx']:
+
+        with stats.timer(STAGE_RPC):
+            rawTx = rpc.getRawTransaction(tx)
+
+        reward, error = checkTransaction(rawTx, block['height'], stats)
+
+        if reward or error:
+            return reward, error
+
+    return emptyReward(block['height'], -2), None
+
+# Rows without hash are from before hashes got stored, assume they are fine.
+def hasBlockHash(stored):
+    return bool(stored and stored.hash)
+
+# One step of the fork search at height with the stored row and the
+# getblockhash response of the node, None if the row has no hash. Returns
+# (finished, forkHeight), forkHeight is None if the node could not be asked.
+def forkStep(height, stored, response):
+
+    if response == None:
+        return True, height
+
+    if response.error:
+        logger.error("findForkHeight getblockhash {} - {}".format(height, response.error))
+        return True, None
+
+    if response.data == stored.hash:
+        return True, height
+
+    return False, None
+
 class SNRewardError(object):
     def __init__(self, code, message):
         self.code = code
@@ -54,7 +182,7 @@ class SNRewardError(object):
 class SNReward(object):
 
     def __init__(self, **kwargs):
-        attributes = ['block', 'txtime', 'payee', 'amount', 'source', 'meta', 'verified']
+        attributes = ['block', 'txtime', 'payee', 'amount', 'source', 'meta', 'verified', 'hash', 'prevhash']
 
         for attribute in attributes:
             if attribute in kwargs:
@@ -68,7 +196,7 @@ class SNReward(object):
 
         if not hasattr(self, 'amount'):
             if self.block:
-                self.amount = round(5000.0  * ( 143500.0 / int(self.block) ) * 0.1, 1)
+                self.amount = getBlockRewardSatoshis(int(self.block))
             else:
                 self.amount = 0
 
@@ -81,8 +209,14 @@ class SNReward(object):
         if not hasattr(self, 'verified'):
             self.verified = 0
 
+        if not hasattr(self, 'hash'):
+            self.hash = None
+
+        if not hasattr(self, 'prevhash'):
+            self.prevhash = None
+
     def __str__(self):
-        return '[{0.payee}] {0.block} - {0.amount}'.format(self)
+        return '[{0.payee}] {0.block} - {1}'.format(self, toCoins(self.amount))
 
     def __eq__(self, other):
         return self.block == other.block
@@ -92,7 +226,8 @@ class SNReward(object):
 
 class SNRewardList(Thread):
 
-    def __init__(self, dbPath, rpcConfig, rewardCB = None, errorCB = None):
+    def __init__(self, dbPath, rpcConfig, rewardCB = None, errorCB = None, dispatcher = None, retractCB = None,
+                 provisional = False, provisionalCB = None, cacheSize = 1024):
 
         Thread.__init__(self)
 
@@ -102,23 +237,52 @@ class SNRewardList(Thread):
 
         self.rewardCB = rewardCB
         self.errorCB = errorCB
-        self.rpc = SmartCashRPC(rpcConfig)
+        # Called with each reward which got removed by a chain reorganization
+        self.retractCB = retractCB
+        # Optional EventDispatcher to deliver the callbacks asynchronously
+        self.dispatcher = dispatcher
+        # Record rewards with verified=0 as soon as their block arrives, the
+        # tracker promotes them once they have enough confirmations.
+        self.provisional = provisional
+        self.provisionalCB = provisionalCB
+        self.tracker = ConfirmationTracker(self)
+        self.watchlist = PayeeWatchlist()
+        self.stats = SyncStats()
+        # Results of the read queries, 0 disables it
+        self.cache = cache.QueryCache(cacheSize)
+        # Maps the time filters of the queries to height ranges
+        self.blockTimes = BlockTimeIndex()
+        self.rpc = SmartCashRPC(rpcConfig, exactAmounts=True)
 
         self.chainHeight = None
         self.currentHeight = None
+        # Hash of the block at currentHeight - 1
+        self.tipHash = None
         self.synced = False
 
         self.db = SNRewardDatabase(dbPath)
+        self.db.writeHooks.append(self.reload)
+        self.dataVersion = self.db.getDataVersion()
+        # Seconds between the checks for writes of other connections
+        self.externalCheckInterval = 1.0
+        self.externalCheck = time.time()
 
     def start(self):
 
         if not self.is_alive():
             logger.info("Starting!")
+
+            if self.dispatcher:
+                self.dispatcher.start()
+
             Thread.start(self)
 
     def stop(self):
         self.running = False
 
+        if self.dispatcher:
+            self.dispatcher.stop()
+
     def pause(self):
         logger.info("pause")
         self.paused = True
@@ -131,10 +295,11 @@ class SNRewardList(Thread):
 
         self.currentHeight = 300000
 
-        lastReward = self.getLastReward()
+        lastVerified = self.getCheckpoint()
 
-        if lastReward:
-            self.currentHeight = lastReward.block + 1
+        if lastVerified:
+            self.currentHeight = lastVerified[0] + 1
+            self.tipHash = lastVerified[1]
 
         logger.info("Start block {}".format(self.currentHeight))
 
@@ -146,11 +311,14 @@ class SNRewardList(Thread):
 
             while self.paused:
                 logger.info("paused!")
-                time.sleep(5)
+
+                with self.stats.timer(STAGE_PAUSED):
+                    time.sleep(5)
 
             if not lastInfoCheck or (time.time() - lastInfoCheck) > 50:
 
-                info = self.rpc.getInfo()
+                with self.stats.timer(STAGE_RPC):
+                    info = self.rpc.getInfo()
 
                 if info.error:
                     self.chainHeight = None
@@ -160,162 +328,281 @@ class SNRewardList(Thread):
                     self.chainHeight = info['blocks']
                     logger.info("Current chain height: {}".format(self.chainHeight))
 
-            block = self.rpc.getBlockByNumber(self.currentHeight)
+            with self.stats.timer(STAGE_RPC):
+                block = self.rpc.getBlockByNumber(self.currentHeight)
 
             if block.error:
+
+                if self.provisional and self.waitForBlock():
+                    continue
+
                 logger.error("Could not fetch block {}".format(block.error))
-                time.sleep(30)
+                self.sleep(30)
                 continue
 
-            if block['confirmations'] < 3:
+            provisional = block['confirmations'] < self.tracker.confirmations
+
+            if provisional and not self.provisional:
 
                 logger.info("[{}] Wait for confirmations ({}): {}".format(self.currentHeight, block['confirmations'], block['hash']))
                 logger.debug("BLOCK: {}".format(block.data))
-                time.sleep(10)
+                self.sleep(10)
                 continue
 
-            if not 'tx' in block:
+            if self.isReorg(block):
 
-                reward = SNReward(block=block['height'],
-                                           txtime=0,
-                                           payee="error",
-                                           source=0,
-                                           meta=-1,
-                                           verified=1)
+                if not self.handleReorg(self.currentHeight - 1):
+                    self.sleep(30)
 
-                if self.addReward(reward):
-                    logger.error("No transactions in block! {} - missing payout {}".format(reward.block,reward.amount))
-                    self.currentHeight += 1
+                continue
+
+            # Promote the confirmed provisional rows before the block gets
+            # added, that keeps the reward callbacks in height order.
+            if self.provisional:
 
-                    if self.errorCB:
-                        self.errorCB(SNRewardError(1, "No transactions " + str(reward)))
+                self.tracker.update(self.currentHeight + block['confirmations'] - 1)
 
+                # One of them got reorganized, the sync continues below it.
+                if self.currentHeight != block['height']:
                     continue
 
-            nHeight = block['height']
-            payoutInterval = getPayoutInterval(nHeight)
-            nBlocksAdded = 0
-            blockReward = 0
+            reward, error = scanBlock(self.rpc, block, self.stats)
 
-            while nBlocksAdded < payoutInterval:
-                blockReward += getBlockReward(nHeight - nBlocksAdded)
-                nBlocksAdded += 1
+            if self.paused:
+                continue
 
-            expectedPayees = getPayeesPerBlock(nHeight)
-            expectedPayout = blockReward / expectedPayees
-            expectedUpper = expectedPayout * 1.01
-            expectedLower = expectedPayout * 0.99
+            if error:
+                self.notifyError(error)
+                self.sleep(60)
+                logger.debug("Unexpected error occured. Sleep a bit..")
+                continue
 
-            reward = None
-            error = False
+            reward.verified = 0 if provisional else 1
 
-            # If the height is no node reward height.
-            if nHeight % payoutInterval:
+            if self.addReward(reward):
 
-                reward = SNReward(block=nHeight,
-                                   txtime=0,
-                                   payee="NoRewardBlock",
-                                   source=0,
-                                   meta=-3,
-                                   verified=1)
+                self.rewardAdded(reward, provisional)
 
-                if self.addReward(reward):
-                    self.currentHeight += 1
-                    continue
+            elif provisional and self.isStored(reward):
 
-            # Search the new coin transaction of the block
-            for tx in block['tx']:
+                # Provisional row from before a restart
+                self.blockDone(reward)
 
-                rawTx = self.rpc.getRawTransaction(tx)
+            elif not provisional and self.verifyReward(reward):
 
-                if rawTx.error:
-                    error = True
+                self.rewardVerified(reward)
 
-                    if self.errorCB:
-                        self.errorCB(SNRewardError(2, "getRawTransaction" + str(rawTx.error)))
+            else:
 
-                    break
+                self.verifyFailed(reward)
 
-                foundPayees = 0
-                payees = []
+                # The stored row belongs to another chain, rescan from its height.
+                if not self.rollback(reward.block - 1):
+                    self.sleep(60)
 
-                # We found the new coin transaction of the block
-                if len(rawTx['vin']) == 1 and 'coinbase' in rawTx['vin'][0]:
+    # The previous block is not the one we stored, the chain got reorganized.
+    def isReorg(self, block):
 
-                    for out in rawTx['vout']:
+        if not self.tipHash or not 'previousblockhash' in block or block['previousblockhash'] == self.tipHash:
+            return False
 
-                        amount = float(out['value'])
+        logger.warning("[{}] Reorg detected: {} != {}".format(self.currentHeight, block['previousblockhash'], self.tipHash))
 
-                        if amount <= expectedUpper and amount >= expectedLower:
-                           #We found the node payout for this block!
-                           txtime = rawTx['time']
-                           if 'addresses' in out['scriptPubKey']:
+        return True
 
-                               payees.append(out['scriptPubKey']['addresses'][0])
+    # The block's reward got stored, move on and tell about it.
+    def rewardAdded(self, reward, provisional = False):
 
-                               if len(payees) == expectedPayees:
+        self.blockDone(reward)
 
-                                    reward = SNReward(block=nHeight,
-                                               txtime=txtime,
-                                               payee=json.dumps(payees),
-                                               amount=amount,
-                                               source=0,
-                                               meta=0,
-                                               verified=1)
-                                    break
-                if reward:
-                    break
+        if reward.meta == -1:
+            logger.error("No transactions in block! {} - missing payout {}".format(reward.block,toCoins(reward.amount)))
+            self.notifyError(SNRewardError(1, "No transactions " + str(reward)))
+        elif reward.meta == -2:
+            logger.error("Could not fetch reward! {} - missing payout {}".format(reward.block,toCoins(reward.amount)))
+            self.notifyError(SNRewardError(3, "Could not find reward in transactions! Height: {}".format(reward.block)))
+        elif reward.meta == 0 and provisional:
+            logger.debug("Added provisional: {}".format(str(reward)))
+            self.notifyProvisional(reward)
+        elif reward.meta == 0:
+            logger.debug("Added: {}".format(str(reward)))
+            self.notifyReward(reward)
 
-            if self.paused:
-                continue
+    # The block's reward was already stored and matches.
+    def rewardVerified(self, reward):
 
-            if reward:
+        self.blockDone(reward)
+        logger.debug("Verified: {}".format(str(reward)))
 
-                if self.addReward(reward):
-                    self.currentHeight += 1
-                    logger.debug("Added: {}".format(str(reward)))
-                else:
-                    if self.verifyReward(reward):
-                        self.currentHeight += 1
-                        logger.debug("Verified: {}".format(str(reward)))
-                    else:
-                        logger.warning("Could not verify reward - {}".format(str(reward)))
+        if reward.meta == 0:
+            self.notifyReward(reward)
 
-                        if self.errorCB:
-                            self.errorCB(SNRewardError(-1, "Could not verify reward {}".format(str(reward))))
+    def verifyFailed(self, reward):
+        logger.warning("Could not verify reward - {}".format(str(reward)))
+        self.notifyError(SNRewardError(-1, "Could not verify reward {}".format(str(reward))))
 
-                        time.sleep(300)
+    # Find the highest stored height which is still in the chain of the node
+    # starting at height. Returns None if the node could not be asked.
+    def findForkHeight(self, height, maxDepth = 1000):
 
-                if self.rewardCB:
-                    self.rewardCB(reward, self.blockDistance())
+        lowest = max(300000, height - maxDepth)
 
-            elif not error:
+        while height >= lowest:
 
-                if self.errorCB:
-                    self.errorCB(SNRewardError(3, "Could not find reward in transactions! Height: {}".format(nHeight)))
+            stored = self.getReward(height)
+            response = None
 
-                reward = SNReward(block=nHeight,
-                                   txtime=0,
-                                   payee="error",
-                                   source=0,
-                                   meta=-2,
-                                   verified=1)
-                if self.addReward(reward):
-                    self.currentHeight += 1
-                    logger.error("Could not fetch reward! {} - missing payout {}".format(reward.block,reward.amount))
+            if hasBlockHash(stored):
+                with self.stats.timer(STAGE_RPC):
+                    response = self.rpc.raw('getblockhash', [height])
 
-            else:
-                time.sleep(60)
-                logger.debug("Unexpected error occured. Sleep a bit..")
+            finished, forkHeight = forkStep(height, stored, response)
+
+            if finished:
+                return forkHeight
+
+            height -= 1
+
+        logger.error("findForkHeight - no common block down to {}".format(lowest))
+
+        return None
+
+    def handleReorg(self, height):
+
+        forkHeight = self.findForkHeight(height)
+
+        if not self.forkFound(height, forkHeight):
+            return False
+
+        self.rollback(forkHeight)
+
+        return True
+
+    # Returns False if the fork search below height failed.
+    def forkFound(self, height, forkHeight):
+
+        if forkHeight is None:
+            self.notifyError(SNRewardError(4, "Could not find the fork point below {}".format(height)))
+            return False
+
+        logger.warning("Reorg - roll back to {}".format(forkHeight))
+
+        return True
+
+    # Remove all rows above height and continue the sync after it.
+    def rollback(self, height):
+        return self.rolledBack(height, *self.removeAbove(height))
+
+    # The database part of rollback, returns the removed rewards and the new tip row.
+    def removeAbove(self, height):
+        return self.removeRewards(height + 1), self.getReward(height)
+
+    def rolledBack(self, height, rewards, stored):
+
+        self.currentHeight = height + 1
+        self.tipHash = stored.hash if stored else None
+
+        for reward in rewards:
+            self.notifyRetract(reward)
+
+        return len(rewards)
+
+    # At the tip the next block doesn't exist yet, check pending confirmations
+    # while waiting for it. Returns False if the block should exist.
+    def waitForBlock(self):
+
+        with self.stats.timer(STAGE_RPC):
+            count = self.rpc.raw('getblockcount', [])
+
+        if count.error or count.data >= self.currentHeight:
+            return False
+
+        self.tracker.update(count.data)
+        self.sleep(5)
+
+        return True
+
+    def sleep(self, seconds):
+
+        with self.stats.timer(STAGE_SLEEP):
+            time.sleep(seconds)
+
+    def blockDone(self, reward):
+        self.currentHeight += 1
+        self.tipHash = reward.hash
+        self.stats.addBlock(reward.meta)
+        self.cache.advance()
+
+    def getStats(self):
+
+        stats = self.stats.get(self.chainHeight, self.currentHeight)
+        stats['cache'] = self.cache.stats()
+
+        return stats
+
+    def getMetrics(self):
+        return self.stats.prometheus(self.chainHeight, self.currentHeight, self.cache.stats())
+
+    def notifyReward(self, reward):
+
+        with self.stats.timer(STAGE_CALLBACKS):
+
+            if self.dispatcher:
+                self.dispatcher.reward(reward, self.blockDistance())
+            elif self.rewardCB:
+                self.rewardCB(reward, self.blockDistance())
+
+            self.watchlist.notify(reward, self.blockDistance(), self.dispatcher)
+
+    # Call callback(reward, matchedPayees, blockDistance) for each new
+    # reward of one of the payees, on the dispatcher's workers if there
+    # is one. Returns the subscription id.
+    def subscribe(self, payees, callback):
+        return self.watchlist.subscribe(payees, callback)
+
+    def unsubscribe(self, id):
+        return self.watchlist.unsubscribe(id)
+
+    # Rewards of all payees of the subscription since fromHeight.
+    def catchUp(self, id, fromHeight = None):
+        return self.getRewardsForPayees(self.watchlist.payees(id), fromHeight)
+
+    def notifyProvisional(self, reward):
+
+        with self.stats.timer(STAGE_CALLBACKS):
+
+            if self.dispatcher:
+                self.dispatcher.provisional(reward, self.blockDistance())
+            elif self.provisionalCB:
+                self.provisionalCB(reward, self.blockDistance())
+
+    def notifyError(self, error):
+
+        with self.stats.timer(STAGE_CALLBACKS):
+
+            if self.dispatcher:
+                self.dispatcher.error(error)
+            elif self.errorCB:
+                self.errorCB(error)
+
+    def notifyRetract(self, reward):
+
+        with self.stats.timer(STAGE_CALLBACKS):
+
+            if self.dispatcher:
+                self.dispatcher.retract(reward)
+            elif self.retractCB:
+                self.retractCB(reward)
 
     def blockDistance(self):
         return self.chainHeight - self.currentHeight if self.chainHeight else sys.maxsize
 
+    @trace.traced('rewardlist.addReward')
     def addReward(self, reward):
 
         try:
 
-            with self.db.connection as db:
+            with self.stats.timer(STAGE_DB), self.db.connection as db:
                 query = "INSERT INTO rewards(\
                         block,\
                         txtime,\
@@ -323,8 +610,10 @@ class SNRewardList(Thread):
                         amount,\
                         source,\
                         meta,\
-                        verified) \
-                        values( ?, ?, ?, ?, ?, ?, ? )"
+                        verified,\
+                        hash,\
+                        prevhash) \
+                        values( ?, ?, ?, ?, ?, ?, ?, ?, ? )"
 
                 db.cursor.execute(query, (
                                   reward.block,
@@ -333,9 +622,19 @@ class SNRewardList(Thread):
                                   reward.amount,
                                   reward.source,
                                   reward.meta,
-                                  reward.verified))
+                                  reward.verified,
+                                  reward.hash,
+                                  reward.prevhash))
+
+                rollups.update(db.cursor, reward.txtime, reward.meta, reward.source, reward.amount)
+
+                if reward.verified:
+                    checkpoint.update(db.cursor, reward.block, reward.hash)
+
+            self.cache.invalidate(reward.block, reward.txtime, reward.payee)
+            self.blockTimes.add(reward.block, reward.txtime)
 
-                return True
+            return True
 
         except Exception as e:
             pass
@@ -343,6 +642,8 @@ class SNRewardList(Thread):
 
         return False
 
+    @trace.traced('rewardlist.getLastReward')
+    @cache.cached(lambda: {'tip': True})
     def getLastReward(self):
 
         lastReward = None
@@ -351,7 +652,7 @@ class SNRewardList(Thread):
 
             with self.db.connection as db:
                 db.cursor.row_factory = reward_factory
-                db.cursor.execute("SELECT * FROM rewards WHERE verified=1 ORDER BY block DESC LIMIT 1")
+                db.cursor.execute("SELECT * FROM rewards WHERE block=(SELECT block FROM checkpoint WHERE id=1)")
                 lastReward = db.cursor.fetchone()
 
         except Exception as e:
@@ -359,13 +660,21 @@ class SNRewardList(Thread):
 
         return lastReward
 
+    # (block, hash) of the last verified reward or None.
+    def getCheckpoint(self):
+
+        with self.db.connection as db:
+            return checkpoint.get(db.cursor)
+
+    @trace.traced('rewardlist.getRewardsForPayee')
+    @cache.cached(lambda payee, fromTime = None: {'payees': [payee]})
     def getRewardsForPayee(self, payee, fromTime = None):
 
         payouts = None
         query = 'SELECT * FROM rewards WHERE payee like \"%{}%\" '.format(payee)
 
         if fromTime:
-            query += "AND txtime >= {}".format(int(fromTime))
+            query += "AND block >= {} AND txtime >= {}".format(self.getHeightAt(fromTime), int(fromTime))
 
         try:
 
@@ -379,24 +688,148 @@ class SNRewardList(Thread):
 
         return payouts
 
+    # All rewards of the payees with block >= fromHeight in one pass over
+    # the block range. Returns {payee: [SNReward, ...]}.
+    @trace.traced('rewardlist.getRewardsForPayees')
+    @cache.cached(lambda payees, fromHeight = None: {'payees': payees})
+    def getRewardsForPayees(self, payees, fromHeight = None):
+
+        payees = set(payees)
+        rewards = {}
+
+        try:
+
+            for rows in export.iterChunks(self.db, fromBlock=fromHeight):
+
+                for row in rows:
+
+                    # Only paid rewards have real payees
+                    if row[5] != 0:
+                        continue
+
+                    matched = [x for x in getPayees(row[2]) if x in payees]
+
+                    if matched:
+
+                        reward = SNReward(**dict(zip(export.columns, row)))
+
+                        for payee in matched:
+                            rewards.setdefault(payee, []).append(reward)
+
+        except Exception as e:
+            logger.error("getRewardsForPayees", exc_info=e)
+
+        return rewards
+
+    def isStored(self, reward):
+
+        stored = self.getReward(reward.block)
+
+        return stored is not None and stored.hash == reward.hash
+
+    # Provisional rows up to maxHeight
+    @trace.traced('rewardlist.getUnverifiedRewards')
+    def getUnverifiedRewards(self, maxHeight):
+
+        rewards = []
+
+        try:
+
+            with self.stats.timer(STAGE_DB), self.db.connection as db:
+
+                db.cursor.row_factory = reward_factory
+                db.cursor.execute("SELECT * FROM rewards WHERE verified=0 AND block<=? ORDER BY block", (maxHeight,))
+                rewards = db.cursor.fetchall()
+
+        except Exception as e:
+            logger.error("getUnverifiedRewards", exc_info=e)
+
+        return rewards
+
+    # Mark the provisional rewards as verified in one transaction. Returns
+    # the rewards which were still provisional.
+    @trace.traced('rewardlist.promoteRewards')
+    def promoteRewards(self, rewards):
+
+        promoted = []
+
+        with self.stats.timer(STAGE_DB), self.db.connection as db:
+
+            for reward in rewards:
+
+                db.cursor.execute("UPDATE rewards SET verified=1 WHERE block=? AND verified=0", (reward.block,))
+
+                if db.cursor.rowcount:
+                    reward.verified = 1
+                    promoted.append(reward)
+                    checkpoint.update(db.cursor, reward.block, reward.hash)
+
+        for reward in promoted:
+            self.cache.invalidate(reward.block, reward.txtime, reward.payee)
+
+        return promoted
+
+    @trace.traced('rewardlist.verifyReward')
     def verifyReward(self, reward):
 
         updated = False
 
-        query = "UPDATE rewards SET verified=1 WHERE block=?"
+        with self.stats.timer(STAGE_DB), self.db.connection as db:
 
-        with self.db.connection as db:
+            if reward.hash:
+                # Rows without hash get verified if they match the reward.
+                query = "UPDATE rewards SET verified=1, hash=?, prevhash=? WHERE block=? AND \
+                         (hash=? OR (hash IS NULL AND payee=? AND meta=?))"
+                db.cursor.execute(query, (reward.hash, reward.prevhash, reward.block,
+                                          reward.hash, reward.payee, reward.meta))
+            else:
+                db.cursor.execute("UPDATE rewards SET verified=1 WHERE block=?", [reward.block])
 
-            db.cursor.execute(query,[reward.block]).rowcount
             updated = db.cursor.rowcount
 
+            if updated:
+                checkpoint.update(db.cursor, reward.block, reward.hash)
+
+        if updated:
+            self.cache.invalidate(reward.block, reward.txtime, reward.payee)
+
         return updated
 
+    # Delete all rows with block >= fromHeight, returns the deleted rewards.
+    @trace.traced('rewardlist.removeRewards')
+    def removeRewards(self, fromHeight):
+
+        rewards = []
+
+        with self.stats.timer(STAGE_DB), self.db.connection as db:
+
+            db.cursor.row_factory = reward_factory
+            db.cursor.execute("SELECT * FROM rewards WHERE block>=? ORDER BY block", (fromHeight,))
+            rewards = db.cursor.fetchall()
+
+            db.cursor.execute("DELETE FROM rewards WHERE block>=?", (fromHeight,))
+
+            for reward in rewards:
+                rollups.update(db.cursor, reward.txtime, reward.meta, reward.source, reward.amount, -1)
+
+            checkpoint.rollback(db.cursor, fromHeight)
+
+        self.blockTimes.truncate(fromHeight)
+
+        for reward in rewards:
+            self.cache.invalidate(reward.block, reward.txtime, reward.payee)
+
+        return rewards
+
+    @trace.traced('rewardlist.getNextReward')
+    @cache.cached(lambda fromTime = None: {'times': (fromTime or 0, None)})
     def getNextReward(self, fromTime=None):
 
         nextReward = None
 
-        query = "SELECT * FROM rewards WHERE txtime>={} LIMIT 1".format(int(fromTime))
+        fromTime = int(fromTime) if fromTime else 0
+
+        query = "SELECT * FROM rewards WHERE block>={} AND txtime>={} ORDER BY block LIMIT 1".format(self.getHeightAt(fromTime), fromTime)
 
         try:
 
@@ -410,6 +843,47 @@ class SNRewardList(Thread):
 
         return nextReward
 
+    # Drop the cached results and block times, the next queries load them again.
+    def reload(self):
+        self.cache.clear()
+        self.blockTimes.reset()
+
+    # Writes of other connections (the repair, backfill and import tools or
+    # another process) don't pass the invalidation hooks, reload after them.
+    # Writes on self.db call reload through SNRewardDatabase.notifyWrite.
+    # Checked at most every externalCheckInterval seconds and never waits
+    # for the database lock, cache hits stay lock free.
+    def checkExternalWrites(self):
+
+        now = time.time()
+
+        if now - self.externalCheck < self.externalCheckInterval:
+            return
+
+        version = self.db.getDataVersion(blocking=False)
+
+        # Busy, try again with the next query
+        if version is None:
+            return
+
+        self.externalCheck = now
+
+        if version != self.dataVersion:
+            logger.info("checkExternalWrites - database changed, reload")
+            self.dataVersion = version
+            self.reload()
+
+    # First height which can have a txtime >= timestamp
+    def getHeightAt(self, timestamp):
+
+        self.checkExternalWrites()
+
+        if not self.blockTimes.loaded:
+            self.blockTimes.load(self.db)
+
+        return self.blockTimes.height(timestamp)
+
+    @trace.traced('rewardlist.updateSource')
     def updateSource(self, reward):
 
         updated = False
@@ -417,11 +891,23 @@ class SNRewardList(Thread):
         query = "UPDATE rewards SET source=? WHERE block=?"
 
         with self.db.connection as db:
+
+            db.cursor.execute("SELECT * FROM rewards WHERE block=?", (reward.block,))
+            current = db.cursor.fetchone()
+
             db.cursor.execute(query,(reward.source, reward.block))
             updated = db.cursor.rowcount
 
+            if current and updated:
+                rollups.update(db.cursor, current['txtime'], current['meta'], current['source'], current['amount'], -1)
+                rollups.update(db.cursor, current['txtime'], current['meta'], reward.source, current['amount'])
+
+        if current and updated:
+            self.cache.invalidate(current['block'], current['txtime'], current['payee'])
+
         return updated
 
+    @trace.traced('rewardlist.updateMeta')
     def updateMeta(self, reward):
 
         updated = False
@@ -429,32 +915,49 @@ class SNRewardList(Thread):
         query = "UPDATE rewards SET meta=? WHERE block=?"
 
         with self.db.connection as db:
+
+            db.cursor.execute("SELECT * FROM rewards WHERE block=?", (reward.block,))
+            current = db.cursor.fetchone()
+
             db.cursor.execute(query,(reward.meta, reward.block))
             updated = db.cursor.rowcount
 
+            if current and updated:
+                rollups.update(db.cursor, current['txtime'], current['meta'], current['source'], current['amount'], -1)
+                rollups.update(db.cursor, current['txtime'], reward.meta, current['source'], current['amount'])
+
+        if current and updated:
+            self.cache.invalidate(current['block'], current['txtime'], current['payee'])
+
         return updated
 
+    @trace.traced('rewardlist.getRewardCount')
     def getRewardCount(self, start = None, meta = None, source = None):
+        return self.getRewardStats(start, meta=meta, source=source)['count']
 
-        query = "SELECT count(*) as c FROM rewards "
+    # Count and sum of the rewards with start <= txtime < end. Full hours, days
+    # and months are taken from the rollups, only the edges from the raw rows.
+    @trace.traced('rewardlist.getRewardStats')
+    @cache.cached(lambda start = None, end = None, meta = None, source = None: {'times': (start or 0, end), 'tip': end == None})
+    def getRewardStats(self, start = None, end = None, meta = None, source = None):
 
-        if start != None:
-            query += "WHERE txtime>={} ".format(int(start))
+        stats = {'count': 0, 'amount': 0}
 
-        if source != None:
-            query += "{} source={} ".format("WHERE" if not "WHERE" in query else "AND", int(source))
+        with self.db.connection as db:
 
-        if meta != None:
-            query += "{} meta={} ".format("WHERE" if not "WHERE" in query else "AND", int(meta))
+            if end == None:
 
-        with self.db.connection as db:
+                db.cursor.execute("SELECT max(txtime) AS t FROM rewards")
+                last = db.cursor.fetchone()['t']
 
-            db.cursor.execute(query)
-            rewards = db.cursor.fetchone()
+                end = rollups.nextBucket(rollups.MONTH, rollups.bucketStart(rollups.MONTH, last or 0))
 
+            stats = rollups.query(db.cursor, int(start) if start else 0, end, meta, source)
 
-        return rewards['c']
+        return stats
 
+    @trace.traced('rewardlist.getReward')
+    @cache.cached(lambda block: {'heights': (block, block + 1)})
     def getReward(self, block):
 
         reward = None
@@ -474,13 +977,15 @@ class SNRewardList(Thread):
 
         return reward
 
+    @trace.traced('rewardlist.getRewards')
+    @cache.cached(lambda payee, start = None: {'payees': [payee]})
     def getRewards(self, payee, start = None):
 
         rewards = []
         query = "SELECT * FROM rewards WHERE payee='{}' ".format(payee)
 
         if start:
-            query += "AND txtime >= {}".format(int(start))
+            query += "AND block >= {} AND txtime >= {}".format(self.getHeightAt(start), int(start))
 
         try:
 
@@ -503,12 +1008,149 @@ class SNRewardList(Thread):
 
 class SNRewardDatabase(object):
 
+    version = 6
+
     def __init__(self, dburi):
 
         self.connection = ThreadedSQLite(dburi)
+        # Called after writes which didn't pass SNRewardList
+        self.writeHooks = []
+
+        # Up to date databases skip the schema checks.
+        if self.getVersion() < self.version:
+
+            if self.isEmpty():
+                self.reset()
+
+            self.upgrade()
+
+    def getVersion(self):
+
+        with self.connection as db:
+            db.cursor.execute("PRAGMA user_version")
+            return db.cursor.fetchone()[0]
+
+    # The repair, backfill and import tools call this after they committed,
+    # SNRewardLists on the same connection drop their caches.
+    def notifyWrite(self):
+
+        for hook in self.writeHooks:
+            hook()
+
+    # Changes whenever another connection committed to the database.
+    # Returns None without blocking if the connection is in use.
+    def getDataVersion(self, blocking = True):
+
+        if not self.connection.lock.acquire(blocking):
+            return None
+
+        try:
+            return self.connection.connection.execute("PRAGMA data_version").fetchone()[0]
+        finally:
+            self.connection.lock.release()
+
+    def upgrade(self):
+
+        version = self.getVersion()
+
+        if version < 1:
+
+            logger.info("Upgrade database to version 1 - reward rollups")
+
+            with self.connection as db:
+                db.cursor.executescript(rollups.schema)
+                rollups.rebuild(db.cursor)
+                db.cursor.execute("PRAGMA user_version=1")
+
+        if version < 2:
+
+            logger.info("Upgrade database to version 2 - block hashes")
+
+            with self.connection as db:
+                db.cursor.execute("ALTER TABLE rewards ADD COLUMN `hash` TEXT")
+                db.cursor.execute("ALTER TABLE rewards ADD COLUMN `prevhash` TEXT")
+                db.cursor.execute("PRAGMA user_version=2")
+
+        if version < 3:
+
+            logger.info("Upgrade database to version 3 - meta index")
+
+            with self.connection as db:
+                db.cursor.execute("CREATE INDEX IF NOT EXISTS `rewards_meta` ON rewards(`meta`)")
+                db.cursor.execute("PRAGMA user_version=3")
+
+        if version < 4:
+
+            logger.info("Upgrade database to version 4 - provisional rewards")
+
+            with self.connection as db:
+                db.cursor.execute("CREATE INDEX IF NOT EXISTS `rewards_unverified` ON rewards(`block`) WHERE verified=0")
+                db.cursor.execute("PRAGMA user_version=4")
+
+        if version < 5:
+
+            logger.info("Upgrade database to version 5 - satoshi amounts")
+
+            with self.connection as db:
+
+                # One transaction, sqlite3 would commit the CREATE TABLE on its own
+                # and the connection commits on exit even after a failure.
+                db.cursor.execute("BEGIN")
+
+                try:
+
+                    # SQLite can't change the column type, copy into a new table.
+                    db.cursor.execute("SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name='rewards' AND sql IS NOT NULL")
+                    indexes = [row[0] for row in db.cursor.fetchall()]
+
+                    # Left over by an interrupted upgrade of an older release
+                    db.cursor.execute('DROP TABLE IF EXISTS "rewards_satoshis"')
+
+                    db.cursor.execute('\
+                    CREATE TABLE "rewards_satoshis" (\
+                        `block` INTEGER NOT NULL PRIMARY KEY,\
+                        `txtime` INTEGER,\
+                        `payee` TEXT,\
+                        `amount` INTEGER,\
+                        `source` INTEGER,\
+                        `meta` INTEGER,\
+                        `verified` INTEGER,\
+                        `hash` TEXT,\
+                        `prevhash` TEXT\
+                    )')
+
+                    db.cursor.execute("INSERT INTO rewards_satoshis SELECT block, txtime, payee, \
+                                       CAST(round(ifnull(amount,0) * {}) AS INTEGER), source, meta, verified, hash, prevhash \
+                                       FROM rewards".format(COIN))
+
+                    db.cursor.execute("DROP TABLE rewards")
+                    db.cursor.execute("ALTER TABLE rewards_satoshis RENAME TO rewards")
+
+                    for index in indexes:
+                        db.cursor.execute(index)
+
+                    db.cursor.execute("DROP TABLE rollups")
+
+                    for statement in rollups.schema.split(';'):
+                        if statement.strip():
+                            db.cursor.execute(statement)
+
+                    rollups.rebuild(db.cursor)
+
+                    db.cursor.execute("PRAGMA user_version=5")
+
+                except Exception:
+                    db.connection.rollback()
+                    raise
+
+        if version < 6:
+
+            logger.info("Upgrade database to version 6 - sync checkpoint")
 
-        if self.isEmpty():
-            self.reset()
+            with self.connection as db:
+                db.cursor.executescript(checkpoint.schema)
+                checkpoint.rebuild(db.cursor)
+                db.cursor.execute("PRAGMA user_version=6")
 
     def isEmpty(self):
 
@@ -516,7 +1158,7 @@ class SNRewardDatabase(object):
 
         with self.connection as db:
 
-            db.cursor.execute("SELECT name FROM sqlite_master")
+            db.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='rewards'")
 
             tables = db.cursor.fetchall()
 
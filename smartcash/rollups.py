@@ -0,0 +1,179 @@
+#
+# Part of `python-smartcash`
+#
+# Hour, day and month rollups of the rewards table which get
+# maintained by the writer and allow fast range counts and sums.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import time
+import calendar
+
+HOUR = 'hour'
+DAY = 'day'
+MONTH = 'month'
+
+# Finest to coarsest
+PERIODS = (HOUR, DAY, MONTH)
+
+schema = '\
+CREATE TABLE IF NOT EXISTS "rollups" (\
+    `period` TEXT NOT NULL,\
+    `bucket` INTEGER NOT NULL,\
+    `meta` INTEGER NOT NULL,\
+    `source` INTEGER NOT NULL,\
+    `count` INTEGER NOT NULL DEFAULT 0,\
+    `amount` INTEGER NOT NULL DEFAULT 0,\
+    PRIMARY KEY (`period`, `bucket`, `meta`, `source`)\
+);\
+CREATE INDEX IF NOT EXISTS "rewards_txtime" ON "rewards" (`txtime`);'
+
+# SQL expressions which map a rewards row to its bucket of the period.
+bucketExpressions = {
+    HOUR: "ifnull(txtime,0) - ifnull(txtime,0) % 3600",
+    DAY: "ifnull(txtime,0) - ifnull(txtime,0) % 86400",
+    MONTH: "CAST(strftime('%s', ifnull(txtime,0), 'unixepoch', 'start of month') AS INTEGER)",
+}
+
+def bucketStart(period, timestamp):
+
+    timestamp = int(timestamp)
+
+    if period == HOUR:
+        return timestamp - timestamp % 3600
+    elif period == DAY:
+        return timestamp - timestamp % 86400
+    elif period == MONTH:
+        t = time.gmtime(timestamp)
+        return calendar.timegm((t.tm_year, t.tm_mon, 1, 0, 0, 0))
+
+    raise ValueError("Invalid rollup period {}".format(period))
+
+def nextBucket(period, bucket):
+
+    if period == HOUR:
+        return bucket + 3600
+    elif period == DAY:
+        return bucket + 86400
+    elif period == MONTH:
+        t = time.gmtime(bucket)
+        year, month = (t.tm_year + 1, 1) if t.tm_mon == 12 else (t.tm_year, t.tm_mon + 1)
+        return calendar.timegm((year, month, 1, 0, 0, 0))
+
+    raise ValueError("Invalid rollup period {}".format(period))
+
+def bucketCeil(period, timestamp):
+
+    start = bucketStart(period, timestamp)
+
+    return start if start == timestamp else nextBucket(period, start)
+
+# Split the range [start, end) into parts covered by the coarsest possible
+# buckets. Returns a list of (period, start, end) where period is None for
+# the edges which need to be taken from the raw rows.
+def splitRange(start, end, periods = PERIODS):
+
+    start = int(start)
+    end = int(end)
+
+    if start >= end:
+        return []
+
+    if not periods:
+        return [(None, start, end)]
+
+    period = periods[0]
+    lower = bucketCeil(period, start)
+    upper = bucketStart(period, end)
+
+    if lower >= upper:
+        return [(None, start, end)]
+
+    parts = []
+
+    if start < lower:
+        parts.append((None, start, lower))
+
+    for part in splitRange(lower, upper, periods[1:]):
+        parts.append((part[0] if part[0] else period, part[1], part[2]))
+
+    if upper < end:
+        parts.append((None, upper, end))
+
+    return parts
+
+# Add (sign=1) or remove (sign=-1) a single rewards row to/from all rollups.
+def update(cursor, txtime, meta, source, amount, sign = 1):
+
+    for period in PERIODS:
+
+        key = (period, bucketStart(period, txtime or 0), meta or 0, source or 0)
+
+        cursor.execute("INSERT OR IGNORE INTO rollups(period, bucket, meta, source) VALUES(?, ?, ?, ?)", key)
+        cursor.execute("UPDATE rollups SET count=count+?, amount=amount+? \
+                        WHERE period=? AND bucket=? AND meta=? AND source=?",
+                        (sign, sign * (amount or 0),) + key)
+
+def rebuild(cursor):
+
+    cursor.execute("DELETE FROM rollups")
+
+    for period in PERIODS:
+
+        query = "INSERT INTO rollups(period, bucket, meta, source, count, amount) \
+                 SELECT ?, {0} AS b, ifnull(meta,0) AS m, ifnull(source,0) AS s, count(*), ifnull(sum(amount),0) \
+                 FROM rewards GROUP BY b, m, s".format(bucketExpressions[period])
+
+        cursor.execute(query, (period,))
+
+def query(cursor, start, end, meta = None, source = None):
+
+    count = 0
+    amount = 0
+
+    filters = ""
+    args = ()
+
+    if meta != None:
+        filters += "AND meta=? "
+        args += (int(meta),)
+
+    if source != None:
+        filters += "AND source=? "
+        args += (int(source),)
+
+    for period, lower, upper in splitRange(start, end):
+
+        if period:
+            cursor.execute("SELECT ifnull(sum(count),0) AS c, ifnull(sum(amount),0) AS a FROM rollups \
+                            WHERE period=? AND bucket>=? AND bucket<? " + filters,
+                            (period, lower, upper) + args)
+        else:
+            cursor.execute("SELECT count(*) AS c, ifnull(sum(amount),0) AS a FROM rewards \
+                            WHERE txtime>=? AND txtime<? " + filters,
+                            (lower, upper) + args)
+
+        row = cursor.fetchone()
+
+        count += int(row['c'])
+        amount += row['a']
+
+    return {'count': count, 'amount': amount}
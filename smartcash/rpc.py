@@ -22,12 +22,15 @@
 # THE SOFTWARE.
 
 import re
+import time
 import subprocess
 import json
 import logging
 import re
 import copy
 import base64
+from decimal import Decimal
+from smartcash import trace
 try:
     import http.client as http
 except ImportError:
@@ -87,22 +90,83 @@ class RPCConfig(object):
         self.authHeader = b'Basic ' + base64.b64encode(self.user + b':' + self.password)
         self.timeout = timeout
 
+# JSON-RPC payloads and response parsing, shared with the asyncio transport.
+
+def requestPayload(method, args = None):
+    return {'version': '1.1',
+            'method': method,
+            'params': args}
+
+def batchPayload(calls):
+    return [{'version': '1.1',
+             'method': method,
+             'params': args,
+             'id': i} for i, (method, args) in enumerate(calls)]
+
+def parseResult(response):
+
+    error = response['error'] if 'error' in response else None
+    result = response['result'] if 'result' in response else None
+
+    if error:
+        raise RPCException(response['error']['code'],response['error']['message'])
+
+    if not result:
+        raise RPCException(14,' RPC result missing')
+
+    return result
+
+def parseBatch(calls, response):
+
+    if not isinstance(response, list):
+        raise RPCException(15, 'Invalid batch response')
+
+    responses = [RPCResponse(error=RPCError(15, 'Missing batch response')) for _ in calls]
+
+    for item in response:
+
+        i = item['id'] if 'id' in item else None
+
+        if not isinstance(i, int) or i < 0 or i >= len(calls):
+            continue
+
+        error = item['error'] if 'error' in item else None
+        result = item['result'] if 'result' in item else None
+
+        if error:
+            responses[i] = RPCResponse(error=RPCError(error['code'], error['message']))
+        elif not result:
+            responses[i] = RPCResponse(error=RPCError(14, 'RPC result missing'))
+        else:
+            responses[i] = RPCResponse(data=result)
+
+    return responses
+
 class SmartCashRPC(object):
 
-    def __init__(self, config):
+    # With exactAmounts all JSON numbers with fraction are parsed as
+    # Decimal instead of float, used to get exact satoshi amounts.
+    def __init__(self, config, exactAmounts = False):
 
         self.config = copy.deepcopy(config)
         self.connection = None
+        self.parseFloat = Decimal if exactAmounts else None
 
 
-    def request(self, method, args = None):
+    def send(self, payload):
+
+        if not trace.isEnabled():
+            return self.post(payload)
+
+        with trace.span('rpc.request', {'method': payload['method'] if isinstance(payload, dict) else 'batch'}):
+            return self.post(payload)
+
+    def post(self, payload):
 
         self.connection = http.HTTPConnection(self.config.url.hostname, self.config.port,
                                              timeout=self.config.timeout)
 
-        post = json.dumps({'version': '1.1',
-                               'method': method,
-                               'params': args})
+        post = json.dumps(payload)
 
         try:
             self.connection.request('POST', self.config.url.path, post,
@@ -126,23 +190,28 @@ class SmartCashRPC(object):
 
             try:
                 data = response.read().decode('utf8')
-                response = json.loads(data)
+
+                with trace.span('rpc.json'):
+                    response = json.loads(data, parse_float=self.parseFloat)
             except:
                 response = None
 
             if not response:
                 raise RPCException(13, 'JSON response parse error')
 
-            error = response['error'] if 'error' in response else None
-            result = response['result'] if 'result' in response else None
+        return response
+
+    def request(self, method, args = None):
+        return parseResult(self.send(requestPayload(method, args)))
 
-            if error:
-                raise RPCException(response['error']['code'],response['error']['message'])
+    # Send multiple calls as one JSON-RPC batch. Takes a list of
+    # (method, args) tuples and returns the results in the same order.
+    def requestBatch(self, calls):
 
-            if not result:
-                raise RPCException(14,' RPC result missing')
+        if not calls:
+            return []
 
-        return result
+        return parseBatch(calls, self.send(batchPayload(calls)))
 
     def raw(self, method, args):
 
@@ -156,6 +225,15 @@ class SmartCashRPC(object):
 
         return response
 
+    def batch(self, calls):
+
+        try:
+            responses = self.requestBatch(calls)
+        except RPCException as e:
+            responses = [RPCResponse(error=e.error) for _ in calls]
+            logging.debug('batch', exc_info=e)
+
+        return responses
 
     def validateAddress(self, address):
 
@@ -361,3 +439,23 @@ class SmartCashRPC(object):
             logging.debug('verifymessage', exc_info=e)
 
         return response
+
+# Batched getblockhash/getblock of the heights, retried with a backoff.
+# Returns the getblock responses or None if they could not be fetched.
+def fetchBlocks(rpc, heights, retries):
+
+    for attempt in range(retries):
+
+        hashes = rpc.batch([('getblockhash', [x]) for x in heights])
+
+        if not any(x.error for x in hashes):
+
+            blocks = rpc.batch([('getblock', [x.data]) for x in hashes])
+
+            if not any(x.error for x in blocks):
+                return blocks
+
+        logger.warning("fetchBlocks {} - {} failed, retry {}".format(heights[0], heights[-1], attempt + 1))
+        time.sleep(min(30, 2 ** attempt))
+
+    return None
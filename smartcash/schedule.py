@@ -0,0 +1,196 @@
+#
+# Part of `python-smartcash`
+#
+# Reward schedule of the SmartNode payouts. Scalar lookups for
+# the scanner and vectorized NumPy versions for whole height ranges.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from smartcash.util import PAYOUT_SCHEDULE, COIN, getPayoutSchedule, getBlockRewardSatoshis
+
+# NumPy is only needed for the vectorized versions, it gets loaded
+# on the first use to keep the import of the scalar ones fast.
+np = None
+
+FIRST_REWARD_HEIGHT = 300000
+
+# Accepted deviation of a payout from the expected payout.
+TOLERANCE = 0.01
+
+scheduleHeights = [x[0] for x in PAYOUT_SCHEDULE]
+maxPayoutInterval = max(x[2] for x in PAYOUT_SCHEDULE)
+
+def requireNumpy():
+
+    global np
+
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError("NumPy is required for the vectorized schedule, install it with `pip install numpy`")
+
+    return np
+
+#####
+#
+# Scalar versions
+#
+#####
+
+def isRewardHeight(nHeight):
+    return not nHeight % getPayoutSchedule(nHeight)[2]
+
+# Returns (payees, payout, lower, upper) where payout is the expected
+# amount for each payee and lower/upper the accepted band, all in satoshis.
+def getExpectedPayout(nHeight, tolerance = TOLERANCE):
+
+    _, payees, interval = getPayoutSchedule(nHeight)
+
+    # The payout of an interval contains the rewards of all its blocks.
+    blockReward = 0
+
+    for i in range(interval):
+        blockReward += getBlockRewardSatoshis(nHeight - i)
+
+    payout = blockReward // payees
+    band = int(payout * tolerance)
+
+    return payees, payout, payout - band, payout + band
+
+#####
+#
+# Vectorized versions, all for the heights start <= height < stop
+#
+#####
+
+def heights(start, stop):
+
+    requireNumpy()
+
+    return np.arange(start, stop, dtype=np.int64)
+
+def scheduleIndex(start, stop):
+
+    requireNumpy()
+
+    return np.searchsorted(np.array(scheduleHeights, dtype=np.int64), heights(start, stop), side='right') - 1
+
+# Block rewards in satoshis
+def blockRewards(start, stop):
+    return 5000 * 143500 * COIN // (10 * heights(start, stop))
+
+def payeesPerBlock(start, stop):
+
+    requireNumpy()
+
+    return np.array([x[1] for x in PAYOUT_SCHEDULE], dtype=np.int32)[scheduleIndex(start, stop)]
+
+def payoutIntervals(start, stop):
+
+    requireNumpy()
+
+    return np.array([x[2] for x in PAYOUT_SCHEDULE], dtype=np.int32)[scheduleIndex(start, stop)]
+
+def rewardHeights(start, stop):
+    return heights(start, stop) % payoutIntervals(start, stop) == 0
+
+def expectedPayouts(start, stop):
+
+    intervals = payoutIntervals(start, stop)
+
+    # Rewards of the heights start - maxPayoutInterval + 1 ... stop - 1
+    rewards = blockRewards(start - maxPayoutInterval + 1, stop)
+    count = stop - start
+
+    blockReward = np.zeros(count, dtype=np.int64)
+
+    for i in range(maxPayoutInterval):
+        offset = maxPayoutInterval - 1 - i
+        blockReward += np.where(intervals > i, rewards[offset:offset + count], 0)
+
+    return blockReward // payeesPerBlock(start, stop)
+
+def toleranceBands(start, stop, tolerance = TOLERANCE):
+
+    payouts = expectedPayouts(start, stop)
+    bands = (payouts * tolerance).astype(np.int64)
+
+    return payouts - bands, payouts + bands
+
+#####
+#
+# Precomputed lookup table for a range of heights
+#
+#####
+
+class RewardSchedule(object):
+
+    def __init__(self, start = FIRST_REWARD_HEIGHT, stop = None, tolerance = TOLERANCE):
+
+        requireNumpy()
+
+        self.start = start
+        self.stop = start
+        self.tolerance = tolerance
+
+        self.payees = None
+        self.intervals = None
+        self.payouts = None
+        self.lower = None
+        self.upper = None
+        self.rewardHeights = None
+
+        self.extend(stop if stop else start + 100000)
+
+    def extend(self, stop):
+
+        if stop <= self.stop:
+            return
+
+        self.stop = stop
+        self.payees = payeesPerBlock(self.start, stop)
+        self.intervals = payoutIntervals(self.start, stop)
+        self.payouts = expectedPayouts(self.start, stop)
+        self.lower, self.upper = toleranceBands(self.start, stop, self.tolerance)
+        self.rewardHeights = rewardHeights(self.start, stop)
+
+    def index(self, nHeight):
+
+        if nHeight < self.start:
+            raise IndexError("RewardSchedule - {} below {}".format(nHeight, self.start))
+
+        if nHeight >= self.stop:
+            self.extend(max(nHeight + 1, self.stop * 2 - self.start))
+
+        return nHeight - self.start
+
+    def slice(self, start, stop):
+
+        self.index(stop - 1)
+
+        return slice(self.index(start), stop - self.start)
+
+    def expected(self, nHeight):
+
+        i = self.index(nHeight)
+
+        return int(self.payees[i]), int(self.payouts[i]), int(self.lower[i]), int(self.upper[i])
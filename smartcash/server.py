@@ -0,0 +1,525 @@
+#
+# Part of `python-smartcash`
+#
+# Local query server which shares one SNRewardList, its sync thread and its
+# caches between processes, and the client for it. Listens on a unix socket
+# or a localhost TCP port. With --no-sync another process keeps the database
+# up to date, the caches get dropped whenever it committed.
+#
+#     python -m smartcash.server rewards.db --socket /tmp/smartcash.sock --rpc-user ...
+#
+# Frames are a 5 byte header (payload length, codec) followed by the payload,
+# msgpack if it's installed and JSON otherwise. Requests are [id, method, args],
+# responses [id, error, result]. Rewards are sent as rows in export.columns order.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import struct
+import logging
+import argparse
+import threading
+from smartcash.export import columns
+from smartcash.rewardlist import SNRewardList, SNReward
+from smartcash.rpc import RPCConfig
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger("smartcash.server")
+
+HEADER = struct.Struct('>IB')
+MAX_FRAME = 64 * 1024 * 1024
+
+# Codecs
+JSON = 0
+MSGPACK = 1
+
+# Argument types
+NUMBER = 'number'
+PAYEE = 'payee'
+PAYEES = 'payees'
+
+# Result types
+VALUE = 'value'
+REWARD = 'reward'
+REWARDS = 'rewards'
+PAYEE_REWARDS = 'payeeRewards'
+
+# The read API of SNRewardList which gets served, name -> (arguments, result)
+methods = {
+    'getReward': ((NUMBER,), REWARD),
+    'getLastReward': ((), REWARD),
+    'getNextReward': ((NUMBER,), REWARD),
+    'getRewards': ((PAYEE, NUMBER), REWARDS),
+    'getRewardsForPayee': ((PAYEE, NUMBER), REWARDS),
+    'getRewardsForPayees': ((PAYEES, NUMBER), PAYEE_REWARDS),
+    'getRewardCount': ((NUMBER, NUMBER, NUMBER), VALUE),
+    'getRewardStats': ((NUMBER, NUMBER, NUMBER, NUMBER), VALUE),
+    'getHeightAt': ((NUMBER,), VALUE),
+    'getCheckpoint': ((), VALUE),
+    'getStats': ((), VALUE),
+    'getMetrics': ((), VALUE),
+}
+
+payeePattern = re.compile(r'^[A-Za-z0-9]{1,64}$')
+
+class QueryError(Exception):
+    pass
+
+def isNumber(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def checkArgument(kind, value):
+
+    # All arguments of the served methods are optional or None safe.
+    if value is None:
+        return True
+
+    if kind == NUMBER:
+        return isNumber(value)
+    elif kind == PAYEE:
+        return isinstance(value, str) and payeePattern.match(value) != None
+    elif kind == PAYEES:
+        return isinstance(value, list) and all(checkArgument(PAYEE, x) for x in value)
+
+    return False
+
+def rewardToRow(reward):
+    return [getattr(reward, x) for x in columns] if reward else None
+
+def rowToReward(row):
+    return SNReward(**dict(zip(columns, row))) if row != None else None
+
+# JSON only has string keys and msgpack >= 1.0 refuses to unpack others by
+# default (strict_map_key), convert them so both codecs return the same.
+def stringKeys(value):
+
+    if isinstance(value, dict):
+        return {str(k): stringKeys(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [stringKeys(x) for x in value]
+
+    return value
+
+#####
+#
+# Framing
+#
+#####
+
+def encode(value, codec):
+
+    if codec == MSGPACK:
+        return msgpack.packb(value, use_bin_type=True)
+
+    return json.dumps(value, separators=(',', ':')).encode('utf8')
+
+def decode(payload, codec):
+
+    if codec == MSGPACK:
+
+        if msgpack is None:
+            raise QueryError("Received a msgpack frame, install msgpack with `pip install msgpack`")
+
+        try:
+            return msgpack.unpackb(payload, raw=False)
+        except ValueError as e:
+            raise QueryError("Invalid msgpack frame - {}".format(e))
+
+    elif codec == JSON:
+
+        try:
+            return json.loads(payload.decode('utf8'))
+        except ValueError as e:
+            raise QueryError("Invalid JSON frame - {}".format(e))
+
+    raise QueryError("Invalid codec {}".format(codec))
+
+def receive(sock, size):
+
+    data = b''
+
+    while len(data) < size:
+
+        chunk = sock.recv(min(size - len(data), 1024 * 1024))
+
+        if not chunk:
+            return None
+
+        data += chunk
+
+    return data
+
+def sendFrame(sock, value, codec):
+
+    payload = encode(value, codec)
+    sock.sendall(HEADER.pack(len(payload), codec) + payload)
+
+# Returns (value, codec) or (None, None) if the connection got closed.
+def receiveFrame(sock):
+
+    header = receive(sock, HEADER.size)
+
+    if header is None:
+        return None, None
+
+    size, codec = HEADER.unpack(header)
+
+    if size > MAX_FRAME:
+        raise QueryError("Frame too large {}".format(size))
+
+    payload = receive(sock, size)
+
+    if payload is None:
+        return None, None
+
+    return decode(payload, codec), codec
+
+# Unix socket path, (host, port) or "host:port"
+def parseAddress(address):
+
+    if isinstance(address, (tuple, list)):
+        return socket.AF_INET, (address[0], int(address[1]))
+
+    if not '/' in address and ':' in address:
+        host, port = address.rsplit(':', 1)
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+    return socket.AF_UNIX, address
+
+#####
+#
+# Server
+#
+#####
+
+class QueryHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+
+        while True:
+
+            try:
+                request, codec = receiveFrame(self.request)
+            except (socket.error, QueryError, ValueError) as e:
+                logger.warning("receive - {}".format(e))
+                return
+
+            if request is None:
+                return
+
+            try:
+                sendFrame(self.request, self.server.owner.process(request), codec)
+            except socket.error as e:
+                logger.warning("send - {}".format(e))
+                return
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class SNRewardServer(object):
+
+    def __init__(self, rewardList, address):
+
+        self.rewardList = rewardList
+        self.family, self.address = parseAddress(address)
+        self.server = None
+        self.thread = None
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.started = None
+
+    def start(self):
+
+        if self.family == socket.AF_UNIX:
+
+            # Left over from a crash
+            if os.path.exists(self.address):
+                os.remove(self.address)
+
+            self.server = ThreadingUnixServer(self.address, QueryHandler)
+
+        else:
+
+            if not self.address[0] in ('127.0.0.1', 'localhost', '::1'):
+                logger.warning("Listening on {}, the server has no authentication".format(self.address[0]))
+
+            self.server = ThreadingTCPServer(self.address, QueryHandler)
+            self.address = self.server.server_address
+
+        self.server.owner = self
+        self.started = time.time()
+
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        logger.info("Serving on {}".format(self.address))
+
+    def stop(self):
+
+        if not self.server:
+            return
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def getStats(self):
+
+        with self.lock:
+            return {'requests': self.requests, 'errors': self.errors,
+                    'uptime': time.time() - self.started if self.started else 0}
+
+    # [id, method, args] -> [id, error, result]
+    def process(self, request):
+
+        try:
+            id, method, args = request
+        except (TypeError, ValueError):
+            return [None, "Invalid request", None]
+
+        with self.lock:
+            self.requests += 1
+
+        try:
+            return [id, None, self.call(method, args or [])]
+        except QueryError as e:
+            error = str(e)
+        except Exception as e:
+            logger.error("process {}".format(method), exc_info=e)
+            error = "Internal error"
+
+        with self.lock:
+            self.errors += 1
+
+        return [id, error, None]
+
+    def call(self, method, args):
+
+        if not method in methods:
+            raise QueryError("Unknown method {}".format(method))
+
+        kinds, result = methods[method]
+
+        if len(args) > len(kinds):
+            raise QueryError("{} takes at most {} arguments".format(method, len(kinds)))
+
+        for kind, value in zip(kinds, args):
+            if not checkArgument(kind, value):
+                raise QueryError("{} - invalid argument {}".format(method, value))
+
+        value = getattr(self.rewardList, method)(*args)
+
+        if method == 'getStats':
+            value = dict(value, server=self.getStats())
+
+        if result == REWARD:
+            return rewardToRow(value)
+        elif result == REWARDS:
+            return [rewardToRow(x) for x in value] if value != None else None
+        elif result == PAYEE_REWARDS:
+            return {payee: [rewardToRow(x) for x in rewards] for payee, rewards in value.items()}
+
+        return stringKeys(value)
+
+#####
+#
+# Client
+#
+#####
+
+class SNRewardClient(object):
+
+    def __init__(self, address, timeout = 30, codec = None):
+
+        self.family, self.address = parseAddress(address)
+        self.timeout = timeout
+        self.codec = codec if codec != None else (MSGPACK if msgpack else JSON)
+
+        self.lock = threading.Lock()
+        self.sock = None
+        self.nextId = 0
+
+    def connect(self):
+
+        self.sock = socket.socket(self.family, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.address)
+
+    def close(self):
+
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def call(self, method, *args):
+
+        with self.lock:
+
+            self.nextId += 1
+            requestId = self.nextId
+
+            # All calls are reads, try once more with a new connection
+            # if the server went away in between.
+            for attempt in range(2):
+
+                try:
+
+                    if not self.sock:
+                        self.connect()
+
+                    sendFrame(self.sock, [requestId, method, list(args)], self.codec)
+                    response, _ = receiveFrame(self.sock)
+
+                    if response is None:
+                        raise socket.error("Connection closed")
+
+                    break
+
+                except socket.error:
+
+                    self.close()
+
+                    if attempt:
+                        raise
+
+        id, error, result = response
+
+        if error:
+            raise QueryError(error)
+
+        if id != requestId:
+            self.close()
+            raise QueryError("Response {} for request {}".format(id, requestId))
+
+        return result
+
+    def getReward(self, block):
+        return rowToReward(self.call('getReward', block))
+
+    def getLastReward(self):
+        return rowToReward(self.call('getLastReward'))
+
+    def getNextReward(self, fromTime = None):
+        return rowToReward(self.call('getNextReward', fromTime))
+
+    def getRewards(self, payee, start = None):
+        return [rowToReward(x) for x in self.call('getRewards', payee, start) or []]
+
+    def getRewardsForPayee(self, payee, fromTime = None):
+
+        rows = self.call('getRewardsForPayee', payee, fromTime)
+
+        return [rowToReward(x) for x in rows] if rows != None else None
+
+    def getRewardsForPayees(self, payees, fromHeight = None):
+
+        result = self.call('getRewardsForPayees', list(payees), fromHeight)
+
+        return {payee: [rowToReward(x) for x in rows] for payee, rows in result.items()}
+
+    def getRewardCount(self, start = None, meta = None, source = None):
+        return self.call('getRewardCount', start, meta, source)
+
+    def getRewardStats(self, start = None, end = None, meta = None, source = None):
+        return self.call('getRewardStats', start, end, meta, source)
+
+    def getHeightAt(self, timestamp):
+        return self.call('getHeightAt', timestamp)
+
+    def getCheckpoint(self):
+
+        checkpoint = self.call('getCheckpoint')
+
+        return tuple(checkpoint) if checkpoint else None
+
+    def getStats(self):
+        return self.call('getStats')
+
+    def getMetrics(self):
+        return self.call('getMetrics')
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Serve the rewards database to local clients.')
+    parser.add_argument('database', help='Path of the rewards database')
+    parser.add_argument('--socket', default=None, help='Unix socket path to listen on')
+    parser.add_argument('--listen', default=None, help='host:port to listen on instead of a unix socket')
+    parser.add_argument('--rpc-user', default='')
+    parser.add_argument('--rpc-password', default='')
+    parser.add_argument('--rpc-url', default='http://127.0.0.1')
+    parser.add_argument('--rpc-port', type=int, default=9679)
+    parser.add_argument('--no-sync', action='store_true', help='Only serve the database, don\'t run the sync')
+    parser.add_argument('--cache-size', type=int, default=1024)
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    if not args.socket and not args.listen:
+        parser.error("--socket or --listen is required")
+
+    rpcConfig = RPCConfig(args.rpc_user, args.rpc_password, args.rpc_url, args.rpc_port)
+    rewardList = SNRewardList(args.database, rpcConfig, cacheSize=args.cache_size)
+
+    server = SNRewardServer(rewardList, args.socket or args.listen)
+    server.start()
+
+    if not args.no_sync:
+        rewardList.start()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        rewardList.stop()
+        server.stop()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+#
+# Part of `python-smartcash`
+#
+# Compressed and checksummed snapshots of the rewards database to
+# bootstrap new reward indexers without replaying the whole chain.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+import logging
+import argparse
+from smartcash import rollups, checkpoint
+from smartcash.export import iterChunks, columns
+from smartcash.rpc import SmartCashRPC, RPCConfig
+from smartcash.util import toSatoshis
+from smartcash.rewardlist import SNRewardDatabase
+
+logger = logging.getLogger("smartcash.snapshot")
+
+MAGIC = b'SMARTCASH-REWARDS-SNAPSHOT'
+# Version 2 has the amounts in satoshis
+VERSION = 2
+
+# Snapshot layout:
+#
+# MAGIC VERSION\n
+# header JSON\n
+# zlib compressed payload, one JSON encoded row per line
+#
+# The header contains the sha256 of the uncompressed payload.
+
+class SnapshotError(Exception):
+    pass
+
+def readHeader(f):
+
+    magic = f.readline().strip().split(b' ')
+
+    if len(magic) != 2 or magic[0] != MAGIC:
+        raise SnapshotError("No rewards snapshot")
+
+    if not int(magic[1]) in (1, VERSION):
+        raise SnapshotError("Unsupported snapshot version {}".format(int(magic[1])))
+
+    header = json.loads(f.readline().decode('utf8'))
+    header['version'] = int(magic[1])
+
+    return header
+
+def iterPayload(f, chunkSize = 1 << 20):
+
+    decompressor = zlib.decompressobj()
+    pending = b''
+
+    while True:
+
+        data = f.read(chunkSize)
+
+        if not data:
+            break
+
+        pending += decompressor.decompress(data)
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+
+        for line in lines:
+            yield line
+
+    pending += decompressor.flush()
+
+    if pending:
+        yield pending
+
+# Returns (height, hash) of the checkpoint
+def getTip(database):
+
+    with database.connection as db:
+        tip = checkpoint.get(db.cursor)
+
+    return tip if tip else (None, None)
+
+def exportSnapshot(database, path, rpcConfig = None, chunkSize = 100000):
+
+    tip, blockHash = getTip(database)
+
+    if tip is None:
+        raise SnapshotError("No verified rewards to export")
+
+    if rpcConfig and not blockHash:
+
+        response = SmartCashRPC(rpcConfig).raw('getblockhash', [tip])
+
+        if response.error:
+            raise SnapshotError("Could not fetch hash of {} - {}".format(tip, response.error))
+
+        blockHash = response.data
+
+    checksum = hashlib.sha256()
+    compressor = zlib.compressobj(6)
+    rows = 0
+
+    tmpPath = path + '.tmp'
+    payloadPath = path + '.payload'
+
+    try:
+
+        with open(payloadPath, 'wb') as payload:
+
+            for chunk in iterChunks(database, toBlock=tip + 1, chunkSize=chunkSize):
+
+                data = b''.join(json.dumps(row, separators=(',', ':')).encode('utf8') + b'\n' for row in chunk)
+
+                checksum.update(data)
+                payload.write(compressor.compress(data))
+                rows += len(chunk)
+
+            payload.write(compressor.flush())
+
+        header = {'rows': rows,
+                  'columns': columns,
+                  'height': tip,
+                  'hash': blockHash,
+                  'created': int(time.time()),
+                  'sha256': checksum.hexdigest()}
+
+        with open(tmpPath, 'wb') as f:
+
+            f.write(MAGIC + ' {}\n'.format(VERSION).encode('utf8'))
+            f.write(json.dumps(header).encode('utf8') + b'\n')
+
+            with open(payloadPath, 'rb') as payload:
+                while True:
+                    data = payload.read(1 << 20)
+                    if not data:
+                        break
+                    f.write(data)
+
+        os.rename(tmpPath, path)
+
+    finally:
+
+        for leftover in (payloadPath, tmpPath):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    logger.info("exportSnapshot - {} rows up to {} to {}".format(rows, tip, path))
+
+    return header
+
+# Check the checksum and the row count of a snapshot. Returns its header.
+def verifySnapshot(path):
+
+    checksum = hashlib.sha256()
+    rows = 0
+
+    with open(path, 'rb') as f:
+
+        header = readHeader(f)
+
+        try:
+            for line in iterPayload(f):
+                checksum.update(line + b'\n')
+                rows += 1
+        except zlib.error as e:
+            raise SnapshotError("Corrupted payload - {}".format(e))
+
+    if checksum.hexdigest() != header['sha256']:
+        raise SnapshotError("Checksum mismatch {} != {}".format(checksum.hexdigest(), header['sha256']))
+
+    if rows != header['rows']:
+        raise SnapshotError("Row count mismatch {} != {}".format(rows, header['rows']))
+
+    return header
+
+# Bulk load a snapshot into an empty rewards database. The indexes get
+# dropped while loading and rebuilt afterwards, same for the rollups
+# and the checkpoint.
+# SNRewardList.run resumes from the snapshot tip afterwards.
+def importSnapshot(database, path, rpcConfig = None, chunkSize = 100000):
+
+    header = verifySnapshot(path)
+
+    if rpcConfig and header['hash']:
+
+        response = SmartCashRPC(rpcConfig).raw('getblockhash', [header['height']])
+
+        if response.error:
+            raise SnapshotError("Could not fetch hash of {} - {}".format(header['height'], response.error))
+
+        if response.data != header['hash']:
+            raise SnapshotError("Snapshot tip {} not in the chain of the node".format(header['height']))
+
+    query = "INSERT INTO rewards({}) values({})".format(', '.join(header['columns']),
+                                                        ', '.join('?' for _ in header['columns']))
+
+    with database.connection as db:
+
+        db.cursor.execute("SELECT count(*) FROM rewards")
+
+        if db.cursor.fetchone()[0]:
+            raise SnapshotError("Snapshots can only be imported into an empty database")
+
+        db.cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name='rewards' AND sql IS NOT NULL")
+        indexes = [(row['name'], row['sql']) for row in db.cursor.fetchall()]
+
+        db.cursor.execute("PRAGMA synchronous=OFF")
+
+        try:
+
+            db.cursor.execute("BEGIN")
+
+            for name, _ in indexes:
+                db.cursor.execute('DROP INDEX "{}"'.format(name))
+
+            with open(path, 'rb') as f:
+
+                readHeader(f)
+
+                rows = []
+                amount = header['columns'].index('amount') if header['version'] < 2 and 'amount' in header['columns'] else None
+
+                for line in iterPayload(f):
+
+                    row = json.loads(line.decode('utf8'))
+
+                    if amount is not None and row[amount] is not None:
+                        row[amount] = toSatoshis(row[amount])
+
+                    rows.append(row)
+
+                    if len(rows) >= chunkSize:
+                        db.cursor.executemany(query, rows)
+                        rows = []
+
+                if rows:
+                    db.cursor.executemany(query, rows)
+
+            for _, sql in indexes:
+                db.cursor.execute(sql)
+
+            rollups.rebuild(db.cursor)
+            checkpoint.rebuild(db.cursor)
+
+            db.connection.commit()
+
+        except:
+            db.connection.rollback()
+            raise
+
+        finally:
+            db.cursor.execute("PRAGMA synchronous=FULL")
+
+    database.notifyWrite()
+
+    logger.info("importSnapshot - {} rows up to {} from {}".format(header['rows'], header['height'], path))
+
+    return header
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Export and import rewards database snapshots.')
+    parser.add_argument('command', choices=['export', 'import', 'verify'])
+    parser.add_argument('snapshot', help='Path of the snapshot file')
+    parser.add_argument('--database', default=None, help='Path of the rewards database')
+    parser.add_argument('--rpc-user', default=None, help='Fetch/check the tip hash with the node')
+    parser.add_argument('--rpc-password', default=None)
+    parser.add_argument('--rpc-url', default='http://127.0.0.1')
+    parser.add_argument('--rpc-port', type=int, default=9679)
+
+    args = parser.parse_args(argv)
+
+    rpcConfig = None
+
+    if args.rpc_user:
+        rpcConfig = RPCConfig(args.rpc_user, args.rpc_password or '', args.rpc_url, args.rpc_port)
+
+    if args.command != 'verify' and not args.database:
+        parser.error("--database required for {}".format(args.command))
+
+    try:
+
+        if args.command == 'export':
+            header = exportSnapshot(SNRewardDatabase(args.database), args.snapshot, rpcConfig)
+        elif args.command == 'import':
+            header = importSnapshot(SNRewardDatabase(args.database), args.snapshot, rpcConfig)
+        else:
+            header = verifySnapshot(args.snapshot)
+
+    except SnapshotError as e:
+        sys.stderr.write("{}\n".format(e))
+        return 1
+
+    sys.stdout.write(json.dumps(header, indent=2) + '\n')
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
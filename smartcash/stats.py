@@ -0,0 +1,284 @@
+#
+# Part of `python-smartcash`
+#
+# Sync progress and stage timing statistics of the reward scanner
+# with a periodic reporter and a Prometheus text format endpoint.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import time
+import logging
+import threading
+try:
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    import SocketServer as socketserver
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+logger = logging.getLogger("smartcash.stats")
+
+# Stages of the sync loop
+STAGE_RPC = 'rpc'
+STAGE_SEARCH = 'search'
+STAGE_DB = 'db'
+STAGE_CALLBACKS = 'callbacks'
+STAGE_PAUSED = 'paused'
+STAGE_SLEEP = 'sleep'
+
+STAGES = (STAGE_RPC, STAGE_SEARCH, STAGE_DB, STAGE_CALLBACKS, STAGE_PAUSED, STAGE_SLEEP)
+
+class StageTimer(object):
+
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stats.add(self.stage, time.time() - self.start)
+
+class SyncStats(object):
+
+    def __init__(self, smoothing = 0.05):
+
+        self.lock = threading.Lock()
+        self.smoothing = smoothing
+
+        self.started = time.time()
+        self.stages = {stage: [0, 0.0] for stage in STAGES}
+        self.metas = {}
+        self.blocks = 0
+        self.lastBlock = None
+        # Moving average of the seconds per block
+        self.blockInterval = None
+
+    def timer(self, stage):
+        return StageTimer(self, stage)
+
+    def add(self, stage, seconds):
+
+        with self.lock:
+
+            entry = self.stages.setdefault(stage, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def addBlock(self, meta = 0):
+
+        now = time.time()
+
+        with self.lock:
+
+            self.blocks += 1
+            self.metas[meta] = self.metas.get(meta, 0) + 1
+
+            if self.lastBlock is not None:
+
+                interval = now - self.lastBlock
+
+                if self.blockInterval is None:
+                    self.blockInterval = interval
+                else:
+                    self.blockInterval += self.smoothing * (interval - self.blockInterval)
+
+            self.lastBlock = now
+
+    def blocksPerSecond(self):
+
+        interval = self.blockInterval
+
+        if not interval:
+            return 0.0
+
+        return 1.0 / interval
+
+    def eta(self, distance):
+
+        rate = self.blocksPerSecond()
+
+        if distance is None or not rate:
+            return None
+
+        return max(0, distance) / rate
+
+    def get(self, chainHeight = None, currentHeight = None):
+
+        distance = chainHeight - currentHeight if chainHeight != None and currentHeight != None else None
+
+        with self.lock:
+            stages = {stage: {'count': x[0], 'seconds': x[1]} for stage, x in self.stages.items()}
+            metas = dict(self.metas)
+            blocks = self.blocks
+
+        return {'uptime': time.time() - self.started,
+                'blocks': blocks,
+                'blocksPerSecond': self.blocksPerSecond(),
+                'chainHeight': chainHeight,
+                'currentHeight': currentHeight,
+                'distance': distance,
+                'eta': self.eta(distance),
+                'stages': stages,
+                'metas': metas}
+
+    def prometheus(self, chainHeight = None, currentHeight = None, cache = None):
+
+        stats = self.get(chainHeight, currentHeight)
+
+        lines = []
+
+        def metric(name, kind, help, values):
+
+            lines.append('# HELP smartcash_rewards_{} {}'.format(name, help))
+            lines.append('# TYPE smartcash_rewards_{} {}'.format(name, kind))
+
+            for labels, value in values:
+
+                if value is None:
+                    continue
+
+                label = '{' + ','.join('{}="{}"'.format(k, v) for k, v in labels) + '}' if labels else ''
+                lines.append('smartcash_rewards_{}{} {}'.format(name, label, value))
+
+        metric('blocks_total', 'counter', 'Blocks processed since start', [((), stats['blocks'])])
+        metric('blocks_per_second', 'gauge', 'Moving average of the processed blocks per second', [((), stats['blocksPerSecond'])])
+        metric('chain_height', 'gauge', 'Height of the chain', [((), stats['chainHeight'])])
+        metric('current_height', 'gauge', 'Next height to process', [((), stats['currentHeight'])])
+        metric('eta_seconds', 'gauge', 'Estimated seconds until synced', [((), stats['eta'])])
+        metric('stage_seconds_total', 'counter', 'Seconds spent per stage',
+               [((('stage', k),), v['seconds']) for k, v in sorted(stats['stages'].items())])
+        metric('stage_calls_total', 'counter', 'Calls per stage',
+               [((('stage', k),), v['count']) for k, v in sorted(stats['stages'].items())])
+        metric('meta_total', 'counter', 'Processed blocks per meta class',
+               [((('meta', k),), v) for k, v in sorted(stats['metas'].items())])
+
+        # QueryCache.stats() of the reader cache
+        if cache:
+            metric('cache_hits_total', 'counter', 'Query cache hits', [((), cache['hits'])])
+            metric('cache_misses_total', 'counter', 'Query cache misses', [((), cache['misses'])])
+            metric('cache_evictions_total', 'counter', 'Query cache LRU evictions', [((), cache['evictions'])])
+            metric('cache_invalidations_total', 'counter', 'Query cache entries dropped by writes', [((), cache['invalidations'])])
+            metric('cache_entries', 'gauge', 'Cached query results', [((), cache['size'])])
+
+        return '\n'.join(lines) + '\n'
+
+# Periodically calls callback(stats) or logs the stats of a SNRewardList.
+class StatsReporter(threading.Thread):
+
+    def __init__(self, rewardList, interval = 60, callback = None):
+
+        threading.Thread.__init__(self)
+
+        self.daemon = True
+        self.rewardList = rewardList
+        self.interval = interval
+        self.callback = callback
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+
+        while not self.stopped.wait(self.interval):
+
+            stats = self.rewardList.getStats()
+
+            if self.callback:
+
+                try:
+                    self.callback(stats)
+                except Exception as e:
+                    logger.error("StatsReporter callback", exc_info=e)
+
+            else:
+                logger.info("Height {}/{} - {:.2f} blocks/s - ETA {}s".format(stats['currentHeight'],
+                                                                             stats['chainHeight'],
+                                                                             stats['blocksPerSecond'],
+                                                                             int(stats['eta']) if stats['eta'] != None else '?'))
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.server.rewardList.getMetrics().encode('utf8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+
+    def get_request(self):
+        request, _ = socketserver.UnixStreamServer.get_request(self)
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ('local', 0)
+
+# Serves the metrics of a SNRewardList in Prometheus text format either
+# on localhost:port or on the unix socket path.
+class MetricsServer(object):
+
+    def __init__(self, rewardList, port = None, path = None, host = '127.0.0.1'):
+
+        if (port is None) == (path is None):
+            raise ValueError("MetricsServer needs either a port or a path")
+
+        self.path = path
+
+        if path:
+
+            if os.path.exists(path):
+                os.remove(path)
+
+            self.server = UnixHTTPServer(path, MetricsHandler)
+        else:
+            self.server = HTTPServer((host, port), MetricsHandler)
+
+        self.server.rewardList = rewardList
+        self.thread = None
+
+    def start(self):
+
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,169 @@
+#
+# Part of `python-smartcash`
+#
+# Tracing hooks around the RPC and database hot paths. Disabled by
+# default, ChromeTracer writes Chrome trace-event JSON.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import json
+import time
+import threading
+import functools
+
+# Monotonic high resolution clock of the spans
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+# Interface of all tracers, does nothing by default.
+class Tracer(object):
+
+    # Only enabled tracers get called at all
+    enabled = False
+
+    # Returns a token which gets passed to end
+    def start(self, name, args = None):
+        return None
+
+    def end(self, token):
+        pass
+
+class Span(object):
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.token = None
+
+    def __enter__(self):
+        self.token = self.tracer.start(self.name, self.args)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.tracer.end(self.token)
+
+class NoSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+noSpan = NoSpan()
+tracer = Tracer()
+
+def setTracer(newTracer):
+
+    global tracer
+
+    tracer = newTracer if newTracer else Tracer()
+
+def getTracer():
+    return tracer
+
+def isEnabled():
+    return tracer.enabled
+
+def span(name, args = None):
+
+    if not tracer.enabled:
+        return noSpan
+
+    return Span(tracer, name, args)
+
+# Decorator which traces every call of the function as span `name`.
+def traced(name):
+
+    def decorator(function):
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+
+            with Span(tracer, name, None):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+# Collects complete events ("ph": "X") which can be loaded with
+# chrome://tracing or https://ui.perfetto.dev
+class ChromeTracer(Tracer):
+
+    enabled = True
+
+    def __init__(self, path = None, maxEvents = 1000000):
+
+        self.path = path
+        self.maxEvents = maxEvents
+        self.lock = threading.Lock()
+        self.events = []
+        self.dropped = 0
+        self.pid = os.getpid()
+
+    def start(self, name, args = None):
+        return (name, args, clock(), threading.current_thread().ident)
+
+    def end(self, token):
+
+        now = clock()
+        name, args, start, thread = token
+
+        event = {'name': name,
+                 'ph': 'X',
+                 'ts': int(round(start * 1000000)),
+                 'dur': int(round((now - start) * 1000000)),
+                 'pid': self.pid,
+                 'tid': thread}
+
+        if args:
+            event['args'] = args
+
+        with self.lock:
+
+            if len(self.events) < self.maxEvents:
+                self.events.append(event)
+            else:
+                self.dropped += 1
+
+    def clear(self):
+
+        with self.lock:
+            self.events = []
+            self.dropped = 0
+
+    def save(self, path = None):
+
+        with self.lock:
+            events = list(self.events)
+
+        with open(path or self.path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+        return len(events)
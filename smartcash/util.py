@@ -23,6 +23,8 @@
 
 import threading
 import sqlite3 as sql
+from decimal import Decimal, ROUND_HALF_UP
+from smartcash import trace
 
 HF_1_2_MULTINODE_PAYMENTS = 545005
 HF_1_2_8_COLLATERAL_CHANGE = 910000
@@ -33,8 +35,12 @@ class ThreadedSQLite(object):
         self.connection = sql.connect(dburi, check_same_thread=False)
         self.connection.row_factory = sql.Row
         self.cursor = None
+        self.holdSpan = None
     def __enter__(self):
-        self.lock.acquire()
+        with trace.span('db.lock.acquire'):
+            self.lock.acquire()
+        self.holdSpan = trace.span('db.lock.hold')
+        self.holdSpan.__enter__()
         self.cursor = self.connection.cursor()
         return self
     def __exit__(self, type, value, traceback):
@@ -44,23 +50,49 @@ class ThreadedSQLite(object):
             self.cursor.close()
             self.cursor = None
 
+        self.holdSpan.__exit__(type, value, traceback)
         self.lock.release()
 
-def getPayeesPerBlock(nHeight):
+# Payout schedule as (first height, payees per block, payout interval)
+# sorted by height, one entry per hardfork which changed the payouts.
+PAYOUT_SCHEDULE = (
+    (0, 1, 1),
+    (HF_1_2_MULTINODE_PAYMENTS, 10, 2),
+    (HF_1_2_8_COLLATERAL_CHANGE, 1, 2),
+)
 
-    if nHeight >= HF_1_2_MULTINODE_PAYMENTS and nHeight < HF_1_2_8_COLLATERAL_CHANGE:
-        return 10
-    elif nHeight >= HF_1_2_8_COLLATERAL_CHANGE:
-        return 1
+def getPayoutSchedule(nHeight):
 
-    return 1
+    for schedule in reversed(PAYOUT_SCHEDULE):
+        if nHeight >= schedule[0]:
+            return schedule
 
-def getPayoutInterval(nHeight):
+    return PAYOUT_SCHEDULE[0]
 
-    if nHeight >= HF_1_2_MULTINODE_PAYMENTS:
-        return 2
+def getPayeesPerBlock(nHeight):
+    return getPayoutSchedule(nHeight)[1]
 
-    return 1
+def getPayoutInterval(nHeight):
+    return getPayoutSchedule(nHeight)[2]
 
 def getBlockReward(nHeight):
     return 5000.0  * ( 143500.0 / nHeight ) * 0.1
+
+# Amounts are integer satoshis, COIN of them make one SMART.
+COIN = 100000000
+
+# Block reward in satoshis, same as getBlockReward but exact.
+def getBlockRewardSatoshis(nHeight):
+    return 5000 * 143500 * COIN // (10 * nHeight)
+
+# Convert a SMART amount into satoshis. Pass a Decimal or a string to
+# avoid the float rounding, see SmartCashRPC(exactAmounts=True).
+def toSatoshis(value):
+
+    if isinstance(value, float):
+        return int(round(value * COIN))
+
+    return int((Decimal(value) * COIN).to_integral_value(rounding=ROUND_HALF_UP))
+
+def toCoins(satoshis):
+    return Decimal(satoshis) / COIN
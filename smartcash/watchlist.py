@@ -0,0 +1,165 @@
+#
+# Part of `python-smartcash`
+#
+# Payee watchlists with hash based matching of the rewarded payees.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import json
+import logging
+import threading
+import itertools
+
+logger = logging.getLogger("smartcash.watchlist")
+
+# The payee column holds a JSON list of addresses for paid rewards and
+# a plain marker like "error" for the others.
+def getPayees(payee):
+
+    if not payee or payee[0] != '[':
+        return [payee] if payee else []
+
+    try:
+        return json.loads(payee)
+    except ValueError:
+        return [payee]
+
+class Subscription(object):
+
+    def __init__(self, id, payees, callback):
+        self.id = id
+        self.payees = set(payees)
+        self.callback = callback
+
+    def __str__(self):
+        return 'Subscription {} - {} payees'.format(self.id, len(self.payees))
+
+class PayeeWatchlist(object):
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+        self.subscriptions = {}
+        # payee -> set of subscription ids
+        self.index = {}
+
+    def subscribe(self, payees, callback):
+
+        with self.lock:
+
+            subscription = Subscription(next(self.ids), payees, callback)
+            self.subscriptions[subscription.id] = subscription
+
+            for payee in subscription.payees:
+                self.index.setdefault(payee, set()).add(subscription.id)
+
+        return subscription.id
+
+    def unsubscribe(self, id):
+
+        with self.lock:
+
+            subscription = self.subscriptions.pop(id, None)
+
+            if not subscription:
+                return False
+
+            self.removeFromIndex(subscription, subscription.payees)
+
+        return True
+
+    def add(self, id, payees):
+
+        with self.lock:
+
+            subscription = self.subscriptions[id]
+
+            for payee in payees:
+                subscription.payees.add(payee)
+                self.index.setdefault(payee, set()).add(id)
+
+    def remove(self, id, payees):
+
+        with self.lock:
+
+            subscription = self.subscriptions[id]
+            payees = set(payees) & subscription.payees
+
+            subscription.payees -= payees
+            self.removeFromIndex(subscription, payees)
+
+    def removeFromIndex(self, subscription, payees):
+
+        for payee in payees:
+
+            ids = self.index.get(payee)
+
+            if ids:
+                ids.discard(subscription.id)
+
+                if not ids:
+                    del self.index[payee]
+
+    def payees(self, id = None):
+
+        with self.lock:
+
+            if id != None:
+                return set(self.subscriptions[id].payees)
+
+            return set(self.index)
+
+    # Returns {subscription: [matched payees]} for the given payees.
+    def match(self, payees):
+
+        matches = {}
+
+        with self.lock:
+
+            for payee in payees:
+
+                for id in self.index.get(payee, ()):
+                    matches.setdefault(self.subscriptions[id], []).append(payee)
+
+        return matches
+
+    # Call the callbacks of the subscriptions matching the reward, on the
+    # workers of the dispatcher if there is one.
+    def notify(self, reward, distance, dispatcher = None):
+
+        if not self.index:
+            return
+
+        for subscription, payees in self.match(getPayees(reward.payee)).items():
+
+            if dispatcher:
+                dispatcher.watch(subscription, reward, payees, distance)
+                continue
+
+            try:
+                subscription.callback(reward, payees, distance)
+            except Exception as e:
+                logger.error("notify {}".format(subscription), exc_info=e)
+
+    def __len__(self):
+        return len(self.subscriptions)
@@ -0,0 +1,102 @@
+#
+# Part of `python-smartcash`
+#
+# Helpers for the offline tests. They run against the synthetic chain and
+# the mock daemon of the benchmarks, no SmartCash daemon required.
+#
+#     python -m unittest discover -s tests -p 'test_*_offline.py'
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from benchmarks.chain import SyntheticChain
+from benchmarks.mockd import MockDaemon
+from smartcash.rpc import RPCConfig
+from smartcash.export import columns
+from smartcash.rewardlist import SNReward
+
+def waitFor(condition, timeout = 60):
+
+    stop = time.time() + timeout
+
+    while time.time() < stop:
+
+        if condition():
+            return True
+
+        time.sleep(0.01)
+
+    return False
+
+# The expected SNReward of a height of the synthetic chain
+def chainReward(chain, height):
+    return SNReward(**dict(zip(columns, chain.reward(height))))
+
+# SyntheticChain with a second branch from `fork` on, set fork to reorganize.
+class ForkedChain(SyntheticChain):
+
+    fork = None
+
+    def blockHash(self, height):
+
+        if self.fork and height >= self.fork:
+            return '{:08x}'.format(height) + self.hash('alt', height)[8:]
+
+        return SyntheticChain.blockHash(self, height)
+
+class OfflineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='smartcash-test-')
+        self.daemons = []
+        self.cleanups = []
+
+    def tearDown(self):
+
+        for cleanup in self.cleanups:
+            cleanup()
+
+        for daemon in self.daemons:
+            daemon.stop()
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def startDaemon(self, chain, latency = 0.0):
+
+        daemon = MockDaemon(chain, latency=latency).start()
+        self.daemons.append(daemon)
+
+        return daemon
+
+    def rpcConfig(self, daemon):
+        return RPCConfig('test', 'test', port=daemon.port)
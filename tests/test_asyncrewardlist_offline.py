@@ -0,0 +1,146 @@
+#
+# Part of `python-smartcash`
+#
+# Offline tests of the asyncio reward sync.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import asyncio
+import threading
+import unittest
+from unittest import mock
+from offline import OfflineTest, ForkedChain
+from smartcash.asyncrewardlist import AsyncSNRewardList, runningLoop
+from smartcash.dispatch import EventDispatcher
+from smartcash.export import columns
+from smartcash.rewardlist import SNReward
+
+START = 545000
+
+def row(reward):
+    return tuple(getattr(reward, x) for x in columns) if reward else None
+
+async def waitUntil(condition, timeout = 60):
+
+    loop = asyncio.get_running_loop()
+    stop = loop.time() + timeout
+
+    while loop.time() < stop:
+
+        if condition():
+            return True
+
+        await asyncio.sleep(0.01)
+
+    return False
+
+class AsyncRewardListTest(OfflineTest):
+
+    def setUp(self):
+
+        OfflineTest.setUp(self)
+
+        self.chain = ForkedChain(START, START + 200)
+        self.daemon = self.startDaemon(self.chain)
+
+    def rewardList(self, **kwargs):
+
+        rewardList = AsyncSNRewardList(self.path('rewards.db'), self.rpcConfig(self.daemon), concurrency=8, **kwargs)
+        rewardList.addReward(SNReward(block=START - 1, txtime=0, payee='NoRewardBlock', meta=-3, verified=1))
+
+        return rewardList
+
+    def assertMatches(self, rewardList, stop):
+        for height in range(START, stop):
+            self.assertEqual(row(rewardList.getReward(height)), self.chain.reward(height))
+
+    # Regression: start took asyncio.get_event_loop() and silently bound to
+    # a loop which wasn't running.
+    def testStartNeedsRunningLoop(self):
+
+        dispatcher = EventDispatcher()
+        rewardList = self.rewardList(dispatcher=dispatcher)
+
+        with self.assertRaises(RuntimeError):
+            rewardList.start()
+
+        self.assertEqual(rewardList.task, None)
+        self.assertFalse(dispatcher.isRunning())
+
+    # Python 3.5 and 3.6 have no asyncio.get_running_loop
+    def testRunningLoopFallback(self):
+
+        async def run():
+
+            with mock.patch.dict(asyncio.__dict__):
+                del asyncio.get_running_loop
+                self.assertIs(runningLoop(), asyncio.get_event_loop())
+
+        asyncio.run(run())
+
+    def testSyncAndReorg(self):
+
+        rewards = []
+        retracted = []
+
+        async def rewardCB(reward, distance):
+            rewards.append(reward.block)
+
+        async def run():
+
+            rewardList = self.rewardList(rewardCB=rewardCB, retractCB=lambda x: retracted.append(x.block))
+            rewardList.start()
+
+            tip = self.chain.tip() - 2
+
+            self.assertTrue(await waitUntil(lambda: rewardList.currentHeight == tip + 1))
+            self.assertEqual(rewards, [x for x in range(START, tip + 1) if self.chain.reward(x)[5] == 0])
+            self.assertMatches(rewardList, tip + 1)
+
+            # Pause from another thread, the new blocks wait for the resume
+            pause = threading.Thread(target=rewardList.pause)
+            pause.start()
+            pause.join()
+
+            synced = tip + 1
+            self.chain.fork = self.chain.tip() - 10
+            self.chain.stop += 20
+
+            await asyncio.sleep(0.2)
+            self.assertEqual(rewardList.currentHeight, tip + 1)
+
+            rewardList.resume()
+
+            tip = self.chain.tip() - 2
+
+            self.assertTrue(await waitUntil(lambda: rewardList.currentHeight == tip + 1))
+            self.assertEqual(retracted, list(range(self.chain.fork, synced)))
+            self.assertMatches(rewardList, tip + 1)
+
+            await rewardList.close()
+
+            self.assertTrue(rewardList.task.done())
+
+        asyncio.run(run())
+
+if __name__ == '__main__':
+    unittest.main()
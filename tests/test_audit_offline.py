@@ -0,0 +1,91 @@
+#
+# Part of `python-smartcash`
+#
+# Offline tests of the audit, they run against rows of the synthetic chain.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import unittest
+from offline import OfflineTest, SyntheticChain, chainReward
+from smartcash import audit, backfill
+from smartcash.rewardlist import SNRewardDatabase, SNReward
+from smartcash.schedule import isRewardHeight
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+START = 545000
+STOP = START + 2000
+
+@unittest.skipIf(numpy == None, "numpy not installed")
+class AuditTest(OfflineTest):
+
+    def setUp(self):
+
+        OfflineTest.setUp(self)
+
+        self.chain = SyntheticChain(START, STOP, missingTxRate=0.02, unresolvedRate=0.02)
+        self.dbPath = self.path('rewards.db')
+        self.database = SNRewardDatabase(self.dbPath)
+
+        backfill.insertRewards(self.database, [chainReward(self.chain, x) for x in range(START, STOP)])
+
+    def audit(self):
+        return audit.audit(self.dbPath, processes=2, chunkSize=500)
+
+    def testCleanDatabase(self):
+
+        metas = [(self.chain.reward(x)[5], isRewardHeight(x)) for x in range(START, STOP)]
+
+        # Make sure all kind of rows are covered, including the rows without
+        # transactions at no reward heights.
+        self.assertIn((-1, False), metas)
+        self.assertIn((-1, True), metas)
+        self.assertIn((-2, True), metas)
+        self.assertIn((-3, False), metas)
+        self.assertIn((0, True), metas)
+
+        report = self.audit()
+
+        self.assertEqual(report['rows'], STOP - START)
+        self.assertEqual(report['issues'], [])
+        self.assertEqual(report['flagged'], [])
+
+    def testBrokenRows(self):
+
+        noReward = next(x for x in range(START, STOP) if self.chain.reward(x)[5] == -3)
+        paid = next(x for x in range(START + 100, STOP) if self.chain.reward(x)[5] == 0)
+        gap = paid + 2
+
+        with self.database.connection as db:
+            db.cursor.execute("DELETE FROM rewards WHERE block=?", (gap,))
+
+        backfill.insertRewards(self.database, [SNReward(block=noReward, txtime=0, payee='error', meta=-2, verified=1),
+                                               SNReward(block=paid, txtime=self.chain.blockTime(paid), payee='["Sa"]',
+                                                        amount=chainReward(self.chain, paid).amount, meta=0, verified=1)])
+
+        report = self.audit()
+
+        self.assertEqual(sorted((x['block'], x['rule']) for x in report['issues']),
+                         sorted([(noReward, audit.RULE_NO_REWARD), (paid, audit.RULE_PAYEES), (gap, audit.RULE_GAP)]))
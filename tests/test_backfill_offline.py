@@ -0,0 +1,187 @@
+#
+# Part of `python-smartcash`
+#
+# Offline tests of the sharded backfill and its merge checks.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import unittest
+import sqlite3 as sql
+from offline import OfflineTest, SyntheticChain
+from smartcash import backfill, checkpoint
+from smartcash.export import columns
+from smartcash.rewardlist import SNRewardDatabase, SNReward
+
+START = 545000
+
+class BackfillTest(OfflineTest):
+
+    def setUp(self):
+
+        OfflineTest.setUp(self)
+
+        self.chain = SyntheticChain(START, START + 120)
+        self.daemon = self.startDaemon(self.chain)
+        self.dbPath = self.path('rewards.db')
+        self.database = SNRewardDatabase(self.dbPath)
+
+        backfill.insertRewards(self.database, [SNReward(block=START - 1, txtime=0, payee='NoRewardBlock',
+                                                        meta=-3, verified=1)])
+
+    def rows(self):
+
+        connection = sql.connect(self.dbPath)
+
+        try:
+            return connection.execute("SELECT {} FROM rewards WHERE block>=? ORDER BY block".format(', '.join(columns)),
+                                      (START,)).fetchall()
+        finally:
+            connection.close()
+
+    def checkpoint(self):
+
+        with self.database.connection as db:
+            return checkpoint.get(db.cursor)
+
+    def shard(self, start, stop):
+        return backfill.backfillShard((self.rpcConfig(self.daemon), self.path('shard-{}.db'.format(start)),
+                                       start, stop, 25, 1))
+
+    def testBackfill(self):
+
+        stop = self.chain.tip() - backfill.MIN_CONFIRMATIONS + 2
+        result = backfill.backfill(self.dbPath, self.rpcConfig(self.daemon), shards=3, workdir=self.directory)
+
+        self.assertEqual((result['start'], result['stop']), (START, stop))
+        self.assertTrue(all(x['complete'] for x in result['shards']))
+        self.assertEqual(self.rows(), [self.chain.reward(x) for x in range(START, stop)])
+        self.assertEqual(self.checkpoint()[0], stop - 1)
+
+        # Nothing left to do
+        self.assertEqual(backfill.backfill(self.dbPath, self.rpcConfig(self.daemon), workdir=self.directory)['merged'], 0)
+
+    def testMergeRejectsGap(self):
+
+        shards = [self.shard(START + 20, START + 40)]
+
+        with self.assertRaises(backfill.BackfillError):
+            backfill.merge(self.database, shards)
+
+        self.assertEqual(self.rows(), [])
+        self.assertTrue(os.path.exists(shards[0]['path']))
+
+    def testMergeRejectsShardGap(self):
+
+        shards = [self.shard(START, START + 20), self.shard(START + 30, START + 40)]
+
+        with self.assertRaises(backfill.BackfillError):
+            backfill.merge(self.database, shards)
+
+        self.assertEqual(self.rows(), [])
+
+    def testMergeStopsAtIncompleteShard(self):
+
+        shards = [self.shard(START, START + 20), self.shard(START + 20, START + 40), self.shard(START + 40, START + 60)]
+        shards[1]['complete'] = False
+
+        merged = backfill.merge(self.database, shards)
+
+        self.assertEqual(merged, shards[:1])
+        self.assertEqual(self.rows(), [self.chain.reward(x) for x in range(START, START + 20)])
+        self.assertEqual(self.checkpoint()[0], START + 19)
+        self.assertTrue(os.path.exists(shards[2]['path']))
+
+    # Regression: a failing check of a later shard left the earlier shards
+    # merged without rebuilding the rollups and the checkpoint.
+    def testMergeChecksAllShardsFirst(self):
+
+        shards = [self.shard(START, START + 20), self.shard(START + 20, START + 40)]
+
+        connection = sql.connect(shards[1]['path'])
+        connection.execute("DELETE FROM rewards WHERE block=?", (START + 30,))
+        connection.commit()
+        connection.close()
+
+        before = self.checkpoint()
+
+        with self.assertRaises(backfill.BackfillError):
+            backfill.merge(self.database, shards)
+
+        self.assertEqual(self.rows(), [])
+        self.assertEqual(self.checkpoint(), before)
+        self.assertTrue(all(os.path.exists(x['path']) for x in shards))
+
+    def refetch(self, shard):
+        return backfill.refetchShard((self.rpcConfig(self.daemon), shard['path'], shard['start'], shard['stop'], 25, 1))
+
+    def setPrevHash(self, shard, block, prevhash):
+
+        connection = sql.connect(shard['path'])
+        connection.execute("UPDATE rewards SET prevhash=? WHERE block=?", (prevhash, block))
+        connection.commit()
+        connection.close()
+
+    def testMergeRefetchesUnlinkedShard(self):
+
+        shards = [self.shard(START, START + 20), self.shard(START + 20, START + 40)]
+
+        self.setPrevHash(shards[1], START + 20, 'stale')
+
+        with self.assertRaises(backfill.BackfillError):
+            backfill.merge(self.database, shards)
+
+        self.assertEqual(self.rows(), [])
+
+        refetched = []
+
+        def refetch(shard):
+            refetched.append(shard['start'])
+            return self.refetch(shard)
+
+        backfill.merge(self.database, shards, refetch)
+
+        self.assertEqual(refetched, [START + 20])
+        self.assertEqual(self.rows(), [self.chain.reward(x) for x in range(START, START + 40)])
+
+    # The first shard has to continue the last verified row of the database.
+    def testMergeRejectsUnlinkedDatabase(self):
+
+        with self.database.connection as db:
+            db.cursor.execute("UPDATE rewards SET hash='other' WHERE block=?", (START - 1,))
+
+        shards = [self.shard(START, START + 20)]
+
+        with self.assertRaises(backfill.BackfillError):
+            backfill.merge(self.database, shards, self.refetch)
+
+        self.assertEqual(self.rows(), [])
+
+        with self.database.connection as db:
+            db.cursor.execute("UPDATE rewards SET hash=? WHERE block=?", (self.chain.blockHash(START - 1), START - 1))
+
+        backfill.merge(self.database, shards, self.refetch)
+
+        self.assertEqual(self.rows(), [self.chain.reward(x) for x in range(START, START + 20)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+#
+# Part of `python-smartcash`
+#
+# Offline tests of the chain indexer and its write-back UTXO cache.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import threading
+import unittest
+from offline import OfflineTest, SyntheticChain, waitFor
+from smartcash.blockchain import SmartCashBlockchain
+from smartcash.util import toSatoshis
+
+START = 545000
+
+# {(txid, n): (address, amount, height)} of the synthetic chain up to top
+def referenceUTXO(chain, top):
+
+    utxo = {}
+
+    for height in range(START, top + 1):
+
+        if not chain.hasTransactions(height):
+            continue
+
+        for i in range(1 + chain.extraTxs):
+
+            tx = chain.transaction(height, i)
+
+            for vin in tx['vin']:
+                if 'txid' in vin:
+                    utxo.pop((vin['txid'], vin['vout']), None)
+
+            for vout in tx['vout']:
+                utxo[(tx['txid'], vout['n'])] = (vout['scriptPubKey']['addresses'][0], toSatoshis(vout['value']), height)
+
+    return utxo
+
+class BlockchainTest(OfflineTest):
+
+    def setUp(self):
+
+        OfflineTest.setUp(self)
+
+        self.chain = SyntheticChain(START, START + 300, extraTxs=3)
+        self.daemon = self.startDaemon(self.chain)
+
+    def indexer(self, cacheSize = 0.05, **kwargs):
+
+        indexer = SmartCashBlockchain(self.path('chain.db'), self.rpcConfig(self.daemon), batchSize=37,
+                                      startHeight=START, cacheSize=cacheSize, **kwargs)
+        self.cleanups.append(indexer.stop)
+
+        return indexer
+
+    def assertMatches(self, indexer, top):
+
+        utxo = referenceUTXO(self.chain, top)
+        addresses = {}
+
+        for outpoint, (address, amount, height) in utxo.items():
+            addresses.setdefault(address, []).append((outpoint[0], outpoint[1], amount, height))
+
+        for address, outputs in addresses.items():
+            self.assertEqual(indexer.getBalance(address), sum(x[2] for x in outputs))
+            self.assertEqual(indexer.getNumerOfOutputs(address), len(outputs))
+            self.assertEqual(sorted(indexer.getUnspent(address)), sorted(outputs))
+
+    def testSync(self):
+
+        indexer = self.indexer()
+        indexer.start()
+
+        self.assertTrue(waitFor(lambda: indexer.flushedHeight == self.chain.tip() - 5))
+
+        indexer.stop()
+        indexer.join(10)
+
+        self.assertMatches(indexer, indexer.height)
+        self.assertGreater(indexer.cache.stats()['hits'], 0)
+
+    def testUnflushedChangesAreVisible(self):
+
+        # The cache never fills up, nothing gets flushed before the tip.
+        indexer = self.indexer(cacheSize=450)
+        indexer.indexBlocks(list(range(START, START + 50)))
+
+        self.assertEqual(indexer.flushedHeight, None)
+        self.assertMatches(indexer, START + 49)
+
+    def testRestartAfterCrash(self):
+
+        indexer = self.indexer()
+        indexer.start()
+
+        self.assertTrue(waitFor(lambda: indexer.height != None and indexer.height >= START + 150))
+
+        # Crash, nothing unflushed reaches the database.
+        indexer.flush = lambda: None
+        indexer.stop()
+        indexer.join(10)
+
+        restarted = SmartCashBlockchain(self.path('chain.db'), self.rpcConfig(self.daemon), batchSize=37, cacheSize=0.05)
+
+        self.assertTrue(restarted.height <= indexer.height)
+        self.assertEqual(restarted.hash, self.chain.blockHash(restarted.height))
+        self.assertMatches(restarted, restarted.height)
+
+        restarted.start()
+        self.cleanups.append(restarted.stop)
+
+        self.assertTrue(waitFor(lambda: restarted.flushedHeight == self.chain.tip() - 5))
+        self.assertMatches(restarted, restarted.height)
+
+    # Regression: readers took the cache lock before the database lock,
+    # flush the other way around and both hung forever.
+    def testReadersDuringFlush(self):
+
+        indexer = self.indexer(cacheSize=0.01)
+        address = referenceUTXO(self.chain, START + 10).popitem()[1][0]
+        done = threading.Event()
+
+        def read():
+            while not done.is_set():
+                indexer.getBalance(address)
+                indexer.getUnspent(address)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+
+        for reader in readers:
+            reader.daemon = True
+            reader.start()
+
+        indexer.start()
+        synced = waitFor(lambda: indexer.flushedHeight == self.chain.tip() - 5, 60)
+        done.set()
+
+        self.assertTrue(synced)
+
+        for reader in readers:
+            reader.join(10)
+            self.assertFalse(reader.is_alive())
+
+    def testPendingIsPerAddress(self):
+
+        indexer = self.indexer(cacheSize=450)
+        indexer.indexBlocks(list(range(START, START + 50)))
+
+        utxo = referenceUTXO(self.chain, START + 49)
+        address = next(iter(utxo.values()))[0]
+        entries = indexer.cache.pendingEntries(address)
+
+        self.assertEqual(sorted(entries), sorted(k for k, v in utxo.items() if v[0] == address))
+        self.assertTrue(all(x[0] == address for x in entries.values()))
+
+if __name__ == '__main__':
+    unittest.main()
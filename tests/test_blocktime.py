@@ -0,0 +1,146 @@
+#
+# Part of `python-smartcash`
+#
+# Tests of the block time index.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from smartcash.blocktime import BlockTimeIndex
+from smartcash.util import ThreadedSQLite
+
+START = 545000
+
+class Database(object):
+
+    def __init__(self, rows):
+
+        self.connection = ThreadedSQLite(':memory:')
+
+        with self.connection as db:
+            db.cursor.execute("CREATE TABLE rewards (block INTEGER PRIMARY KEY, txtime INTEGER)")
+            db.cursor.executemany("INSERT INTO rewards VALUES(?,?)", rows)
+
+# Heights with times which go back and forth, marker rows without time
+# and a few missing heights.
+def randomRows(count, seed = 1):
+
+    rnd = random.Random(seed)
+    rows = []
+
+    for height in range(START, START + count):
+
+        if rnd.random() < 0.02:
+            continue
+
+        txtime = 0 if rnd.random() < 0.05 else 1500000000 + height * 55 + rnd.randint(-300, 300)
+        rows.append((height, txtime))
+
+    return rows
+
+class BlockTimeIndexTest(unittest.TestCase):
+
+    def assertHeights(self, index, rows):
+
+        times = sorted(set(x[1] for x in rows if x[1]))
+
+        for timestamp in times[::7] + [times[0] - 1, times[-1], times[-1] + 1]:
+
+            height = index.height(timestamp)
+
+            # All rows at or after the timestamp are at or above the height,
+            # and the height is the first one reached by the corrected time.
+            self.assertTrue(all(x[0] >= height for x in rows if x[1] >= timestamp), timestamp)
+            self.assertTrue(height == index.start or index.time(height - 1) < timestamp)
+
+    def testLoad(self):
+
+        rows = randomRows(2000)
+        index = BlockTimeIndex()
+        index.load(Database(rows), chunkSize=99)
+
+        self.assertTrue(index.loaded)
+        self.assertEqual((index.start, index.stop), (rows[0][0], rows[-1][0] + 1))
+        self.assertHeights(index, rows)
+
+        # Not decreasing, markers and gaps get the time before them
+        times = [index.time(x) for x in range(index.start, index.stop)]
+        self.assertEqual(times, sorted(times))
+
+        self.assertEqual(index.time(index.stop), None)
+        self.assertEqual(index.height(times[-1] + 1), index.stop)
+
+    def testAppendMatchesLoad(self):
+
+        rows = randomRows(500, seed=2)
+
+        loaded = BlockTimeIndex()
+        loaded.load(Database(rows))
+
+        appended = BlockTimeIndex()
+        appended.loaded = True
+
+        for height, txtime in rows:
+            appended.add(height, txtime)
+
+        self.assertEqual(list(appended.times), list(loaded.times))
+
+    def testReplaceTop(self):
+
+        index = BlockTimeIndex()
+        index.loaded = True
+
+        for height, txtime in ((START, 100), (START + 1, 200), (START + 2, 300), (START + 3, 400)):
+            index.add(height, txtime)
+
+        # A reorg continues at START + 2 with other times
+        index.add(START + 2, 250)
+
+        self.assertEqual(list(index.times), [100, 200, 250])
+
+        index.truncate(START + 1)
+
+        self.assertEqual(list(index.times), [100])
+        self.assertEqual(index.height(150), START + 1)
+
+    def testNotLoaded(self):
+
+        index = BlockTimeIndex()
+        index.add(START, 100)
+
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.height(100), 0)
+
+        index.load(Database([(START, 100)]))
+        index.reset()
+
+        self.assertFalse(index.loaded)
+        self.assertEqual(len(index), 0)
+
+if __name__ == '__main__':
+    unittest.main()
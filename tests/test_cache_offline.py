@@ -0,0 +1,192 @@
+#
+# Part of `python-smartcash`
+#
+# Tests of the query result cache and its invalidation.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import json
+import time
+import threading
+import unittest
+from offline import OfflineTest, SyntheticChain, chainReward
+from smartcash.cache import QueryCache
+from smartcash.rewardlist import SNRewardList
+from smartcash.rpc import RPCConfig
+
+START = 545000
+
+class QueryCacheTest(unittest.TestCase):
+
+    def testDependencies(self):
+
+        cache = QueryCache(16)
+
+        cache.get('payee', lambda: 1, payees=['Sa'])
+        cache.get('heights', lambda: 2, heights=(100, 200))
+        cache.get('times', lambda: 3, times=(1000, None))
+        cache.get('tip', lambda: 4, tip=True)
+
+        # Another payee below all ranges only hits the tip
+        cache.invalidate(50, 500, json.dumps(['Sb']))
+        self.assertEqual(set(cache.entries), {'payee', 'heights', 'times'})
+
+        cache.invalidate(150, 500, json.dumps(['Sb', 'Sa']))
+        self.assertEqual(set(cache.entries), {'times'})
+
+        cache.invalidate(None, 5000, None)
+        self.assertEqual(len(cache.entries), 0)
+
+    def testAdvanceDropsTipOnly(self):
+
+        cache = QueryCache(16)
+
+        cache.get('tip', lambda: 1, tip=True)
+        cache.get('block', lambda: 2, heights=(100, 101))
+        cache.advance()
+
+        self.assertEqual(set(cache.entries), {'block'})
+
+    def testLoadAcrossInvalidation(self):
+
+        cache = QueryCache(16)
+
+        def load():
+            cache.invalidate(100, 0, None)
+            return 'stale'
+
+        self.assertEqual(cache.get('key', load, payees=['Sa']), 'stale')
+        self.assertFalse('key' in cache.entries)
+
+    def testEviction(self):
+
+        cache = QueryCache(2)
+
+        cache.get('a', lambda: 1)
+        cache.get('b', lambda: 2)
+        cache.get('a', lambda: 1)
+        cache.get('c', lambda: 3)
+
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+class RewardListCacheTest(OfflineTest):
+
+    def setUp(self):
+
+        OfflineTest.setUp(self)
+
+        self.chain = SyntheticChain(START, START + 100)
+        self.rewardList = SNRewardList(self.path('rewards.db'), RPCConfig('test', 'test', port=1))
+
+        for height in range(START, START + 60):
+            self.rewardList.addReward(chainReward(self.chain, height))
+
+    def payee(self, height):
+        return json.loads(self.chain.reward(height)[2])[0]
+
+    def testWritesInvalidateDependentResults(self):
+
+        rewardList = self.rewardList
+        payee = self.payee(START + 10)
+        other = self.payee(START + 12)
+
+        self.assertEqual([x.block for x in rewardList.getRewardsForPayee(payee)], [START + 10])
+        count = rewardList.getRewardCount()
+        rewardList.getReward(START + 20)
+
+        hits = rewardList.cache.stats()['hits']
+
+        # A row of another payee at a new height
+        reward = chainReward(self.chain, START + 60)
+        self.assertTrue(rewardList.addReward(reward))
+
+        self.assertEqual([x.block for x in rewardList.getRewardsForPayee(payee)], [START + 10])
+        self.assertEqual(rewardList.getReward(START + 20).block, START + 20)
+        self.assertEqual(rewardList.cache.stats()['hits'], hits + 2)
+        self.assertEqual(rewardList.getRewardCount(), count + (1 if reward.meta == 0 else 0))
+
+        # The payee got paid again
+        reward = chainReward(self.chain, START + 62)
+        reward.payee = json.dumps([payee, other])
+
+        self.assertTrue(rewardList.addReward(reward))
+        self.assertEqual([x.block for x in rewardList.getRewardsForPayee(payee)], [START + 10, START + 62])
+
+        # Rolled back
+        rewardList.removeRewards(START + 61)
+
+        self.assertEqual([x.block for x in rewardList.getRewardsForPayee(payee)], [START + 10])
+        self.assertEqual(rewardList.getLastReward().block, START + 60)
+        self.assertEqual(rewardList.getReward(START + 62), None)
+
+    # Regression: each hit read PRAGMA data_version under the database
+    # lock and waited for the writer.
+    def testHitsDontTakeTheLock(self):
+
+        rewardList = self.rewardList
+        rewardList.externalCheckInterval = 0
+        results = []
+
+        rewardList.getReward(START + 5)
+        hits = rewardList.cache.stats()['hits']
+
+        def read():
+            results.append(rewardList.getReward(START + 5).block)
+
+        with rewardList.db.connection:
+
+            reader = threading.Thread(target=read)
+            reader.daemon = True
+            reader.start()
+            reader.join(5)
+
+            self.assertFalse(reader.is_alive())
+
+        self.assertEqual(results, [START + 5])
+        self.assertEqual(rewardList.cache.stats()['hits'], hits + 1)
+
+    def testExternalWritesAfterInterval(self):
+
+        rewardList = self.rewardList
+        rewardList.externalCheckInterval = 0.2
+
+        self.assertEqual(rewardList.getReward(START + 70), None)
+
+        writer = SNRewardList(self.path('rewards.db'), RPCConfig('test', 'test', port=1))
+        writer.addReward(chainReward(self.chain, START + 70))
+
+        time.sleep(0.3)
+
+        self.assertEqual(rewardList.getReward(START + 70).block, START + 70)
+
+    def testDisabled(self):
+
+        rewardList = SNRewardList(self.path('rewards.db'), RPCConfig('test', 'test', port=1), cacheSize=0)
+
+        self.assertEqual(rewardList.getReward(START).block, START)
+        self.assertEqual(rewardList.getReward(START).block, START)
+        self.assertEqual(rewardList.cache.stats()['size'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#
+# Part of `python-smartcash`
+#
+# Tests of the sync checkpoint.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import sqlite3 as sql
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from smartcash import checkpoint
+from smartcash.rewardlist import SNRewardList, SNReward
+from smartcash.rpc import RPCConfig
+
+START = 545000
+
+def blockHash(height):
+    return '{:064x}'.format(height)
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.connection = sql.connect(':memory:')
+        self.connection.execute("CREATE TABLE rewards (block INTEGER PRIMARY KEY, hash TEXT, verified INTEGER)")
+        self.connection.executescript(checkpoint.schema)
+        self.cursor = self.connection.cursor()
+
+    def tearDown(self):
+        self.connection.close()
+
+    def add(self, height, verified = 1):
+
+        self.cursor.execute("INSERT INTO rewards VALUES(?,?,?)", (height, blockHash(height), verified))
+
+        if verified:
+            checkpoint.update(self.cursor, height, blockHash(height))
+
+    def testAdvance(self):
+
+        self.assertEqual(checkpoint.get(self.cursor), None)
+
+        for height in range(START, START + 10):
+            self.add(height, verified=int(height < START + 8))
+
+        self.assertEqual(checkpoint.get(self.cursor), (START + 7, blockHash(START + 7)))
+
+        # Verified rows below the checkpoint don't move it back
+        checkpoint.update(self.cursor, START + 2, blockHash(START + 2))
+
+        self.assertEqual(checkpoint.get(self.cursor), (START + 7, blockHash(START + 7)))
+
+    def testRollback(self):
+
+        for height in range(START, START + 10):
+            self.add(height, verified=int(height != START + 5))
+
+        # Above the checkpoint nothing changes
+        checkpoint.rollback(self.cursor, START + 10)
+        self.assertEqual(checkpoint.get(self.cursor)[0], START + 9)
+
+        self.cursor.execute("DELETE FROM rewards WHERE block>=?", (START + 6,))
+        checkpoint.rollback(self.cursor, START + 6)
+
+        # Back to the highest verified row left
+        self.assertEqual(checkpoint.get(self.cursor), (START + 4, blockHash(START + 4)))
+
+        self.cursor.execute("DELETE FROM rewards")
+        checkpoint.rollback(self.cursor, START)
+
+        self.assertEqual(checkpoint.get(self.cursor), None)
+
+    def testRebuild(self):
+
+        for height in range(START, START + 10):
+            self.cursor.execute("INSERT INTO rewards VALUES(?,?,?)", (height, blockHash(height), int(height < START + 3)))
+
+        checkpoint.rebuild(self.cursor)
+
+        self.assertEqual(checkpoint.get(self.cursor), (START + 2, blockHash(START + 2)))
+
+class RewardListCheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp(prefix='smartcash-test-')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def rewardList(self):
+        return SNRewardList(os.path.join(self.directory, 'rewards.db'), RPCConfig('test', 'test', port=1))
+
+    def reward(self, height, verified = 1):
+        return SNReward(block=height, txtime=1500000000 + height, payee='NoRewardBlock', meta=-3,
+                        verified=verified, hash=blockHash(height), prevhash=blockHash(height - 1))
+
+    def testAdvanceAndRollback(self):
+
+        rewardList = self.rewardList()
+
+        for height in range(START, START + 10):
+            rewardList.addReward(self.reward(height, verified=int(height < START + 6)))
+
+        self.assertEqual(rewardList.getCheckpoint(), (START + 5, blockHash(START + 5)))
+
+        rewardList.verifyReward(self.reward(START + 6))
+        rewardList.promoteRewards([self.reward(START + 7, verified=0)])
+
+        self.assertEqual(rewardList.getCheckpoint(), (START + 7, blockHash(START + 7)))
+
+        # Persisted
+        self.assertEqual(self.rewardList().getCheckpoint(), (START + 7, blockHash(START + 7)))
+
+        rewardList.removeRewards(START + 6)
+
+        self.assertEqual(rewardList.getCheckpoint(), (START + 5, blockHash(START + 5)))
+
+        rewardList.removeRewards(START)
+
+        self.assertEqual(rewardList.getCheckpoint(), None)
+
+if __name__ == '__main__':
+    unittest.main()
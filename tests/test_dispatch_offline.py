@@ -0,0 +1,177 @@
+#
+# Part of `python-smartcash`
+#
+# Tests of the asynchronous event delivery.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import json
+import time
+import threading
+import unittest
+from offline import OfflineTest
+from smartcash.dispatch import EventDispatcher, SNRewardEvent, COALESCE
+from smartcash.rewardlist import SNReward, SNRewardList
+from smartcash.rpc import RPCConfig
+
+# 10 payee blocks, the common payee gets paid in all of them
+START = 600000
+COMMON = 'Scommon'
+
+def multiPayeeReward(height):
+    payees = [COMMON] + ['S{}x{}'.format(height, i) for i in range(9)]
+    return SNReward(block=height, txtime=height, payee=json.dumps(payees), amount=1000, verified=1)
+
+class DispatchTest(OfflineTest):
+
+    def testSplit(self):
+
+        event = SNRewardEvent(SNRewardEvent.REWARD, reward=multiPayeeReward(START), distance=3)
+        events = event.split()
+
+        self.assertEqual([x.key() for x in events], json.loads(event.reward.payee))
+        self.assertTrue(all(x.reward.block == START and x.reward.amount == 1000 and x.distance == 3 for x in events))
+        self.assertEqual([json.loads(x.reward.payee) for x in events], [[x.key()] for x in events])
+
+        single = SNRewardEvent(SNRewardEvent.REWARD, reward=SNReward(block=START, payee=json.dumps(['Sa'])))
+
+        self.assertEqual(single.split(), [single])
+        self.assertEqual(single.key(), 'Sa')
+        self.assertEqual(event.key(), ','.join(sorted(json.loads(event.reward.payee))))
+        self.assertEqual(SNRewardEvent(SNRewardEvent.ERROR, error='x').key(), SNRewardEvent.ERROR)
+
+    # The callbacks get the stored rows, once per block.
+    def testOneEventPerBlock(self):
+
+        delivered = []
+
+        dispatcher = EventDispatcher(rewardCB=lambda reward, distance: delivered.append(reward), workers=4)
+        dispatcher.start()
+
+        rewards = [multiPayeeReward(x) for x in range(START, START + 20)]
+
+        for reward in rewards:
+            dispatcher.reward(reward, 0)
+
+        dispatcher.stop()
+
+        self.assertEqual(sorted(delivered, key=lambda x: x.block), rewards)
+        self.assertEqual(dispatcher.stats()['delivered'], 20)
+
+    # With fanOut the rewards of one payee in multi payee blocks stay in
+    # order across the workers.
+    def testFanOutOrder(self):
+
+        delivered = {}
+        lock = threading.Lock()
+
+        def rewardCB(reward, distance):
+
+            # The first block is slow to deliver
+            if reward.block == START:
+                time.sleep(0.05)
+
+            with lock:
+                for payee in json.loads(reward.payee):
+                    delivered.setdefault(payee, []).append(reward.block)
+
+        dispatcher = EventDispatcher(rewardCB=rewardCB, workers=4, fanOut=True)
+        dispatcher.start()
+
+        for height in range(START, START + 20):
+            dispatcher.reward(multiPayeeReward(height), 0)
+
+        dispatcher.stop()
+
+        self.assertEqual(delivered[COMMON], list(range(START, START + 20)))
+        self.assertEqual(len(delivered), 1 + 20 * 9)
+        self.assertEqual(dispatcher.stats()['delivered'], 20 * 10)
+
+    def testCoalesce(self):
+
+        release = threading.Event()
+        delivered = []
+
+        def rewardCB(reward, distance):
+            release.wait(10)
+            delivered.append((reward.block, distance))
+
+        dispatcher = EventDispatcher(rewardCB=rewardCB, workers=1, maxSize=2, policy=COALESCE)
+        dispatcher.start()
+
+        reward = SNReward(block=START, payee=json.dumps(['Sa']))
+
+        for distance in range(5):
+            dispatcher.reward(reward, distance)
+
+        release.set()
+        dispatcher.stop()
+
+        self.assertEqual(delivered[0], (START, 0))
+        self.assertEqual(delivered[-1], (START, 4))
+        self.assertGreater(dispatcher.stats()['coalesced'], 0)
+
+    # Regression: the watchlist callbacks ran on the sync thread even
+    # with a dispatcher.
+    def testWatchlistThroughDispatcher(self):
+
+        release = threading.Event()
+        calls = []
+
+        def callback(reward, payees, distance):
+            release.wait(10)
+            calls.append((reward.block, payees, threading.current_thread()))
+
+        dispatcher = EventDispatcher(workers=2)
+        rewardList = SNRewardList(self.path('rewards.db'), RPCConfig('test', 'test', port=1), dispatcher=dispatcher)
+        dispatcher.start()
+
+        id = rewardList.subscribe([COMMON, 'S{}x3'.format(START + 1)], callback)
+
+        # Doesn't wait for the blocked subscriber
+        for height in range(START, START + 3):
+            rewardList.notifyReward(multiPayeeReward(height))
+
+        self.assertEqual(calls, [])
+
+        release.set()
+        dispatcher.stop()
+
+        self.assertEqual([x[:2] for x in calls], [(START, [COMMON]),
+                                                  (START + 1, [COMMON, 'S{}x3'.format(START + 1)]),
+                                                  (START + 2, [COMMON])])
+        self.assertTrue(all(x[2] != threading.current_thread() for x in calls))
+
+        rewardList.unsubscribe(id)
+
+    def testWatchlistInline(self):
+
+        calls = []
+        rewardList = SNRewardList(self.path('rewards.db'), RPCConfig('test', 'test', port=1))
+
+        rewardList.subscribe([COMMON], lambda reward, payees, distance: calls.append(threading.current_thread()))
+        rewardList.notifyReward(multiPayeeReward(START))
+
+        self.assertEqual(calls, [threading.current_thread()])
+
+if __name__ == '__main__':
+    unittest.main()
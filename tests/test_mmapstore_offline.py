@@ -0,0 +1,182 @@
+#
+# Part of `python-smartcash`
+#
+# Offline tests of the memory mapped reward store.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import unittest
+import subprocess
+from offline import OfflineTest, ForkedChain, chainReward
+from smartcash import repair
+from smartcash.mmapstore import MappedRewardStore, StoreError, DATA_FILE
+from smartcash.rewardlist import SNRewardList, emptyReward
+from smartcash.rpc import RPCConfig
+
+START = 545000
+
+class MappedRewardStoreTest(OfflineTest):
+
+    def setUp(self):
+
+        OfflineTest.setUp(self)
+
+        self.chain = ForkedChain(START, START + 100)
+        self.rewardList = SNRewardList(self.path('rewards.db'), RPCConfig('test', 'test', port=1))
+
+        self.addRewards(START, START + 80)
+
+    def addRewards(self, start, stop):
+
+        for height in range(start, stop):
+            self.rewardList.addReward(chainReward(self.chain, height))
+
+    def store(self):
+
+        store = MappedRewardStore(self.path('store'), growBy=16)
+        self.cleanups.append(store.close)
+
+        return store
+
+    def assertMatches(self, store, stop):
+
+        self.assertEqual((store.start, store.stop), (START, stop))
+
+        for height in range(START, stop):
+            self.assertEqual(store.row(height), self.chain.reward(height))
+
+    def testSync(self):
+
+        store = self.store()
+
+        self.assertEqual(store.sync(self.rewardList.db, chunkSize=30), 80)
+        self.assertMatches(store, START + 80)
+        self.assertEqual(store.getCheckpoint(), self.rewardList.getCheckpoint())
+        self.assertEqual(store.getHeightStats()['count'], self.rewardList.getRewardCount(meta=0))
+        self.assertEqual(store.getReward(START + 80), None)
+
+        self.addRewards(START + 80, START + 90)
+
+        self.assertEqual(store.sync(self.rewardList.db), 10)
+        self.assertMatches(store, START + 90)
+
+    # Regression: the payees were compared with the stored JSON lists,
+    # the rewards of multi payee blocks were never found.
+    def testGetRewards(self):
+
+        store = self.store()
+        store.sync(self.rewardList.db)
+
+        shared = self.chain.payees(START + 10)[3]
+        reward = chainReward(self.chain, START + 80)
+        reward.payee = '["{}", "Sother"]'.format(shared)
+        self.rewardList.addReward(reward)
+
+        store.sync(self.rewardList.db)
+
+        payees = [shared, self.chain.payees(START + 40)[0], 'Sother', 'Smissing']
+        fromTime = self.chain.blockTime(START + 30)
+
+        for current in (store, self.store()):
+            for payee in payees:
+                for start in (None, fromTime):
+                    self.assertEqual([x.block for x in current.getRewards(payee, start)],
+                                     [x.block for x in self.rewardList.getRewardsForPayee(payee, start)])
+
+        self.assertEqual([x.block for x in store.getRewards(shared)], [START + 10, START + 80])
+        self.assertEqual([x.block for x in store.getRewards(shared, fromTime)], [START + 80])
+
+    def testReopen(self):
+
+        store = self.store()
+        store.sync(self.rewardList.db)
+
+        # An append which never got committed to the header
+        store.appendRows([self.chain.reward(START + 80)])
+        store.writeHeader(store.start, 80, len(store.payees))
+        store.close()
+
+        store = self.store()
+
+        self.assertMatches(store, START + 80)
+        self.assertEqual(store.sync(self.rewardList.db), 0)
+
+    def testRejectsGaps(self):
+
+        store = self.store()
+        store.sync(self.rewardList.db)
+
+        with self.assertRaises(StoreError):
+            store.appendRows([self.chain.reward(START + 81)])
+
+        self.assertFalse(store.addReward(chainReward(self.chain, START + 82)))
+        self.assertEqual(store.stop, START + 80)
+
+    def testSyncFollowsReorg(self):
+
+        store = self.store()
+        store.sync(self.rewardList.db)
+
+        self.chain.fork = START + 70
+        self.rewardList.removeRewards(START + 70)
+        self.addRewards(START + 70, START + 85)
+
+        self.assertEqual(store.sync(self.rewardList.db), 15)
+        self.assertMatches(store, START + 85)
+
+    def testSyncFromHeight(self):
+
+        height = START + 10
+        reward = emptyReward(height, -1)
+        reward.hash, reward.prevhash = self.chain.reward(height)[-2:]
+
+        self.rewardList.removeRewards(START)
+        self.rewardList.addReward(chainReward(self.chain, START))
+
+        for block in range(START + 1, START + 80):
+            self.rewardList.addReward(reward if block == height else chainReward(self.chain, block))
+
+        store = self.store()
+        store.sync(self.rewardList.db)
+
+        self.assertEqual(store.getReward(height).meta, -1)
+
+        repair.replaceReward(self.rewardList.db, chainReward(self.chain, height))
+
+        # Below the compared depth
+        store.sync(self.rewardList.db, depth=10)
+        self.assertEqual(store.getReward(height).meta, -1)
+
+        store.sync(self.rewardList.db, depth=10, fromHeight=height)
+        self.assertMatches(store, START + 80)
+
+    def testNumpyIsLoadedLazily(self):
+
+        code = "import sys, smartcash.mmapstore, smartcash.audit; sys.exit('numpy' in sys.modules)"
+        root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+        self.assertEqual(subprocess.call([sys.executable, '-c', code], cwd=root), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+#
+# Part of `python-smartcash`
+#
+# Tests of the smartnode list history.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import copy
+import random
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from smartcash.nodehistory import SmartNodeHistory, parseEntry, diffFields, applyFields
+
+def entry(status, payee, lastseen = 0):
+    return {'status': status, 'payee': payee, 'lastseen': lastseen, 'ip': '1.2.3.4:9678'}
+
+# Lists of random polls where nodes join, leave and change their status
+def randomPolls(count, seed = 1):
+
+    rnd = random.Random(seed)
+    nodes = {'node{}'.format(i): entry('ENABLED', 'S{}'.format(i)) for i in range(20)}
+    polls = []
+
+    for i in range(count):
+
+        nodes = copy.deepcopy(nodes)
+
+        for node in rnd.sample(sorted(nodes), 2):
+            nodes[node]['status'] = rnd.choice(['ENABLED', 'EXPIRED', 'PRE_ENABLED'])
+
+        if rnd.random() < 0.3:
+            del nodes[rnd.choice(sorted(nodes))]
+
+        if rnd.random() < 0.3:
+            nodes['node{}'.format(100 + i)] = entry('PRE_ENABLED', 'S{}'.format(100 + i))
+
+        polls.append((1000 + i * 10, nodes))
+
+    return polls
+
+class NodeHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp(prefix='smartcash-test-')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def history(self, **kwargs):
+        return SmartNodeHistory(os.path.join(self.directory, 'nodes.db'), **kwargs)
+
+    def testFields(self):
+
+        self.assertEqual(parseEntry('ENABLED 70208 Sa 1520000000 3600 0 0 1.2.3.4:9678'),
+                         {'status': 'ENABLED', 'protocol': 70208, 'payee': 'Sa', 'lastseen': 1520000000,
+                          'activeseconds': 3600, 'lastpaidtime': 0, 'lastpaidblock': 0, 'ip': '1.2.3.4:9678'})
+        self.assertEqual(parseEntry('ENABLED', 'status'), {'value': 'ENABLED'})
+
+        old = {'a': 1, 'b': 2, 'c': 3}
+        new = {'a': 1, 'b': 4, 'd': 5}
+
+        self.assertEqual(diffFields(old, new), {'b': 4, 'c': None, 'd': 5})
+        self.assertEqual(applyFields(old, diffFields(old, new)), new)
+
+    def testSnapshots(self):
+
+        polls = randomPolls(60)
+        history = self.history(checkpointInterval=16)
+
+        for height, nodes in polls:
+            history.add(height, nodes, timestamp=height)
+
+        for height, nodes in polls:
+            self.assertEqual(history.getSnapshot(height), (height, nodes))
+            self.assertEqual(history.getSnapshot(height + 5), (height, nodes))
+
+        self.assertEqual(history.getSnapshot(999), (None, None))
+
+        # Reopened it continues from the stored list
+        reopened = self.history(checkpointInterval=16)
+
+        self.assertEqual(reopened.current, polls[-1][1])
+        self.assertEqual(reopened.add(2000, polls[-1][1]), 0)
+
+    def testNodeHistory(self):
+
+        polls = randomPolls(40, seed=2)
+        history = self.history(checkpointInterval=7)
+
+        for height, nodes in polls:
+            history.add(height, nodes, timestamp=height)
+
+        for node in ('node0', 'node5', 'node105'):
+
+            expected = []
+
+            for height, nodes in polls:
+                if not expected or expected[-1][2] != nodes.get(node):
+                    expected.append((height, height, nodes.get(node)))
+
+            # The history starts when the node shows up first
+            while expected and expected[0][2] is None:
+                expected.pop(0)
+
+            self.assertEqual(history.getNodeHistory(node), expected)
+
+            status = [(x[0], x[1], x[2]['status'] if x[2] else None) for x in expected]
+            collapsed = [x for i, x in enumerate(status) if not i or status[i - 1][2] != x[2]]
+
+            self.assertEqual(history.getFieldHistory(node), collapsed)
+
+            # Limited to a range the first entry is the state at its start
+            middle = polls[20][0] + 5
+
+            self.assertEqual(history.getNodeHistory(node, middle, middle + 100),
+                             [x for x in expected if x[0] < middle][-1:] + [x for x in expected if middle <= x[0] <= middle + 100])
+
+    # Changes of only the volatile fields are not stored as deltas.
+    def testVolatileFields(self):
+
+        history = self.history(checkpointInterval=3)
+
+        self.assertEqual(history.add(100, {'a': entry('ENABLED', 'Sa', 1)}, timestamp=100), 1)
+        self.assertEqual(history.add(110, {'a': entry('ENABLED', 'Sa', 2)}, timestamp=110), 0)
+
+        self.assertEqual(history.getSnapshot(110), (110, {'a': entry('ENABLED', 'Sa', 1)}))
+
+        # but are exact at the checkpoints
+        history.add(120, {'a': entry('ENABLED', 'Sa', 3)}, timestamp=120)
+
+        self.assertEqual(history.getSnapshot(120), (120, {'a': entry('ENABLED', 'Sa', 3)}))
+
+        # and with other changes
+        self.assertEqual(history.add(130, {'a': entry('EXPIRED', 'Sa', 4)}, timestamp=130), 1)
+        self.assertEqual(history.getSnapshot(130), (130, {'a': entry('EXPIRED', 'Sa', 4)}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#
+# Part of `python-smartcash`
+#
+# Tests of the payment queue predictor.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import json
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from smartcash.predictor import PaymentQueue, BLOCK_TIME
+from smartcash.rewardlist import SNReward
+
+HEIGHT = 1000000
+
+def entry(payee, lastPaid, status = 'ENABLED', activeSeconds = 86400):
+    return {'status': status, 'payee': payee, 'lastpaidblock': lastPaid, 'activeseconds': activeSeconds}
+
+def reward(block, payees, meta = 0):
+    return SNReward(block=block, payee=json.dumps(payees), meta=meta)
+
+class PaymentQueueTest(unittest.TestCase):
+
+    def assertOrdered(self, queue):
+
+        expected = sorted((key, node) for node, key in queue.keys.items())
+
+        self.assertEqual(queue.queue, expected)
+        self.assertEqual(queue.getNext(len(expected)), [x[1] for x in expected])
+        self.assertEqual(set(queue.keys), set(x for x in queue.nodes if queue.nodes[x]['status'] == 'ENABLED'))
+
+        for position, (_, node) in enumerate(expected):
+            self.assertEqual(queue.position(node), position)
+
+    def testRanking(self):
+
+        queue = PaymentQueue()
+        queue.update({'a': entry('Sa', HEIGHT - 10),
+                      'b': entry('Sb', HEIGHT - 20),
+                      'c': entry('Sc', 0, activeSeconds=15 * BLOCK_TIME),
+                      'd': entry('Sd', HEIGHT - 30, status='EXPIRED')}, HEIGHT)
+
+        # Never paid nodes by the time they are active
+        self.assertEqual(queue.getNext(), ['b', 'c', 'a'])
+        self.assertEqual(queue.position('d'), None)
+        self.assertEqual(queue.estimate('d'), None)
+
+        position, height = queue.estimate('a')
+
+        self.assertEqual(position, 2)
+        self.assertTrue(height > HEIGHT)
+
+    def testRewardsMoveNodesBack(self):
+
+        queue = PaymentQueue()
+        queue.update({'a': entry('Sa', HEIGHT - 10), 'b': entry('Sb', HEIGHT - 20), 'c': entry('Sc', HEIGHT - 30)}, HEIGHT)
+
+        queue.addReward(reward(HEIGHT + 2, ['Sc', 'Sb']))
+        self.assertEqual(queue.getNext(), ['a', 'b', 'c'])
+
+        # Error rows and older rewards don't move anything
+        queue.addReward(reward(HEIGHT + 4, ['Sa'], meta=-2))
+        queue.addReward(reward(HEIGHT - 40, ['Sa']))
+        self.assertEqual(queue.getNext(), ['a', 'b', 'c'])
+
+        # A list without the reward yet doesn't move the node back
+        queue.update({'a': entry('Sa', HEIGHT - 10), 'b': entry('Sb', HEIGHT - 20), 'c': entry('Sc', HEIGHT - 25)}, HEIGHT + 2)
+        self.assertEqual(queue.getNext(), ['a', 'b', 'c'])
+
+    def testPayeeChange(self):
+
+        queue = PaymentQueue()
+        queue.update({'a': entry('Sa', HEIGHT - 10), 'b': entry('Sb', HEIGHT - 20)}, HEIGHT)
+        queue.update({'a': entry('Sx', HEIGHT - 10), 'b': entry('Sb', HEIGHT - 20)}, HEIGHT)
+
+        self.assertEqual(queue.find('Sa'), [])
+        self.assertEqual(queue.find('Sx'), ['a'])
+
+        queue.addReward(reward(HEIGHT + 2, ['Sa']))
+        self.assertEqual(queue.getNext(), ['b', 'a'])
+
+        queue.addReward(reward(HEIGHT + 4, ['Sx']))
+        self.assertEqual(queue.getNext(), ['b', 'a'])
+        self.assertEqual(queue.keys['a'], HEIGHT + 4)
+
+    # The queue stays sorted through random list updates and rewards.
+    def testOrderAfterUpdates(self):
+
+        rnd = random.Random(1)
+        nodes = {'n{}'.format(i): entry('S{}'.format(i % 150), rnd.randint(HEIGHT - 5000, HEIGHT)) for i in range(200)}
+
+        queue = PaymentQueue()
+        queue.update(nodes, HEIGHT)
+        self.assertOrdered(queue)
+
+        height = HEIGHT
+
+        for step in range(100):
+
+            height += 2
+
+            if step % 3:
+                queue.addReward(reward(height, ['S{}'.format(rnd.randrange(150)) for _ in range(10)]))
+            else:
+
+                nodes = dict(nodes)
+
+                for node in rnd.sample(sorted(nodes), 10):
+                    nodes[node] = entry(nodes[node]['payee'], rnd.choice([nodes[node]['lastpaidblock'], height]),
+                                        status=rnd.choice(['ENABLED', 'ENABLED', 'EXPIRED']))
+
+                nodes.pop(rnd.choice(sorted(nodes)))
+                nodes['m{}'.format(step)] = entry('Sm{}'.format(step), 0)
+
+                queue.update(nodes, height)
+
+            self.assertOrdered(queue)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#
+# Part of `python-smartcash`
+#
+# Offline tests of the repair job and of the tools which write the rewards
+# database besides SNRewardList.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import unittest
+from offline import OfflineTest, SyntheticChain, chainReward
+from smartcash import repair, snapshot
+from smartcash.export import columns
+from smartcash.rewardlist import SNRewardList, SNRewardDatabase, emptyReward
+from smartcash.rpc import RPCConfig
+
+START = 545000
+
+def row(reward):
+    return tuple(getattr(reward, x) for x in columns) if reward else None
+
+class RepairTest(OfflineTest):
+
+    def setUp(self):
+
+        OfflineTest.setUp(self)
+
+        self.chain = SyntheticChain(START, START + 60, unresolvedRate=0.05)
+        self.daemon = self.startDaemon(self.chain)
+        self.rewardList = SNRewardList(self.path('rewards.db'), self.rpcConfig(self.daemon))
+
+        # Some blocks could not be fetched while syncing
+        self.broken = [x for x in range(START, START + 50) if self.chain.reward(x)[5] == 0][:5]
+
+        for height in range(START, START + 50):
+
+            if height in self.broken:
+                reward = emptyReward(height, -1)
+                reward.hash, reward.prevhash = self.chain.reward(height)[-2:]
+            else:
+                reward = chainReward(self.chain, height)
+
+            self.rewardList.addReward(reward)
+
+    def testRepair(self):
+
+        unresolvable = [x for x in range(START, START + 50) if self.chain.reward(x)[5] == -2]
+        report = repair.repair(self.rewardList.db, self.rpcConfig(self.daemon), workers=2, batchSize=7)
+
+        self.assertEqual(report['resolved'], self.broken)
+        self.assertEqual(report['unresolved'], unresolvable)
+        self.assertEqual(report['failed'], [])
+
+        for height in range(START, START + 50):
+            self.assertEqual(row(self.rewardList.getReward(height)), self.chain.reward(height))
+
+    # Regression: each replaced row notified the readers, which reloaded
+    # their caches once per row.
+    def testRepairNotifiesOncePerBatch(self):
+
+        notified = []
+        resolved = []
+
+        self.rewardList.db.writeHooks.append(lambda: notified.append(len(resolved)))
+
+        report = repair.repair(self.rewardList.db, self.rpcConfig(self.daemon), workers=1, batchSize=100,
+                               resolvedCB=lambda reward: resolved.append(reward.block))
+
+        # The callbacks see the notified database
+        self.assertEqual(notified, [0])
+        self.assertEqual(resolved, report['resolved'])
+        self.assertEqual(len(resolved), len(self.broken))
+
+    # Regression: the repair wrote the rows directly, the cached results
+    # and block times of the running SNRewardList stayed stale.
+    def testRepairInvalidatesReaders(self):
+
+        height = self.broken[-1]
+        time = self.chain.blockTime(height)
+        count = self.rewardList.getRewardCount(meta=0)
+
+        self.assertEqual(self.rewardList.getReward(height).meta, -1)
+        self.assertGreater(self.rewardList.getHeightAt(time), height)
+
+        # Through the connection of the list
+        self.assertTrue(repair.replaceReward(self.rewardList.db, chainReward(self.chain, height)))
+
+        self.assertEqual(row(self.rewardList.getReward(height)), self.chain.reward(height))
+        self.assertEqual(self.rewardList.getRewardCount(meta=0), count + 1)
+        self.assertEqual(self.rewardList.getHeightAt(time), height)
+
+        # and through an own one
+        self.rewardList.externalCheckInterval = 0
+        self.assertEqual(self.rewardList.getReward(self.broken[0]).meta, -1)
+        self.assertTrue(repair.replaceReward(SNRewardDatabase(self.path('rewards.db')), chainReward(self.chain, self.broken[0])))
+
+        self.assertEqual(row(self.rewardList.getReward(self.broken[0])), self.chain.reward(self.broken[0]))
+        self.assertEqual(self.rewardList.getRewardCount(meta=0), count + 2)
+
+    def testSnapshotImportInvalidatesReaders(self):
+
+        path = self.path('rewards.snapshot')
+        snapshot.exportSnapshot(self.rewardList.db, path)
+
+        rewardList = SNRewardList(self.path('imported.db'), RPCConfig('test', 'test', port=1))
+
+        self.assertEqual(rewardList.getLastReward(), None)
+        self.assertEqual(rewardList.getRewardCount(), 0)
+
+        snapshot.importSnapshot(rewardList.db, path)
+
+        self.assertEqual(rewardList.getLastReward().block, START + 49)
+        self.assertEqual(rewardList.getRewardCount(), 50)
+
+if __name__ == '__main__':
+    unittest.main()
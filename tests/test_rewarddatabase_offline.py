@@ -0,0 +1,133 @@
+#
+# Part of `python-smartcash`
+#
+# Offline tests of the schema upgrades of the rewards database.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import unittest
+import sqlite3 as sql
+from unittest import mock
+from offline import OfflineTest
+from smartcash import rollups
+from smartcash.rewardlist import SNRewardDatabase
+
+# Schema and rows of a database of the first release, amounts in coins
+LEGACY = '''
+CREATE TABLE "rewards" (
+    `block` INTEGER NOT NULL PRIMARY KEY,
+    `txtime` INTEGER,
+    `payee` TEXT,
+    `amount` REAL,
+    `source` INTEGER,
+    `meta` INTEGER,
+    `verified` INTEGER
+);
+'''
+
+ROWS = [(545000, 1517000000, '["Sa"]', 1234.5678, 0, 0, 1),
+        (545001, 0, 'error', None, 0, -1, 1),
+        (545002, 1517000110, '["Sb"]', 0.00000001, 0, 0, 1)]
+
+class UpgradeTest(OfflineTest):
+
+    def setUp(self):
+
+        OfflineTest.setUp(self)
+
+        self.dbPath = self.path('rewards.db')
+
+        connection = sql.connect(self.dbPath)
+        connection.executescript(LEGACY)
+        connection.executemany("INSERT INTO rewards VALUES(?,?,?,?,?,?,?)", ROWS)
+        connection.commit()
+        connection.close()
+
+    def query(self, query):
+
+        connection = sql.connect(self.dbPath)
+
+        try:
+            return connection.execute(query).fetchall()
+        finally:
+            connection.close()
+
+    def tables(self):
+        return set(x[0] for x in self.query("SELECT name FROM sqlite_master WHERE type='table'"))
+
+    def assertUpgraded(self):
+
+        self.assertEqual(self.query("PRAGMA user_version"), [(SNRewardDatabase.version,)])
+        self.assertEqual(self.query("SELECT block, amount, typeof(amount) FROM rewards ORDER BY block"),
+                         [(545000, 123456780000, 'integer'), (545001, 0, 'integer'), (545002, 1, 'integer')])
+        self.assertFalse('rewards_satoshis' in self.tables())
+
+    def testUpgrade(self):
+
+        SNRewardDatabase(self.dbPath)
+
+        self.assertUpgraded()
+
+    # Regression: a table left over by an interrupted upgrade failed the
+    # start forever.
+    def testLeftoverTable(self):
+
+        connection = sql.connect(self.dbPath)
+        connection.execute('CREATE TABLE "rewards_satoshis" (`block` INTEGER)')
+        connection.execute('INSERT INTO rewards_satoshis VALUES(1)')
+        connection.commit()
+        connection.close()
+
+        SNRewardDatabase(self.dbPath)
+
+        self.assertUpgraded()
+
+    # Regression: the copy got committed on its own, a failure afterwards
+    # left the new table behind.
+    def testFailedUpgradeRollsBack(self):
+
+        rebuild = rollups.rebuild
+        calls = []
+
+        def failSecond(cursor):
+
+            calls.append(cursor)
+
+            if len(calls) == 2:
+                raise sql.OperationalError("disk I/O error")
+
+            rebuild(cursor)
+
+        with mock.patch('smartcash.rollups.rebuild', failSecond):
+            with self.assertRaises(sql.OperationalError):
+                SNRewardDatabase(self.dbPath)
+
+        self.assertEqual(self.query("PRAGMA user_version"), [(4,)])
+        self.assertEqual(self.query("SELECT typeof(amount) FROM rewards WHERE block=545000"), [('real',)])
+        self.assertFalse('rewards_satoshis' in self.tables())
+
+        SNRewardDatabase(self.dbPath)
+
+        self.assertUpgraded()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,6 +26,7 @@
 import os, logging, time
 from smartcash.rpc import RPCConfig
 from smartcash.rewardlist import SNRewardList, SNReward
+from smartcash.util import toCoins
 
 if not input:
     input=raw_input
@@ -58,7 +59,7 @@ if __name__ == '__main__':
 
             if rewards:
                 print("Rewards: {}".format(rewards))
-                print("Profit: {}".format(sum(map(lambda x: x.amount,rewards))))
+                print("Profit: {}".format(toCoins(sum(map(lambda x: x.amount,rewards)))))
             else:
                 print("{} did't receive any rewards yet.".format(address))
         else:
@@ -0,0 +1,170 @@
+#
+# Part of `python-smartcash`
+#
+# Offline tests of the SNRewardList sync against the mock daemon.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import time
+import unittest
+from offline import OfflineTest, ForkedChain, waitFor
+from smartcash.dispatch import EventDispatcher
+from smartcash.export import columns
+from smartcash.rewardlist import SNRewardList, SNReward
+
+START = 545000
+
+def row(reward):
+    return tuple(getattr(reward, x) for x in columns) if reward else None
+
+class RewardListTest(OfflineTest):
+
+    def setUp(self):
+
+        OfflineTest.setUp(self)
+
+        self.chain = ForkedChain(START, START + 100)
+        self.daemon = self.startDaemon(self.chain)
+
+    def rewardList(self, **kwargs):
+
+        rewardList = SNRewardList(self.path('rewards.db'), self.rpcConfig(self.daemon), **kwargs)
+        rewardList.addReward(SNReward(block=START - 1, txtime=0, payee='NoRewardBlock', meta=-3, verified=1))
+
+        # Don't wait the seconds between the polls of the node
+        rewardList.sleep = lambda seconds: time.sleep(0.01)
+
+        self.cleanups.append(rewardList.stop)
+
+        return rewardList
+
+    def waitForHeight(self, rewardList, height):
+        self.assertTrue(waitFor(lambda: rewardList.currentHeight != None and rewardList.currentHeight >= height))
+
+    def assertMatches(self, rewardList, stop):
+
+        for height in range(START, stop):
+            self.assertEqual(row(rewardList.getReward(height)), self.chain.reward(height))
+
+        self.assertEqual(rewardList.getCheckpoint(), (stop - 1, self.chain.blockHash(stop - 1)))
+
+class ReorgTest(RewardListTest):
+
+    def testRollbackAndRetraction(self):
+
+        retracted = []
+        dispatcher = EventDispatcher(retractCB=lambda x: retracted.append(x.block), workers=2)
+        rewardList = self.rewardList(dispatcher=dispatcher)
+        rewardList.start()
+
+        # Three confirmations are required
+        synced = self.chain.tip() - 1
+        self.waitForHeight(rewardList, synced)
+
+        paid = rewardList.getRewardCount(meta=0)
+
+        self.chain.fork = self.chain.tip() - 15
+        self.chain.stop += 10
+
+        self.waitForHeight(rewardList, self.chain.tip() - 1)
+        rewardList.stop()
+        dispatcher.stop()
+
+        self.assertEqual(sorted(retracted), list(range(self.chain.fork, synced)))
+        self.assertMatches(rewardList, self.chain.tip() - 1)
+        self.assertEqual(rewardList.getRewardCount(meta=0),
+                         paid + len([x for x in range(synced, self.chain.tip() - 1) if self.chain.reward(x)[5] == 0]))
+
+    def testResumeAfterReorgWhileStopped(self):
+
+        rewardList = self.rewardList()
+        rewardList.start()
+
+        self.waitForHeight(rewardList, self.chain.tip() - 1)
+        rewardList.stop()
+        rewardList.join(10)
+
+        self.chain.fork = self.chain.tip() - 5
+        self.chain.stop += 5
+
+        rewardList = SNRewardList(self.path('rewards.db'), self.rpcConfig(self.daemon))
+        rewardList.sleep = lambda seconds: time.sleep(0.01)
+        self.cleanups.append(rewardList.stop)
+        rewardList.start()
+
+        self.waitForHeight(rewardList, self.chain.tip() - 1)
+        rewardList.stop()
+
+        self.assertMatches(rewardList, self.chain.tip() - 1)
+
+class ProvisionalTest(RewardListTest):
+
+    def unverified(self, rewardList):
+        return [x.block for x in rewardList.getUnverifiedRewards(self.chain.tip())]
+
+    def testPromotion(self):
+
+        provisional = []
+        rewards = []
+        retracted = []
+
+        rewardList = self.rewardList(provisional=True, provisionalCB=lambda x, distance: provisional.append(x.block),
+                                     rewardCB=lambda x, distance: rewards.append(x.block),
+                                     retractCB=lambda x: retracted.append(x.block))
+        rewardList.start()
+
+        # The blocks below three confirmations get recorded right away
+        tip = self.chain.tip()
+
+        self.assertTrue(waitFor(lambda: self.unverified(rewardList) == [tip - 1, tip]))
+        self.assertEqual(rewardList.getCheckpoint(), (tip - 2, self.chain.blockHash(tip - 2)))
+        self.assertEqual(rewardList.getReward(tip).verified, 0)
+        self.assertEqual(provisional, [x for x in (tip - 1, tip) if self.chain.reward(x)[5] == 0])
+
+        # and get promoted once they are confirmed. Regression: the new
+        # confirmed blocks got notified before the promoted ones.
+        self.chain.stop += 3
+        tip = self.chain.tip()
+
+        self.assertTrue(waitFor(lambda: self.unverified(rewardList) == [tip - 1, tip]))
+        self.assertEqual(rewardList.getCheckpoint(), (tip - 2, self.chain.blockHash(tip - 2)))
+        self.assertEqual(rewards, [x for x in range(START, tip - 1) if self.chain.reward(x)[5] == 0])
+        # The first new block arrived confirmed already
+        self.assertEqual(rewardList.tracker.promoted, 2)
+
+        # A provisional block which got replaced
+        self.chain.fork = tip
+        self.chain.stop += 2
+        tip = self.chain.tip()
+
+        self.assertTrue(waitFor(lambda: self.unverified(rewardList) == [tip - 1, tip]))
+        rewardList.stop()
+
+        self.assertEqual(retracted, [self.chain.fork])
+
+        for height in range(START, tip + 1):
+
+            reward = rewardList.getReward(height)
+            self.assertEqual((reward.block, reward.hash), (height, self.chain.blockHash(height)))
+
+if __name__ == '__main__':
+    unittest.main()
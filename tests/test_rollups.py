@@ -0,0 +1,133 @@
+#
+# Part of `python-smartcash`
+#
+# Tests of the rollups, the queries are compared with brute force SQL over the raw rows.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import random
+import calendar
+import unittest
+import sqlite3 as sql
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from smartcash import rollups
+
+START = calendar.timegm((2018, 1, 30, 22, 0, 0))
+END = calendar.timegm((2018, 5, 2, 3, 0, 0))
+
+class RollupsTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.random = random.Random(1)
+
+        self.connection = sql.connect(':memory:')
+        self.connection.row_factory = sql.Row
+        self.connection.execute("CREATE TABLE rewards (block INTEGER PRIMARY KEY, txtime INTEGER, \
+                                 meta INTEGER, source INTEGER, amount INTEGER)")
+        self.connection.executescript(rollups.schema)
+        self.cursor = self.connection.cursor()
+
+        for block in range(3000):
+            self.insert(block, self.random.randint(START, END), self.random.choice([0, 0, 0, -1, -2, -3]),
+                        self.random.choice([0, 1]), self.random.randint(0, 10 ** 12))
+
+    def tearDown(self):
+        self.connection.close()
+
+    def insert(self, block, txtime, meta, source, amount):
+
+        self.cursor.execute("INSERT INTO rewards VALUES(?,?,?,?,?)", (block, txtime, meta, source, amount))
+        rollups.update(self.cursor, txtime, meta, source, amount)
+
+    def delete(self, block):
+
+        row = self.cursor.execute("SELECT * FROM rewards WHERE block=?", (block,)).fetchone()
+        self.cursor.execute("DELETE FROM rewards WHERE block=?", (block,))
+        rollups.update(self.cursor, row['txtime'], row['meta'], row['source'], row['amount'], -1)
+
+    def bruteForce(self, start, end, meta = None, source = None):
+
+        row = self.cursor.execute("SELECT count(*), ifnull(sum(amount),0) FROM rewards WHERE txtime>=? AND txtime<? \
+                                   AND (? IS NULL OR meta=?) AND (? IS NULL OR source=?)",
+                                  (start, end, meta, meta, source, source)).fetchone()
+
+        return {'count': row[0], 'amount': row[1]}
+
+    def assertQueries(self):
+
+        ranges = [(0, 2 ** 31), (START, END + 1), (START + 3600, END - 86400)]
+        ranges += [sorted(self.random.randint(START - 86400, END + 86400) for _ in range(2)) for _ in range(200)]
+
+        for start, end in ranges:
+            for meta, source in ((None, None), (0, None), (-2, None), (None, 1), (0, 0)):
+                self.assertEqual(rollups.query(self.cursor, start, end, meta, source),
+                                 self.bruteForce(start, end, meta, source), (start, end, meta, source))
+
+    def rollupRows(self):
+        return self.cursor.execute("SELECT period, bucket, meta, source, count, amount FROM rollups \
+                                    WHERE count != 0 ORDER BY period, bucket, meta, source").fetchall()
+
+    def testQuery(self):
+        self.assertQueries()
+
+    def testRemove(self):
+
+        for block in self.random.sample(range(3000), 500):
+            self.delete(block)
+
+        self.assertQueries()
+
+    def testRebuild(self):
+
+        for block in self.random.sample(range(3000), 100):
+            self.delete(block)
+
+        updated = [tuple(x) for x in self.rollupRows()]
+
+        rollups.rebuild(self.cursor)
+
+        self.assertEqual([tuple(x) for x in self.rollupRows()], updated)
+        self.assertQueries()
+
+    def testSplitRange(self):
+
+        for start, end in [(START, END), (START + 1, START + 2), (START, START)]:
+
+            parts = rollups.splitRange(start, end)
+
+            # Contiguous, and the buckets are aligned to their period
+            self.assertEqual([x[1] for x in parts[1:]], [x[2] for x in parts[:-1]])
+            self.assertEqual(parts[0][1] if parts else start, start)
+            self.assertEqual(parts[-1][2] if parts else end, end)
+
+            for period, lower, upper in parts:
+                if period:
+                    self.assertEqual(rollups.bucketStart(period, lower), lower)
+                    self.assertEqual(rollups.bucketStart(period, upper), upper)
+
+if __name__ == '__main__':
+    unittest.main()
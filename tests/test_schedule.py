@@ -0,0 +1,82 @@
+#
+# Part of `python-smartcash`
+#
+# Tests of the vectorized schedule against the scalar one.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from smartcash import schedule
+from smartcash.util import PAYOUT_SCHEDULE, getBlockRewardSatoshis
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+@unittest.skipIf(numpy == None, "numpy not installed")
+class ScheduleTest(unittest.TestCase):
+
+    # Heights around the first reward height and each hardfork
+    def ranges(self):
+
+        ranges = [(schedule.FIRST_REWARD_HEIGHT, schedule.FIRST_REWARD_HEIGHT + 50)]
+        ranges += [(x[0] - 25, x[0] + 25) for x in PAYOUT_SCHEDULE if x[0]]
+
+        return ranges
+
+    def testVectorizedMatchesScalar(self):
+
+        for start, stop in self.ranges():
+
+            lower, upper = schedule.toleranceBands(start, stop)
+
+            scalar = [schedule.getExpectedPayout(x) for x in range(start, stop)]
+
+            self.assertEqual(schedule.blockRewards(start, stop).tolist(), [getBlockRewardSatoshis(x) for x in range(start, stop)])
+            self.assertEqual(schedule.rewardHeights(start, stop).tolist(), [schedule.isRewardHeight(x) for x in range(start, stop)])
+            self.assertEqual(schedule.payeesPerBlock(start, stop).tolist(), [x[0] for x in scalar])
+            self.assertEqual(schedule.expectedPayouts(start, stop).tolist(), [x[1] for x in scalar])
+            self.assertEqual(lower.tolist(), [x[2] for x in scalar])
+            self.assertEqual(upper.tolist(), [x[3] for x in scalar])
+
+    def testRewardSchedule(self):
+
+        start = schedule.FIRST_REWARD_HEIGHT
+
+        lookup = schedule.RewardSchedule(start, start + 10)
+
+        # Grows on lookups above the precomputed range
+        for start, stop in self.ranges():
+            for height in range(start, stop):
+                self.assertEqual(lookup.expected(height), schedule.getExpectedPayout(height))
+
+        with self.assertRaises(IndexError):
+            lookup.expected(schedule.FIRST_REWARD_HEIGHT - 1)
+
+if __name__ == '__main__':
+    unittest.main()
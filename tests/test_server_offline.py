@@ -0,0 +1,177 @@
+#
+# Part of `python-smartcash`
+#
+# Offline tests of the local query server and its client.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import sys
+import json
+import threading
+import unittest
+from offline import OfflineTest, SyntheticChain, chainReward
+from smartcash.export import columns
+from smartcash.rewardlist import SNRewardList
+from smartcash.rpc import RPCConfig
+from smartcash.server import SNRewardServer, SNRewardClient, QueryError, JSON, MSGPACK, encode, decode
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+START = 545000
+
+def row(reward):
+    return tuple(getattr(reward, x) for x in columns) if reward else None
+
+class ServerTest(OfflineTest):
+
+    def setUp(self):
+
+        OfflineTest.setUp(self)
+
+        self.chain = SyntheticChain(START, START + 100)
+        self.rewardList = SNRewardList(self.path('rewards.db'), RPCConfig('test', 'test', port=1))
+
+        for height in range(START, START + 80):
+            self.rewardList.addReward(chainReward(self.chain, height))
+
+        self.server = SNRewardServer(self.rewardList, self.path('server.sock'))
+        self.server.start()
+        self.cleanups.append(self.server.stop)
+
+    def client(self, **kwargs):
+
+        client = SNRewardClient(self.path('server.sock'), **kwargs)
+        self.cleanups.append(client.close)
+
+        return client
+
+    def testQueries(self):
+
+        payee = json.loads(self.chain.reward(START + 10)[2])[0]
+
+        for client in (self.client(), self.client(codec=JSON)):
+
+            self.assertEqual(row(client.getReward(START + 10)), self.chain.reward(START + 10))
+            self.assertEqual(row(client.getLastReward()), self.chain.reward(START + 79))
+            self.assertEqual(client.getReward(START + 90), None)
+            self.assertEqual(client.getCheckpoint(), self.rewardList.getCheckpoint())
+            self.assertEqual(client.getRewardCount(), self.rewardList.getRewardCount())
+            self.assertEqual(client.getHeightAt(self.chain.blockTime(START + 50)), self.rewardList.getHeightAt(self.chain.blockTime(START + 50)))
+            self.assertEqual([row(x) for x in client.getRewards(payee)], [row(x) for x in self.rewardList.getRewards(payee)])
+            self.assertEqual(set(client.getRewardsForPayees([payee])), {payee})
+
+    def testInvalidRequests(self):
+
+        client = self.client()
+
+        with self.assertRaises(QueryError):
+            client.call('reset')
+
+        with self.assertRaises(QueryError):
+            client.getRewards('" OR 1=1 --')
+
+        with self.assertRaises(QueryError):
+            client.call('getReward', 'x')
+
+        # The connection stays usable
+        self.assertEqual(client.getReward(START).block, START)
+        self.assertEqual(self.server.getStats()['errors'], 3)
+
+    # Regression: the int keys of the meta counts in getStats made msgpack
+    # >= 1.0 raise in the client.
+    @unittest.skipIf(msgpack == None, "msgpack not installed")
+    def testMsgpackStats(self):
+
+        client = self.client(codec=MSGPACK)
+        metas = client.getStats()['metas']
+
+        self.assertEqual(metas, self.client(codec=JSON).getStats()['metas'])
+        self.assertEqual(metas, {str(k): v for k, v in self.rewardList.getStats()['metas'].items()})
+
+        # Undecodable frames fail as QueryError
+        with self.assertRaises(QueryError):
+            decode(msgpack.packb({1: 2}), MSGPACK)
+
+        self.assertEqual(decode(encode({'a': [1, None, 'b']}, MSGPACK), MSGPACK), {'a': [1, None, 'b']})
+        self.assertEqual(client.getReward(START).block, START)
+
+    # Regression: the response id got compared with the shared counter after
+    # the lock was released, concurrent calls failed with wrong ids.
+    def testConcurrentCalls(self):
+
+        client = self.client()
+        errors = []
+
+        def query(offset):
+
+            try:
+                for i in range(300):
+                    height = START + (offset + i) % 80
+                    if client.getReward(height).block != height:
+                        errors.append(height)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=query, args=(x,)) for x in range(16)]
+        interval = sys.getswitchinterval()
+
+        # Switch threads as often as possible to hit the window after the lock
+        sys.setswitchinterval(1e-6)
+
+        try:
+
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join(30)
+
+        finally:
+            sys.setswitchinterval(interval)
+
+        self.assertEqual(errors, [])
+
+    # Regression: a server without sync kept serving its cached results and
+    # block times after another process wrote the database.
+    def testWritesOfOtherConnections(self):
+
+        client = self.client()
+        self.rewardList.externalCheckInterval = 0
+
+        self.assertEqual(client.getReward(START + 85), None)
+        self.assertEqual(row(client.getLastReward()), self.chain.reward(START + 79))
+        stop = client.getHeightAt(self.chain.blockTime(START + 85))
+
+        writer = SNRewardList(self.path('rewards.db'), RPCConfig('test', 'test', port=1))
+
+        for height in range(START + 80, START + 90):
+            writer.addReward(chainReward(self.chain, height))
+
+        self.assertEqual(row(client.getReward(START + 85)), self.chain.reward(START + 85))
+        self.assertEqual(row(client.getLastReward()), self.chain.reward(START + 89))
+        self.assertGreater(client.getHeightAt(self.chain.blockTime(START + 85)), stop)
+
+if __name__ == '__main__':
+    unittest.main()
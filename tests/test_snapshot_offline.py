@@ -0,0 +1,106 @@
+#
+# Part of `python-smartcash`
+#
+# Offline tests of the snapshot export and import.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import unittest
+from offline import OfflineTest, SyntheticChain, chainReward
+from smartcash import backfill, export, snapshot
+from smartcash.rewardlist import SNRewardDatabase, SNReward
+
+START = 545000
+
+class SnapshotTest(OfflineTest):
+
+    def setUp(self):
+
+        OfflineTest.setUp(self)
+
+        self.chain = SyntheticChain(START, START + 300)
+        self.database = SNRewardDatabase(self.path('rewards.db'))
+
+        backfill.insertRewards(self.database, [chainReward(self.chain, x) for x in range(START, START + 300)])
+        export.rebuildRollups(self.database)
+
+    def rows(self, database, table = 'rewards'):
+
+        with database.connection as db:
+            db.cursor.execute("SELECT * FROM {} ORDER BY 1, 2".format(table))
+            return [tuple(x) for x in db.cursor.fetchall()]
+
+    def testRoundTrip(self):
+
+        header = snapshot.exportSnapshot(self.database, self.path('rewards.snap'), chunkSize=64)
+
+        self.assertEqual((header['height'], header['hash']), (START + 299, self.chain.blockHash(START + 299)))
+        self.assertEqual(header['rows'], 300)
+        self.assertEqual(snapshot.verifySnapshot(self.path('rewards.snap')), dict(header, version=snapshot.VERSION))
+
+        imported = SNRewardDatabase(self.path('imported.db'))
+        snapshot.importSnapshot(imported, self.path('rewards.snap'), chunkSize=64)
+
+        for table in ('rewards', 'rollups', 'checkpoint'):
+            self.assertEqual(self.rows(imported, table), self.rows(self.database, table))
+
+        # Only into empty databases
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.importSnapshot(imported, self.path('rewards.snap'))
+
+    # The snapshot ends at the checkpoint, not at the highest verified row.
+    def testTipIsCheckpoint(self):
+
+        backfill.insertRewards(self.database, [SNReward(block=START + 310, txtime=0, payee='NoRewardBlock',
+                                                        meta=-3, verified=1)])
+
+        self.assertEqual(snapshot.getTip(self.database), (START + 299, self.chain.blockHash(START + 299)))
+        self.assertEqual(snapshot.exportSnapshot(self.database, self.path('rewards.snap'))['rows'], 300)
+
+        with self.database.connection as db:
+            db.cursor.execute("DELETE FROM checkpoint")
+
+        self.assertEqual(snapshot.getTip(self.database), (None, None))
+
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.exportSnapshot(self.database, self.path('empty.snap'))
+
+    def testCorruption(self):
+
+        snapshot.exportSnapshot(self.database, self.path('rewards.snap'))
+
+        with open(self.path('rewards.snap'), 'rb') as f:
+            data = bytearray(f.read())
+
+        data[-10] ^= 0xff
+
+        with open(self.path('rewards.snap'), 'wb') as f:
+            f.write(data)
+
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.verifySnapshot(self.path('rewards.snap'))
+
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.importSnapshot(SNRewardDatabase(self.path('imported.db')), self.path('rewards.snap'))
+
+if __name__ == '__main__':
+    unittest.main()
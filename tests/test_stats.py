@@ -0,0 +1,191 @@
+#
+# Part of `python-smartcash`
+#
+# Tests of the sync statistics and the Prometheus metrics.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from smartcash import stats
+from smartcash.stats import SyncStats, StatsReporter, MetricsServer, STAGE_RPC, STAGE_DB
+
+try:
+    import http.client as http
+except ImportError:
+    import httplib as http
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+# Parse the samples of a Prometheus text output, name -> value
+def samples(text):
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1]) for line in text.splitlines() if not line.startswith('#')}
+
+class SyncStatsTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.clock = Clock()
+
+        patcher = mock.patch.object(stats.time, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.stats = SyncStats(smoothing=0.5)
+
+    def testStages(self):
+
+        with self.stats.timer(STAGE_RPC):
+            self.clock.now += 2
+
+        with self.stats.timer(STAGE_RPC):
+            self.clock.now += 1
+
+        self.stats.add(STAGE_DB, 0.5)
+
+        result = self.stats.get()
+
+        self.assertEqual(result['stages'][STAGE_RPC], {'count': 2, 'seconds': 3.0})
+        self.assertEqual(result['stages'][STAGE_DB], {'count': 1, 'seconds': 0.5})
+        self.assertEqual(result['uptime'], 3.0)
+
+    def testBlocks(self):
+
+        self.assertEqual(self.stats.blocksPerSecond(), 0.0)
+        self.assertEqual(self.stats.eta(100), None)
+
+        for meta, interval in ((0, 0), (0, 2), (-3, 4), (-1, 4)):
+            self.clock.now += interval
+            self.stats.addBlock(meta)
+
+        # 2, then 2 + 0.5 * (4 - 2) = 3 and 3 + 0.5 * (4 - 3) = 3.5
+        self.assertEqual(self.stats.blockInterval, 3.5)
+
+        result = self.stats.get(1100, 1030)
+
+        self.assertEqual(result['blocks'], 4)
+        self.assertEqual(result['metas'], {0: 2, -3: 1, -1: 1})
+        self.assertEqual(result['distance'], 70)
+        self.assertEqual(result['eta'], 70 * 3.5)
+        self.assertEqual(self.stats.eta(-5), 0)
+
+    def testPrometheus(self):
+
+        self.stats.add(STAGE_RPC, 1.5)
+        self.stats.addBlock(0)
+        self.stats.addBlock(-2)
+
+        text = self.stats.prometheus(200, 150, {'hits': 7, 'misses': 3, 'evictions': 1, 'invalidations': 2, 'size': 5})
+        values = samples(text)
+
+        self.assertTrue(text.endswith('\n'))
+        self.assertEqual(values['smartcash_rewards_blocks_total'], 2)
+        self.assertEqual(values['smartcash_rewards_chain_height'], 200)
+        self.assertEqual(values['smartcash_rewards_current_height'], 150)
+        self.assertEqual(values['smartcash_rewards_stage_seconds_total{stage="rpc"}'], 1.5)
+        self.assertEqual(values['smartcash_rewards_stage_calls_total{stage="rpc"}'], 1)
+        self.assertEqual(values['smartcash_rewards_meta_total{meta="0"}'], 1)
+        self.assertEqual(values['smartcash_rewards_meta_total{meta="-2"}'], 1)
+        self.assertEqual(values['smartcash_rewards_cache_hits_total'], 7)
+        self.assertEqual(values['smartcash_rewards_cache_entries'], 5)
+
+        # Each metric has its HELP and TYPE, unknown values are left out
+        for name in set(x.split('{')[0] for x in values):
+            self.assertIn('# TYPE {} '.format(name), text)
+            self.assertIn('# HELP {} '.format(name), text)
+
+        self.assertNotIn('smartcash_rewards_eta_seconds ', samples(self.stats.prometheus()))
+        self.assertNotIn('cache_hits', self.stats.prometheus())
+
+class RewardList(object):
+
+    def __init__(self):
+        self.stats = SyncStats()
+
+    def getStats(self):
+        return self.stats.get(10, 5)
+
+    def getMetrics(self):
+        return self.stats.prometheus(10, 5)
+
+class ReporterTest(unittest.TestCase):
+
+    def testCallback(self):
+
+        reported = []
+        done = threading.Event()
+
+        def callback(result):
+            reported.append(result)
+            done.set()
+
+        reporter = StatsReporter(RewardList(), interval=0.01, callback=callback)
+        reporter.start()
+
+        self.assertTrue(done.wait(10))
+
+        reporter.stop()
+        reporter.join(10)
+
+        self.assertEqual(reported[0]['distance'], 5)
+
+    def testMetricsServer(self):
+
+        with self.assertRaises(ValueError):
+            MetricsServer(RewardList())
+
+        rewardList = RewardList()
+
+        server = MetricsServer(rewardList, port=0)
+        server.start()
+        self.addCleanup(server.stop)
+
+        connection = http.HTTPConnection('127.0.0.1', server.server.server_address[1], timeout=10)
+        self.addCleanup(connection.close)
+
+        connection.request('GET', '/metrics')
+        response = connection.getresponse()
+
+        self.assertEqual(response.status, 200)
+        self.assertTrue(response.getheader('Content-Type').startswith('text/plain'))
+        self.assertEqual(samples(response.read().decode('utf8'))['smartcash_rewards_chain_height'], 10)
+
+        connection.request('GET', '/other')
+        response = connection.getresponse()
+        response.read()
+
+        self.assertEqual(response.status, 404)
+
+if __name__ == '__main__':
+    unittest.main()
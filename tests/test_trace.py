@@ -0,0 +1,191 @@
+#
+# Part of `python-smartcash`
+#
+# Tests of the tracing.
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import json
+import asyncio
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from smartcash import trace
+from smartcash.rpc import SmartCashRPC, RPCConfig
+from smartcash.asyncrpc import AsyncSmartCashRPC
+from smartcash.util import ThreadedSQLite
+
+@trace.traced('test.function')
+def function(value):
+    return value * 2
+
+class TraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(trace.setTracer, None)
+
+    def testDisabled(self):
+
+        self.assertFalse(trace.isEnabled())
+        self.assertIs(trace.span('test'), trace.noSpan)
+        self.assertEqual(function(2), 4)
+
+    def testChromeTracer(self):
+
+        tracer = trace.ChromeTracer()
+        trace.setTracer(tracer)
+
+        self.assertTrue(trace.isEnabled())
+
+        with trace.span('outer', {'key': 'value'}):
+            function(1)
+
+        inner, outer = tracer.events
+
+        self.assertEqual((inner['name'], outer['name']), ('test.function', 'outer'))
+        self.assertEqual(outer['args'], {'key': 'value'})
+        self.assertNotIn('args', inner)
+        self.assertEqual(outer['ph'], 'X')
+        self.assertEqual(outer['pid'], os.getpid())
+
+        # The inner span lies within the outer one
+        self.assertTrue(outer['ts'] <= inner['ts'])
+        self.assertTrue(inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur'])
+
+    def testClockResolution(self):
+
+        tracer = trace.ChromeTracer()
+
+        with mock.patch.object(trace, 'clock', side_effect=[10.0, 10.000003]):
+            tracer.end(tracer.start('short'))
+
+        self.assertEqual(tracer.events[0]['ts'], 10000000)
+        self.assertEqual(tracer.events[0]['dur'], 3)
+
+    def testMaxEvents(self):
+
+        tracer = trace.ChromeTracer(maxEvents=2)
+        trace.setTracer(tracer)
+
+        for _ in range(5):
+            with trace.span('test'):
+                pass
+
+        self.assertEqual((len(tracer.events), tracer.dropped), (2, 3))
+
+        tracer.clear()
+
+        self.assertEqual((len(tracer.events), tracer.dropped), (0, 0))
+
+    def testSave(self):
+
+        directory = tempfile.mkdtemp(prefix='smartcash-test-')
+        self.addCleanup(shutil.rmtree, directory)
+
+        tracer = trace.ChromeTracer(os.path.join(directory, 'trace.json'))
+        trace.setTracer(tracer)
+
+        connection = ThreadedSQLite(':memory:')
+
+        with connection as db:
+            db.cursor.execute("SELECT 1")
+
+        self.assertEqual(tracer.save(), 2)
+
+        with open(os.path.join(directory, 'trace.json')) as f:
+            saved = json.load(f)
+
+        self.assertEqual(sorted(x['name'] for x in saved['traceEvents']), ['db.lock.acquire', 'db.lock.hold'])
+
+class RPCTraceTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.addCleanup(trace.setTracer, None)
+
+        self.rpc = SmartCashRPC(RPCConfig('user', 'password'))
+        self.rpc.post = mock.Mock(return_value={'result': 1, 'error': None, 'id': 0})
+
+    def testDisabled(self):
+
+        with mock.patch.object(trace, 'span') as span:
+            self.rpc.send({'method': 'getblockcount'})
+
+        span.assert_not_called()
+        self.rpc.post.assert_called_once_with({'method': 'getblockcount'})
+
+    def testEnabled(self):
+
+        tracer = trace.ChromeTracer()
+        trace.setTracer(tracer)
+
+        self.rpc.send({'method': 'getblockcount'})
+        self.rpc.send([{'method': 'getblockhash'}])
+
+        self.assertEqual([(x['name'], x['args']) for x in tracer.events],
+                         [('rpc.request', {'method': 'getblockcount'}), ('rpc.request', {'method': 'batch'})])
+
+class AsyncRPCTraceTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.addCleanup(trace.setTracer, None)
+
+        self.rpc = AsyncSmartCashRPC(RPCConfig('user', 'password'))
+        self.payloads = []
+
+        async def post(payload):
+            self.payloads.append(payload)
+            return {'result': 1, 'error': None, 'id': 0}
+
+        self.rpc.post = post
+
+    def testDisabled(self):
+
+        with mock.patch.object(trace, 'span') as span:
+            asyncio.run(self.rpc.send({'method': 'getblockcount'}))
+
+        span.assert_not_called()
+        self.assertEqual(self.payloads, [{'method': 'getblockcount'}])
+
+    def testEnabled(self):
+
+        tracer = trace.ChromeTracer()
+        trace.setTracer(tracer)
+
+        async def run():
+            await self.rpc.raw('getblockcount')
+            await self.rpc.send([{'method': 'getblockhash'}])
+
+        asyncio.run(run())
+
+        self.assertEqual([(x['name'], x['args']) for x in tracer.events],
+                         [('rpc.request', {'method': 'getblockcount'}), ('rpc.request', {'method': 'batch'})])
+
+if __name__ == '__main__':
+    unittest.main()